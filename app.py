@@ -11,7 +11,6 @@ Features:
 """
 
 import streamlit as st
-import json
 import os
 from dotenv import load_dotenv
 
@@ -20,39 +19,30 @@ load_dotenv()
 
 # Import modules
 from core.content_generator import ContentGenerator
-from core.prompt_engine import PromptEngine
 from services.image_processor import ImageProcessor
+from services.image_dedup import dedupe_images
+from services.local_store import load_music_cache, save_music_cache
+from services.task_runner import get_task_runner
+from services.session_history import SessionHistory
+from services.thumbnail_cache import get_thumbnail_cache
+from services.startup_report import module_available
+from services.telemetry import span, start_metrics_server
+from services.profiler import profile_run, profiling_enabled
 from ui.components import (
     render_upload_section, 
     render_result_display,
     render_history_sidebar,
-    render_music_status
+    render_music_status,
+    render_stats_panel,
+    render_profile_panel
 )
 from ui.styles import get_custom_css, get_loading_animation
 
-# Thử import Firebase (có thể fail nếu chưa cài)
-try:
-    from firebase.db_service import FirebaseDB
-    FIREBASE_AVAILABLE = True
-except Exception as e:
-    print(f"Firebase not available: {e}")
-    FIREBASE_AVAILABLE = False
-
-# Thử import Scraper
-try:
-    from scraper.tiktok_music import scrape_trending_music_sync
-    SCRAPER_AVAILABLE = True
-except Exception as e:
-    print(f"Scraper not available: {e}")
-    SCRAPER_AVAILABLE = False
-
-# Thử import Video Generator
-try:
-    from core.video_generator import VideoGenerator
-    VIDEO_AVAILABLE = True
-except Exception as e:
-    print(f"Video Generator not available: {e}")
-    VIDEO_AVAILABLE = False
+# Firebase / Scraper / Video chỉ được import khi dùng lần đầu (Playwright, google-auth rất nặng);
+# ở đây chỉ kiểm tra package đã cài hay chưa
+FIREBASE_AVAILABLE = module_available("requests")
+SCRAPER_AVAILABLE = module_available("playwright")
+VIDEO_AVAILABLE = module_available("google.oauth2") and module_available("requests")
 
 
 # ===== PAGE CONFIG =====
@@ -66,6 +56,9 @@ st.set_page_config(
 # Apply custom CSS
 st.markdown(get_custom_css(), unsafe_allow_html=True)
 
+# Endpoint /metrics cho Prometheus (chỉ khi có METRICS_PORT)
+start_metrics_server()
+
 
 # ===== SESSION STATE =====
 if "result" not in st.session_state:
@@ -75,18 +68,23 @@ if "results" not in st.session_state:
 if "music_list" not in st.session_state:
     st.session_state["music_list"] = None
 if "history" not in st.session_state:
-    st.session_state["history"] = []
+    st.session_state["history"] = SessionHistory()
+if "uploader_key" not in st.session_state:
+    st.session_state["uploader_key"] = 0
 if "video_path" not in st.session_state:
     st.session_state["video_path"] = None
 if "video_generating" not in st.session_state:
     st.session_state["video_generating"] = False
+if "tasks" not in st.session_state:
+    st.session_state["tasks"] = []
 
 
 # ===== FUNCTIONS =====
 @st.cache_resource
 def get_generator():
     """Cache ContentGenerator để không khởi tạo lại mỗi lần"""
-    return ContentGenerator()
+    db = get_firebase()
+    return ContentGenerator(template_source=db.get_prompt_templates if db else None)
 
 
 @st.cache_resource
@@ -94,7 +92,8 @@ def get_firebase():
     """Cache Firebase connection"""
     if FIREBASE_AVAILABLE:
         try:
-            return FirebaseDB()
+            from firebase.db_service import FirebaseDB
+            return FirebaseDB(stream=True)
         except:
             return None
     return None
@@ -105,12 +104,265 @@ def get_video_generator():
     """Cache Video Generator"""
     if VIDEO_AVAILABLE:
         try:
+            from core.video_generator import VideoGenerator
             return VideoGenerator()
         except:
             return None
     return None
 
 
+def run_generation_job(
+    generator, db, images: list, product_type: str, notes: str, prompt_notes: str, music_list: list,
+    profile: bool = False
+) -> dict:
+    """
+    Job chạy nền: xử lý ảnh + gọi Gemini + lưu lịch sử
+    (chạy trên thread của TaskRunner - không gọi st.* ở đây)
+    
+    Args:
+        profile: Profile cả job (cProfile + tracemalloc), tóm tắt nằm trong entry["profile"]
+    
+    Returns:
+        History entry (có output)
+    """
+    # tracemalloc đo cả process -> chỉ profile khi không có job nào khác chạy song song
+    runner = get_task_runner()
+    others = lambda: max(0, runner.active_count - 1)
+    skipped = profile and others() > 0
+    with profile_run("generate_job", enabled=profile and not skipped, concurrent=others) as report:
+        with span("generate.job", product_type=product_type, num_images=len(images)):
+            entry = _run_generation_job(generator, db, images, product_type, notes, prompt_notes, music_list)
+    if report:
+        entry["profile"] = report
+    elif skipped:
+        entry["profile_skipped"] = True
+    return entry
+
+
+def _run_generation_job(generator, db, images: list, product_type: str, notes: str, prompt_notes: str, music_list: list) -> dict:
+    # Ảnh đầu tiên làm ảnh chính
+    with span("image.decode"):
+        is_valid, status = ImageProcessor.validate_image(images[0])
+        if not is_valid:
+            raise ValueError(status)
+        
+        # Ảnh phụ lỗi thì bỏ qua
+        valid_indexes = [0] + [i for i, img in enumerate(images) if i and ImageProcessor.validate_image(img)[0]]
+    
+    # Bỏ ảnh gần trùng (giữ ảnh nét nhất mỗi cụm), phần còn lại encode theo ngân sách token ảnh
+    with span("image.dedup"):
+        unique_images, dedup_report = dedupe_images([images[i] for i in valid_indexes])
+    duplicates = [
+        {"index": valid_indexes[d["index"]], "duplicate_of": valid_indexes[d["duplicate_of"]]}
+        for d in dedup_report["dropped"]
+    ]
+    with span("image.resize") as attrs:
+        encoded, image_report = ImageProcessor.encode_for_budget(unique_images)
+        attrs["image_tokens"] = image_report["total_tokens"]
+    # Index ảnh gốc (theo thứ tự upload) của các ảnh bị bỏ do vượt ngân sách
+    kept = dedup_report["kept"]
+    over_budget = [valid_indexes[kept[i]] for i in image_report["over_budget"]]
+    if image_report["dropped"]:
+        print(f"⚠️ Bỏ {image_report['dropped']} ảnh vượt ngân sách token ảnh")
+    if not encoded:
+        raise ValueError("Không đọc được ảnh sản phẩm")
+    processed_main, additional_images = encoded[0], encoded[1:]
+    
+    # Generate content với TẤT CẢ ảnh
+    result = generator.generate(
+        image_data=processed_main,
+        product_type=product_type,
+        price="",  # Không cần giá cho affiliate
+        notes=prompt_notes,
+        music_list=music_list,
+        additional_images=additional_images if additional_images else None
+    )
+    if not result:
+        raise RuntimeError("Lỗi generate. Vui lòng thử lại!")
+    if isinstance(result.get("_metadata"), dict):
+        result["_metadata"]["image_tokens"] = image_report["total_tokens"]
+        result["_metadata"]["duplicate_images"] = duplicates
+        result["_metadata"]["over_budget_images"] = over_budget
+    
+    history_entry = {
+        "product_type": product_type,
+        "num_images": len(images),
+        "notes": notes,
+        "output": result
+    }
+    
+    # Thumbnail ảnh chính cho sidebar lịch sử (đã có sẵn nếu preview lúc upload)
+    thumbnail_key = get_thumbnail_cache().get_key(images[0])
+    if thumbnail_key:
+        history_entry["thumbnail"] = thumbnail_key
+    
+    # Lưu Firebase (write-behind); chưa cấu hình Firebase -> spool local, replay khi có kết nối
+    if db:
+        db.save_generation_async(history_entry)
+    else:
+        from firebase.history_writer import get_history_writer
+        get_history_writer(None).enqueue(history_entry)
+    
+    return history_entry
+
+
+@st.fragment(run_every=2)
+def render_task_panel():
+    """Poll các job generate của session, chỉ rerun fragment này (trừ khi có job xong)"""
+    task_ids = st.session_state.get("tasks", [])
+    if not task_ids:
+        return
+    
+    runner = get_task_runner()
+    finished = False
+    for task_id in list(task_ids):
+        task = runner.get(task_id)
+        if task is None:
+            task_ids.remove(task_id)
+        elif task.status == "done":
+            entry = task.result
+            st.session_state["result"] = entry["output"]
+            st.session_state["results"] = []
+            st.session_state["history"].append(entry)
+            st.toast(f"✅ Generate thành công: {task.label}")
+            duplicates = entry["output"].get("_metadata", {}).get("duplicate_images")
+            if duplicates:
+                dropped = ", ".join(f"#{d['index'] + 1} (trùng #{d['duplicate_of'] + 1})" for d in duplicates)
+                st.toast(f"🧹 Đã bỏ {len(duplicates)} ảnh gần trùng: {dropped}")
+            if entry.get("profile"):
+                st.session_state["last_profile"] = entry["profile"]
+                st.toast(f"🔬 Đã lưu profile ({entry['profile']['duration']}s) - xem trong sidebar")
+            elif entry.get("profile_skipped"):
+                st.toast("🔬 Bỏ qua profile: đang có job generate khác chạy song song")
+            task_ids.remove(task_id)
+            runner.forget(task_id)
+            finished = True
+        elif task.status == "failed":
+            st.toast(f"❌ {task.label}: {task.error}")
+            task_ids.remove(task_id)
+            runner.forget(task_id)
+        else:
+            icon = "🧠" if task.status == "running" else "⏳"
+            st.info(f"{icon} {task.label} - {task.elapsed:.0f}s")
+    
+    # Có kết quả mới -> rerun cả app để cột kết quả hiển thị
+    if finished:
+        st.rerun()
+
+
+@st.fragment
+def render_history_panel():
+    """Lịch sử trong sidebar; lật trang / mở item chỉ rerun fragment này"""
+    # History: session hiện tại, chưa có thì lấy bản tóm tắt từ Firebase (1 lần / session)
+    session_history = st.session_state["history"]
+    if session_history:
+        history = session_history.recent(5)
+    else:
+        if "remote_history" not in st.session_state:
+            st.session_state["remote_history"] = load_recent_history()
+        history = st.session_state["remote_history"]
+    render_history_sidebar(history, load_output=load_history_output)
+    
+    # Lịch sử cũ đã bị đẩy khỏi RAM -> chỉ đọc từ đĩa khi người dùng mở
+    if session_history.spilled:
+        with st.expander(f"📂 {session_history.spilled} lịch sử cũ hơn"):
+            page = st.number_input("Trang", min_value=0, value=0, step=1, key="older_history_page")
+            for j, item in enumerate(session_history.older(int(page))):
+                output = item.get("output", {})
+                st.write(f"• {item.get('product_type', 'Unknown')[:20]} - 🎵 {(output.get('music') or {}).get('name', 'N/A')}")
+                if st.button("Load", key=f"load_older_{page}_{j}"):
+                    st.session_state["result"] = output
+                    st.rerun()  # kết quả nằm ngoài fragment -> rerun cả app
+
+
+@st.fragment
+def render_result_panel():
+    """Kết quả generate; tương tác trong panel chỉ rerun fragment này"""
+    render_result_display(st.session_state["result"])
+
+
+@st.fragment
+def render_video_panel():
+    """Tạo video Veo + hiển thị video; chọn tham số / tạo video chỉ rerun fragment này"""
+    st.subheader("🎬 Tạo Video Thật")
+    
+    if VIDEO_AVAILABLE:
+        col_v1, col_v2 = st.columns(2)
+        with col_v1:
+            video_duration = st.selectbox("Thời lượng", [5, 8, 10], index=0)
+        with col_v2:
+            video_ratio = st.selectbox("Tỷ lệ", ["9:16 (TikTok)", "16:9 (YouTube)", "1:1 (Instagram)"], index=0)
+        
+        ratio_map = {"9:16 (TikTok)": "9:16", "16:9 (YouTube)": "16:9", "1:1 (Instagram)": "1:1"}
+        
+        if st.button("🎬 TẠO VIDEO VỚI VEO 3.0", type="primary", use_container_width=True):
+            visual_prompt = st.session_state["result"].get("visual_prompt", "")
+            if visual_prompt:
+                with st.spinner("🎬 Đang tạo video với Veo 3.0... (có thể mất 2-5 phút)"):
+                    video_gen = get_video_generator()
+                    success, message, video_path = video_gen.generate_video(
+                        prompt=visual_prompt,
+                        aspect_ratio=ratio_map[video_ratio],
+                        duration_seconds=video_duration
+                    )
+                    
+                    if success and video_path:
+                        st.session_state["video_path"] = video_path
+                        st.success(f"✅ {message}")
+                        st.rerun(scope="fragment")
+                    else:
+                        st.error(f"❌ {message}")
+            else:
+                st.warning("Chưa có Visual Prompt. Hãy Generate Content trước.")
+        
+        # Hiển thị video đã tạo
+        if st.session_state.get("video_path"):
+            video_path = st.session_state["video_path"]
+            if os.path.exists(video_path):
+                st.video(video_path)
+                with open(video_path, "rb") as f:
+                    st.download_button(
+                        "📥 Tải Video",
+                        data=f.read(),
+                        file_name=os.path.basename(video_path),
+                        mime="video/mp4",
+                        use_container_width=True
+                    )
+    else:
+        st.info("💡 Cấu hình VERTEX_API_KEY trong .env để tạo video thật")
+        st.caption("Hiện tại: Copy Visual Prompt → Paste vào Veo3 web")
+
+
+def load_recent_history(limit: int = 5) -> list:
+    """
+    Lịch sử gần đây từ Firebase, cũ -> mới: đọc bản tóm tắt (generation_index) rồi tải
+    output của các item đang hiển thị song song bằng get_many (bấm Load không tốn thêm round-trip)
+    """
+    db = get_firebase()
+    if not db:
+        return []
+    items = list(reversed(db.query_generation_history(limit, summary=True)["items"]))
+    generations = db.get_generations([item["id"] for item in items])
+    st.session_state["remote_outputs"] = {
+        generation_id: generation.get("output")
+        for generation_id, generation in generations.items()
+        if generation
+    }
+    return items
+
+
+def load_history_output(item: dict):
+    """Output đầy đủ của 1 item lịch sử (khi bấm Load) - lấy từ bản đã tải sẵn nếu có"""
+    prefetched = st.session_state.get("remote_outputs", {}).get(item.get("id"))
+    if prefetched:
+        return prefetched
+    db = get_firebase()
+    if not db or not item.get("id"):
+        return None
+    generation = db.get_generation(item["id"])
+    return generation.get("output") if generation else None
+
+
 def load_music_list():
     """Load danh sách nhạc từ cache hoặc Firebase"""
     # Thử load từ Firebase trước
@@ -124,12 +376,7 @@ def load_music_list():
             pass
     
     # Fallback: Load từ file cache local
-    cache_path = os.path.join(os.path.dirname(__file__), "data", "music_cache.json")
-    try:
-        with open(cache_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return []
+    return load_music_cache()
 
 
 def scrape_and_update_music():
@@ -140,6 +387,7 @@ def scrape_and_update_music():
     
     with st.spinner("🎵 Đang scrape nhạc trending từ TikTok..."):
         try:
+            from scraper.tiktok_music import scrape_trending_music_sync
             songs = scrape_trending_music_sync(limit=15)
             
             if songs:
@@ -149,9 +397,7 @@ def scrape_and_update_music():
                     db.update_music_trending(songs)
                 
                 # Lưu vào cache local
-                cache_path = os.path.join(os.path.dirname(__file__), "data", "music_cache.json")
-                with open(cache_path, "w", encoding="utf-8") as f:
-                    json.dump(songs, f, indent=2, ensure_ascii=False)
+                save_music_cache(songs)
                 
                 st.session_state["music_list"] = songs
                 st.success(f"✅ Đã cập nhật {len(songs)} bài hát trending!")
@@ -215,8 +461,13 @@ with st.sidebar:
     
     st.divider()
     
-    # History
-    render_history_sidebar(st.session_state.get("history", []))
+    render_history_panel()
+    
+    with st.expander("📈 Thống kê hiệu năng"):
+        render_stats_panel()
+    
+    with st.expander("🔬 Profiling"):
+        render_profile_panel(st.session_state.get("last_profile"))
 
 
 # ===== MAIN CONTENT =====
@@ -231,7 +482,9 @@ col_left, col_right = st.columns([1, 1.2])
 
 # ===== LEFT COLUMN: INPUT =====
 with col_left:
-    uploaded_files, product_type, style, notes, custom_prompt = render_upload_section()
+    uploaded_files, product_type, style, notes, custom_prompt = render_upload_section(
+        uploader_key=f"uploader_{st.session_state['uploader_key']}"
+    )
     
     st.divider()
     
@@ -248,54 +501,28 @@ with col_left:
         disabled=generate_disabled
     ):
         if uploaded_files:
-            with st.spinner("🧠 AI đang phân tích sản phẩm từ tất cả các ảnh..."):
-                # Lấy ảnh đầu tiên làm ảnh chính
-                main_image = uploaded_files[0].getvalue()
-                processed_main, status = ImageProcessor.process_for_gemini(main_image)
-                
-                # Xử lý các ảnh phụ (nếu có)
-                additional_images = []
-                if len(uploaded_files) > 1:
-                    for f in uploaded_files[1:]:
-                        img_bytes = f.getvalue()
-                        processed, _ = ImageProcessor.process_for_gemini(img_bytes)
-                        if processed:
-                            additional_images.append(processed)
-                
-                if processed_main:
-                    st.info(f"📷 Đang phân tích {len(uploaded_files)} ảnh của sản phẩm...")
-                    
-                    # Get music list
-                    music_list = st.session_state.get("music_list") or load_music_list()
-                    
-                    # Generate content với TẤT CẢ ảnh
-                    generator = get_generator()
-                    result = generator.generate(
-                        image_data=processed_main,
-                        product_type=product_type,
-                        price="",  # Không cần giá cho affiliate
-                        notes=f"{notes}\n\nPhong cách: {style}\n\nYêu cầu thêm: {custom_prompt}" if custom_prompt else f"{notes}\n\nPhong cách: {style}",
-                        music_list=music_list,
-                        additional_images=additional_images if additional_images else None
-                    )
-                    
-                    if result:
-                        st.session_state["result"] = result
-                        st.session_state["results"] = []
-                        
-                        # Add to local history
-                        st.session_state["history"].append({
-                            "product_type": product_type,
-                            "num_images": len(uploaded_files),
-                            "output": result
-                        })
-                        
-                        st.success(f"✅ Generate thành công! (Đã phân tích {len(uploaded_files)} ảnh)")
-                        st.rerun()
-                    else:
-                        st.error("❌ Lỗi generate. Vui lòng thử lại!")
-                else:
-                    st.error(f"❌ {status}")
+            # Đọc bytes ở script thread, phần nặng (xử lý ảnh + Gemini) chạy nền
+            music_list = st.session_state.get("music_list") or load_music_list()
+            task_id = get_task_runner().submit(
+                run_generation_job,
+                get_generator(),
+                get_firebase(),
+                [f.getvalue() for f in uploaded_files],
+                product_type,
+                notes,
+                f"{notes}\n\nPhong cách: {style}\n\nYêu cầu thêm: {custom_prompt}" if custom_prompt else f"{notes}\n\nPhong cách: {style}",
+                music_list,
+                profile=st.session_state.pop("profile_next", False) or profiling_enabled(),
+                label=f"{product_type} ({len(uploaded_files)} ảnh)"
+            )
+            st.session_state["tasks"].append(task_id)
+            st.toast(f"🚀 Đã đưa {product_type} vào hàng đợi generate")
+            
+            # Job đã giữ bytes ảnh -> reset uploader để session không giữ file gốc
+            st.session_state["uploader_key"] += 1
+            st.rerun()
+    
+    render_task_panel()
 
 
 # ===== RIGHT COLUMN: RESULTS =====
@@ -304,59 +531,11 @@ with col_right:
     
     # Hiển thị kết quả
     if st.session_state.get("result"):
-        result = st.session_state["result"]
-        render_result_display(result)
+        render_result_panel()
         
         st.divider()
         
-        # ===== VIDEO GENERATION SECTION =====
-        st.subheader("🎬 Tạo Video Thật")
-        
-        if VIDEO_AVAILABLE:
-            col_v1, col_v2 = st.columns(2)
-            with col_v1:
-                video_duration = st.selectbox("Thời lượng", [5, 8, 10], index=0)
-            with col_v2:
-                video_ratio = st.selectbox("Tỷ lệ", ["9:16 (TikTok)", "16:9 (YouTube)", "1:1 (Instagram)"], index=0)
-            
-            ratio_map = {"9:16 (TikTok)": "9:16", "16:9 (YouTube)": "16:9", "1:1 (Instagram)": "1:1"}
-            
-            if st.button("🎬 TẠO VIDEO VỚI VEO 3.0", type="primary", use_container_width=True):
-                visual_prompt = result.get("visual_prompt", "")
-                if visual_prompt:
-                    with st.spinner("🎬 Đang tạo video với Veo 3.0... (có thể mất 2-5 phút)"):
-                        video_gen = get_video_generator()
-                        success, message, video_path = video_gen.generate_video(
-                            prompt=visual_prompt,
-                            aspect_ratio=ratio_map[video_ratio],
-                            duration_seconds=video_duration
-                        )
-                        
-                        if success and video_path:
-                            st.session_state["video_path"] = video_path
-                            st.success(f"✅ {message}")
-                            st.rerun()
-                        else:
-                            st.error(f"❌ {message}")
-                else:
-                    st.warning("Chưa có Visual Prompt. Hãy Generate Content trước.")
-            
-            # Hiển thị video đã tạo
-            if st.session_state.get("video_path"):
-                video_path = st.session_state["video_path"]
-                if os.path.exists(video_path):
-                    st.video(video_path)
-                    with open(video_path, "rb") as f:
-                        st.download_button(
-                            "📥 Tải Video",
-                            data=f.read(),
-                            file_name=os.path.basename(video_path),
-                            mime="video/mp4",
-                            use_container_width=True
-                        )
-        else:
-            st.info("💡 Cấu hình VERTEX_API_KEY trong .env để tạo video thật")
-            st.caption("Hiện tại: Copy Visual Prompt → Paste vào Veo3 web")
+        render_video_panel()
     else:
         st.info("👆 Upload ảnh và nhấn Generate để bắt đầu")
 
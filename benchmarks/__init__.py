@@ -0,0 +1,2 @@
+# Benchmarks module
+# Benchmark offline cho pipeline (fake server thay Gemini / Vertex / Firebase) - chạy: python -m benchmarks
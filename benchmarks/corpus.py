@@ -0,0 +1,86 @@
+"""
+Image Corpus
+Bộ ảnh benchmark sinh từ seed cố định (không cần lưu ảnh trong repo)
+
+- Nền gradient + nhiễu + các "viên đá" hình elip -> có cạnh / chi tiết như ảnh trang sức thật
+- Đủ kích cỡ / định dạng upload thường gặp: ảnh điện thoại 12MP, ảnh vuông, PNG, WebP, ảnh nhỏ
+- Thêm 1 bản mờ của ảnh chính để benchmark dedup có cụm gần trùng
+"""
+import hashlib
+import io
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+DEFAULT_SEED = 20241019
+
+# (tên, rộng, cao, định dạng)
+CORPUS_SPECS = [
+    ("phone_12mp", 3024, 4032, "JPEG"),
+    ("square_1080", 1080, 1080, "JPEG"),
+    ("studio_png", 1600, 1200, "PNG"),
+    ("catalog_webp", 2048, 2048, "WEBP"),
+    ("thumb_small", 320, 320, "JPEG"),
+]
+
+
+def make_image(rng: np.random.Generator, width: int, height: int) -> Image.Image:
+    """1 ảnh sản phẩm giả lập (RGB)"""
+    # Gradient 2 màu + nhiễu nhẹ
+    top, bottom = rng.integers(0, 256, size=(2, 3))
+    t = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+    pixels = top * (1 - t) + bottom * t
+    pixels = np.broadcast_to(pixels, (height, width, 3)) + rng.normal(0, 6, size=(height, width, 3))
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+    # Các viên đá lấp lánh
+    draw = ImageDraw.Draw(image)
+    scale = min(width, height)
+    for _ in range(24):
+        cx, cy = rng.integers(0, width), rng.integers(0, height)
+        r = int(rng.integers(scale // 40, scale // 8))
+        fill = tuple(int(v) for v in rng.integers(0, 256, size=3))
+        draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=fill, outline=(255, 255, 255), width=max(1, r // 10))
+    return image
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    options = {"JPEG": {"quality": 90}, "WEBP": {"quality": 90}, "PNG": {"optimize": False}}[fmt]
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def build_corpus(seed: int = DEFAULT_SEED, quick: bool = False) -> List[Tuple[str, bytes]]:
+    """
+    Sinh bộ ảnh benchmark
+
+    Args:
+        quick: Bỏ ảnh 12MP (chạy nhanh khi thử)
+
+    Returns:
+        List (tên, bytes) theo thứ tự CORPUS_SPECS, cuối cùng là bản mờ của ảnh đầu tiên
+    """
+    rng = np.random.default_rng(seed)
+    corpus = []
+    first = None
+    for name, width, height, fmt in CORPUS_SPECS:
+        image = make_image(rng, width, height)  # luôn sinh để giữ trạng thái rng khi quick
+        if quick and width * height > 4_000_000:
+            continue
+        corpus.append((name, encode(image, fmt)))
+        if first is None:
+            first = (name, image)
+    name, image = first
+    corpus.append((f"{name}_blur", encode(image.filter(ImageFilter.GaussianBlur(2)), "JPEG")))
+    return corpus
+
+
+def corpus_digest(corpus: List[Tuple[str, bytes]]) -> str:
+    """Hash của cả bộ ảnh (so sánh kết quả chỉ có nghĩa khi corpus giống nhau)"""
+    digest = hashlib.blake2b(digest_size=8)
+    for name, data in corpus:
+        digest.update(name.encode("utf-8"))
+        digest.update(data)
+    return digest.hexdigest()
@@ -0,0 +1,230 @@
+"""
+Fake Servers
+HTTP server local thay cho Gemini / Vertex AI / Firebase REST khi chạy benchmark (không cần mạng)
+
+- Trả lại response đã ghi sẵn trong benchmarks/fixtures/*.json
+- `latency` (giây) cộng vào mỗi request để giả lập round-trip thật
+- Đếm số request theo route (kiểm tra benchmark có thật sự đi qua server)
+"""
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name: str) -> Dict:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive như API thật
+    disable_nagle_algorithm = True  # header + body gửi tách -> tránh chờ delayed ACK ~40ms
+
+    def _dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        fake = self.server.fake
+        time.sleep(fake.latency)
+        try:
+            status, payload, content_type = fake.handle(self.command, urlparse(self.path), body)
+        except Exception as e:
+            status, payload, content_type = 500, json.dumps({"error": {"message": str(e)}}), "application/json"
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServer:
+    """Server chạy trên thread nền, cổng ngẫu nhiên; dùng được như context manager"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Độ trễ thêm vào mỗi request (giây)
+        """
+        self.latency = latency
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, route: str):
+        with self._lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def handle(self, method: str, url, body: bytes) -> Tuple[int, str, str]:
+        raise NotImplementedError
+
+    @staticmethod
+    def json_response(data, status: int = 200) -> Tuple[int, str, str]:
+        return status, json.dumps(data, ensure_ascii=False), "application/json"
+
+
+class FakeGemini(FakeServer):
+    """
+    Gemini REST API (generateContent / streamGenerateContent)
+
+    Dùng với GEMINI_API_ENDPOINT=<url> (GeminiClient chuyển sang transport REST)
+    Request gộp nhiều sản phẩm (generate_batch) -> trả {"products": [...]} đủ ID, mỗi item là kết quả mặc định
+    """
+
+    name = "gemini"
+    PACKED_ID = re.compile(r"=== SẢN PHẨM ID: (.+?) ===")
+
+    def __init__(self, latency: float = 0.0, fixture: Dict = None):
+        super().__init__(latency)
+        self.fixture = fixture or load_fixture("gemini")
+
+    def response_for(self, model: str, body: bytes = b"") -> Dict:
+        response = self.fixture.get("models", {}).get(model, self.fixture["default"])
+        ids = self.PACKED_ID.findall(self._prompt_text(body))
+        if not ids:
+            return response
+        # Ghép kết quả mặc định thành response dạng packed
+        text = response["candidates"][0]["content"]["parts"][0]["text"].strip()
+        item = json.loads("\n".join(text.split("\n")[1:-1]) if text.startswith("```") else text)
+        packed = json.loads(json.dumps(response))
+        packed["candidates"][0]["content"]["parts"][0]["text"] = json.dumps(
+            {"products": [dict(item, id=pid) for pid in ids]}, ensure_ascii=False
+        )
+        return packed
+
+    @staticmethod
+    def _prompt_text(body: bytes) -> str:
+        """Nối các part text trong request generateContent"""
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return ""
+        return "\n".join(
+            part.get("text", "")
+            for content in request.get("contents", [])
+            for part in content.get("parts", [])
+        )
+
+    def handle(self, method, url, body):
+        # /v1beta/models/<model>:generateContent
+        model, _, action = unquote(url.path).rsplit("/", 1)[-1].partition(":")
+        self.count(action)
+        if action == "generateContent":
+            return self.json_response(self.response_for(model, body))
+        if action == "streamGenerateContent":
+            # REST stream của SDK là 1 JSON array các chunk
+            return 200, json.dumps([self.response_for(model, body)], ensure_ascii=False), "application/json"
+        return self.json_response({"error": {"code": 404, "message": f"Unknown action {action}"}}, 404)
+
+
+class FakeVertex(FakeServer):
+    """
+    Vertex AI predictLongRunning + poll operation
+
+    Dùng với VERTEX_API_ENDPOINT=<url>; mỗi operation trả `pending_polls` lần done=false trước khi xong
+    """
+
+    name = "vertex"
+
+    def __init__(self, latency: float = 0.0, pending_polls: int = 2, fixture: Dict = None):
+        super().__init__(latency)
+        self.pending_polls = pending_polls
+        self.fixture = fixture or load_fixture("vertex")
+        self._ids = itertools.count(1)
+        self._polls: Dict[str, int] = {}
+
+    def _render(self, template: Dict, project: str, op_id: str) -> Dict:
+        text = json.dumps(template).replace("{project}", project).replace("{id}", op_id)
+        return json.loads(text)
+
+    def handle(self, method, url, body):
+        path = url.path
+        if method == "POST" and path.endswith(":predictLongRunning"):
+            self.count("predictLongRunning")
+            project = path.split("/projects/", 1)[-1].split("/", 1)[0]
+            op_id = f"bench-{next(self._ids)}"
+            with self._lock:
+                self._polls[op_id] = 0
+            return self.json_response(self._render(self.fixture["operation"], project, op_id))
+
+        if method == "GET" and "/operations/" in path:
+            self.count("poll")
+            project = path.split("/projects/", 1)[-1].split("/", 1)[0]
+            op_id = path.rsplit("/", 1)[-1]
+            with self._lock:
+                polls = self._polls.get(op_id, self.pending_polls)
+                self._polls[op_id] = polls + 1
+            state = "pending" if polls < self.pending_polls else "done"
+            return self.json_response(self._render(self.fixture[state], project, op_id))
+
+        return self.json_response({"error": {"code": 404, "message": f"Unknown path {path}"}}, 404)
+
+
+class FakeFirebase(FakeServer):
+    """
+    Firebase Realtime Database REST
+
+    - GET <path>.json: trả node tương ứng trong fixture (bỏ qua orderBy / limit - replay nguyên trang đã ghi)
+    - PUT / PATCH: echo body như RTDB; POST: trả {"name": push id}
+    """
+
+    name = "firebase"
+
+    def __init__(self, latency: float = 0.0, fixture: Dict = None):
+        super().__init__(latency)
+        self.fixture = fixture or load_fixture("firebase")
+        self._ids = itertools.count(1)
+
+    def handle(self, method, url, body):
+        path = unquote(url.path)
+        if path.endswith(".json"):
+            path = path[:-len(".json")]
+        self.count(method)
+
+        if method == "GET":
+            node = self.fixture
+            for part in filter(None, path.split("/")):
+                node = node.get(part) if isinstance(node, dict) else None
+            return self.json_response(node)
+        if method == "POST":
+            return self.json_response({"name": f"-OBenchPush{next(self._ids):09d}"})
+        if method == "DELETE":
+            return self.json_response(None)
+        return 200, body or b"null", "application/json"
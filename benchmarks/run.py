@@ -0,0 +1,446 @@
+"""
+Benchmark Runner
+Đo hiệu năng pipeline offline: ảnh, prompt, parse JSON, chọn nhạc, generate end-to-end, Veo, Firebase
+
+Chạy:
+    python -m benchmarks                      # chạy hết, so với benchmarks/baseline.json nếu có
+    python -m benchmarks --quick              # ít vòng lặp, bỏ ảnh 12MP
+    python -m benchmarks --only image,e2e     # lọc theo tiền tố tên benchmark
+    python -m benchmarks --latency-ms 200     # độ trễ giả lập của fake server
+    python -m benchmarks --save-baseline      # lưu kết quả làm baseline mới
+
+- benchmarks/baseline.json trong repo được ghi bằng `python -m benchmarks --quick --save-baseline`;
+  so sánh với nó bằng `--quick` (chạy đầy đủ sẽ cảnh báo khác điều kiện). Số liệu phụ thuộc máy:
+  ghi lại baseline trên máy / CI của mình trước khi dùng exit code để chặn regression
+
+- Gemini / Vertex / Firebase được thay bằng fake server local (benchmarks/fake_servers.py)
+- Kết quả JSON ghi vào outputs/benchmarks/; p50 chậm hơn baseline quá --threshold -> exit code 1
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .corpus import DEFAULT_SEED, build_corpus, corpus_digest
+from .fake_servers import FakeFirebase, FakeGemini, FakeVertex, load_fixture
+
+OUTPUT_DIR = "outputs/benchmarks"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.20  # chậm hơn 20% so với baseline -> regression
+NOISE_FLOOR_MS = 0.05  # chênh lệch nhỏ hơn mức này không tính
+
+PRODUCT_TYPES = ["Nhẫn bạc", "Dây chuyền vàng", "Bông tai ngọc trai", "Lắc tay", "Vòng cổ kim cương", "Kẹp tóc"]
+VIBES = ["Sang chảnh", "Trendy", "Lãng mạn", "Ballad", "Sôi động", "Remix", "Nhẹ nhàng", "Cổ điển", "Gen Z", "Chill"]
+
+_BENCHMARKS: List[tuple] = []
+
+
+def benchmark(name: str, iterations: int, quick_iterations: int = None):
+    """Đăng ký 1 benchmark: hàm nhận context, trả về callable được đo (hoặc None = bỏ qua)"""
+    def decorator(setup: Callable):
+        _BENCHMARKS.append((name, setup, iterations, quick_iterations or max(1, iterations // 10)))
+        return setup
+    return decorator
+
+
+def measure(fn: Callable, iterations: int, warmup: int = 1) -> Dict:
+    """Chạy fn `iterations` lần (sau warmup), thống kê theo mili giây"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples = np.array(samples)
+    return {
+        "iterations": iterations,
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "min_ms": round(float(samples.min()), 4),
+        "ops_per_sec": round(1000 / float(samples.mean()), 2) if samples.mean() else None,
+    }
+
+
+# ============ BENCHMARKS ============
+@benchmark("image.process_for_gemini", iterations=10, quick_iterations=3)
+def bench_process_for_gemini(ctx: Dict):
+    from services.image_processor import ImageProcessor
+
+    images = [data for _, data in ctx["corpus"]]
+    ctx["extra"] = {"images_per_call": len(images), "bytes_per_call": sum(len(d) for d in images)}
+    return lambda: [ImageProcessor.process_for_gemini(data) for data in images]
+
+
+@benchmark("image.encode_for_budget", iterations=10, quick_iterations=3)
+def bench_encode_for_budget(ctx: Dict):
+    from services.image_processor import ImageProcessor
+
+    images = [data for _, data in ctx["corpus"]]
+    return lambda: ImageProcessor.encode_for_budget(images)
+
+
+@benchmark("image.dedup", iterations=10, quick_iterations=3)
+def bench_dedup(ctx: Dict):
+    from services.image_dedup import dedupe_images
+
+    images = [data for _, data in ctx["corpus"]]
+    return lambda: dedupe_images(images)
+
+
+@benchmark("prompt.get_full_prompt", iterations=2000)
+def bench_full_prompt(ctx: Dict):
+    from core.prompt_engine import PromptEngine
+
+    engine = PromptEngine()
+    products = [{"type": t, "price": "", "notes": "Phong cách sang trọng"} for t in PRODUCT_TYPES]
+    return lambda: [engine.get_full_prompt(product) for product in products]
+
+
+@benchmark("json.parse", iterations=2000)
+def bench_parse_json(ctx: Dict):
+    from core.gemini_client import GeminiClient
+
+    fenced = load_fixture("gemini")["default"]["candidates"][0]["content"]["parts"][0]["text"]
+    plain = "\n".join(fenced.split("\n")[1:-1])
+    # Các dạng lỗi Gemini hay trả: có text dẫn trước JSON, bị cắt giữa chừng, dấu phẩy thừa
+    malformed = [
+        "Đây là kết quả:\n" + fenced,
+        plain[:len(plain) // 2],
+        plain.rstrip().rstrip("}") + ",\n}",
+    ]
+    ctx["extra"] = {"valid_payloads": 2, "malformed_payloads": len(malformed)}
+
+    def run():
+        GeminiClient.parse_json(fenced)
+        GeminiClient.parse_json(plain)
+        for text in malformed:
+            try:
+                GeminiClient.parse_json(text)
+            except ValueError:
+                pass
+    return run
+
+
+@benchmark("music.build", iterations=200)
+def bench_music_build(ctx: Dict):
+    from core.music_matcher import MusicMatcher
+
+    songs = ctx["songs"]
+    return lambda: MusicMatcher(songs)
+
+
+@benchmark("music.rank", iterations=2000)
+def bench_music_rank(ctx: Dict):
+    from core.music_matcher import MusicMatcher
+    from core.prompt_engine import PRODUCT_TEMPLATES
+
+    matcher = MusicMatcher(ctx["songs"])
+    categories = list(PRODUCT_TEMPLATES)
+    return lambda: [matcher.rank(category, PRODUCT_TYPES[0]) for category in categories]
+
+
+@benchmark("e2e.generate", iterations=20, quick_iterations=3)
+def bench_generate(ctx: Dict):
+    from core.content_generator import ContentGenerator
+
+    generator = ContentGenerator()
+    image = dict(ctx["corpus"])["square_1080"]
+    songs = load_fixture("firebase")["music_trending"]["songs"]
+
+    def run():
+        result = generator.generate(image, PRODUCT_TYPES[0], notes="Phong cách sang trọng", music_list=songs)
+        if not result:
+            raise RuntimeError("generate() trả về None")
+    return run
+
+
+@benchmark("e2e.generate_batch", iterations=10, quick_iterations=2)
+def bench_generate_batch(ctx: Dict):
+    from core.content_generator import ContentGenerator
+
+    generator = ContentGenerator()
+    image = dict(ctx["corpus"])["square_1080"]
+    songs = load_fixture("firebase")["music_trending"]["songs"]
+    products = [
+        {"id": f"sku-{i}", "image_data": image, "product_type": product_type, "notes": "Phong cách sang trọng"}
+        for i, product_type in enumerate(PRODUCT_TYPES * 2)
+    ]
+    ctx["extra"] = {"products_per_call": len(products), "pack_size": generator.PACK_SIZE}
+
+    def run():
+        results = generator.generate_batch(products, music_list=songs)
+        failed = [pid for pid, result in results.items() if not result]
+        if failed or len(results) != len(products):
+            raise RuntimeError(f"generate_batch lỗi: {failed}")
+        packed = sum(1 for result in results.values() if result.get("_metadata", {}).get("packed"))
+        if packed != len(products):
+            raise RuntimeError(f"Chỉ {packed}/{len(products)} sản phẩm đi đường packed")
+    return run
+
+
+@benchmark("veo.generate_video", iterations=10, quick_iterations=2)
+def bench_generate_video(ctx: Dict):
+    try:
+        from core.video_generator import VideoGenerator
+    except ImportError as e:
+        print(f"⚠️ Bỏ qua veo: {e}")
+        return None
+
+    class OfflineVideoGenerator(VideoGenerator):
+        POLL_INTERVAL = 0.01
+        RETRY_INTERVAL = 0.01
+
+        def _get_access_token(self):
+            return "offline-token"
+
+    generator = OfflineVideoGenerator()
+    generator.credentials = generator.credentials or "offline"
+    generator.project_id = generator.project_id or "bench-project"
+    output_path = os.path.join(ctx["tmp_dir"], "video.mp4")
+
+    def run():
+        success, message, _ = generator.generate_video("Quay cận cảnh nhẫn bạc", output_path=output_path)
+        if not success:
+            raise RuntimeError(message)
+    return run
+
+
+@benchmark("firebase.save_generation", iterations=50, quick_iterations=5)
+def bench_save_generation(ctx: Dict):
+    from firebase.db_service import FirebaseDB
+
+    db = FirebaseDB()
+    record = next(iter(load_fixture("firebase")["generation_history"].values()))
+    data = {"product_type": record["product_type"], "category": record["category"], "output": record["output"]}
+
+    def run():
+        if not db.save_generation(data):
+            raise RuntimeError("save_generation thất bại")
+    return run
+
+
+@benchmark("firebase.query_history", iterations=50, quick_iterations=5)
+def bench_query_history(ctx: Dict):
+    from firebase.db_service import FirebaseDB
+
+    db = FirebaseDB()
+
+    def run():
+        if not db.query_generation_history(limit=20)["items"]:
+            raise RuntimeError("query_generation_history không có dữ liệu")
+    return run
+
+
+# ============ CONTEXT ============
+def make_songs(rng: np.random.Generator, count: int = 500) -> List[Dict]:
+    """Catalog nhạc giả lập cho benchmark MusicMatcher"""
+    return [
+        {
+            "id": f"song-{i}",
+            "name": f"Bài hát {i}",
+            "artist": f"Nghệ sĩ {i % 37}",
+            "vibe": list(rng.choice(VIBES, size=int(rng.integers(1, 4)), replace=False)),
+            "suitable_for": list(rng.choice(["luxury", "teen", "classic", "fashion"], size=1)),
+        }
+        for i in range(count)
+    ]
+
+
+def offline_env(gemini: FakeGemini, vertex: FakeVertex, firebase: FakeFirebase) -> Dict[str, Optional[str]]:
+    """Trỏ các client tới fake server; trả về giá trị cũ để khôi phục"""
+    overrides = {
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "offline-benchmark",
+        "GEMINI_API_ENDPOINT": gemini.url,
+        "GEMINI_HEDGE": "0",
+        "GEMINI_ROUTES": "",
+        "VERTEX_API_ENDPOINT": vertex.url + "/v1",
+        "FIREBASE_DATABASE_URL": firebase.url,
+    }
+    previous = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    return previous
+
+
+def restore_env(previous: Dict[str, Optional[str]]):
+    for key, value in previous.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+
+def run_benchmarks(
+    quick: bool = False,
+    only: List[str] = None,
+    latency_ms: float = 20.0,
+    pending_polls: int = 2,
+    seed: int = DEFAULT_SEED
+) -> Dict:
+    """
+    Chạy các benchmark đã đăng ký
+
+    Returns:
+        {"meta": {...}, "results": {name: thống kê measure() hoặc {"error": ...}}}
+    """
+    from services.telemetry import stage_stats
+
+    rng = np.random.default_rng(seed)
+    corpus = build_corpus(seed, quick=quick)
+    latency = latency_ms / 1000
+    results = {}
+
+    with FakeGemini(latency) as gemini, FakeVertex(latency, pending_polls) as vertex, \
+            FakeFirebase(latency) as firebase, tempfile.TemporaryDirectory() as tmp_dir:
+        previous = offline_env(gemini, vertex, firebase)
+        try:
+            ctx = {"corpus": corpus, "songs": make_songs(rng), "tmp_dir": tmp_dir}
+            for name, setup, iterations, quick_iterations in _BENCHMARKS:
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                ctx["extra"] = {}
+                print(f"⏱️ {name} ...", flush=True)
+                try:
+                    fn = setup(ctx)
+                    if fn is None:
+                        continue
+                    results[name] = dict(measure(fn, quick_iterations if quick else iterations), **ctx["extra"])
+                except Exception as e:
+                    print(f"❌ {name}: {e}")
+                    results[name] = {"error": str(e)}
+        finally:
+            restore_env(previous)
+        requests_served = {"gemini": gemini.counts, "vertex": vertex.counts, "firebase": firebase.counts}
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "seed": seed,
+            "corpus": corpus_digest(corpus),
+            "latency_ms": latency_ms,
+            "pending_polls": pending_polls,
+            "requests_served": requests_served,
+        },
+        "results": results,
+        "stages": stage_stats(),
+    }
+
+
+# ============ BASELINE ============
+def compare(report: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    So p50 từng benchmark với baseline
+
+    Returns:
+        List {"name", "baseline_ms", "current_ms", "change", "status"}; status: ok / faster / regression / error
+    """
+    rows = []
+    for name, current in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "p50_ms" not in base:
+            continue
+        if "p50_ms" not in current:
+            rows.append({"name": name, "baseline_ms": base["p50_ms"], "current_ms": None, "change": None, "status": "error"})
+            continue
+        change = current["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        delta = current["p50_ms"] - base["p50_ms"]
+        if change > threshold and delta > NOISE_FLOOR_MS:
+            status = "regression"
+        elif change < -threshold and -delta > NOISE_FLOOR_MS:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append({
+            "name": name,
+            "baseline_ms": base["p50_ms"],
+            "current_ms": current["p50_ms"],
+            "change": round(change, 4),
+            "status": status,
+        })
+    return rows
+
+
+def baseline_warnings(report: Dict, baseline: Dict) -> List[str]:
+    """Cảnh báo khi điều kiện chạy khác baseline (so sánh kém tin cậy)"""
+    warnings = []
+    for key in ("corpus", "latency_ms", "pending_polls", "quick", "python"):
+        if baseline.get("meta", {}).get(key) != report["meta"].get(key):
+            warnings.append(f"{key}: baseline={baseline.get('meta', {}).get(key)} hiện tại={report['meta'].get(key)}")
+    return warnings
+
+
+def print_report(report: Dict, rows: List[Dict]):
+    print(f"\n{'benchmark':<28}{'p50 ms':>12}{'p95 ms':>12}{'ops/s':>12}")
+    for name, result in report["results"].items():
+        if "error" in result:
+            print(f"{name:<28}{'LỖI: ' + result['error']}")
+        else:
+            print(f"{name:<28}{result['p50_ms']:>12.3f}{result['p95_ms']:>12.3f}{result['ops_per_sec'] or 0:>12.1f}")
+
+    if rows:
+        icons = {"ok": "✅", "faster": "🚀", "regression": "❌", "error": "⚠️"}
+        print(f"\n{'so với baseline':<28}{'baseline':>12}{'hiện tại':>12}{'thay đổi':>10}")
+        for row in rows:
+            current = f"{row['current_ms']:.3f}" if row["current_ms"] is not None else "-"
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            print(f"{row['name']:<28}{row['baseline_ms']:>12.3f}{current:>12}{change:>10}  {icons[row['status']]}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline cho pipeline generate")
+    parser.add_argument("--quick", action="store_true", help="Ít vòng lặp, bỏ ảnh 12MP")
+    parser.add_argument("--only", default="", help="Tiền tố tên benchmark, cách nhau bởi dấu phẩy")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Độ trễ mỗi request của fake server")
+    parser.add_argument("--pending-polls", type=int, default=2, help="Số lần poll Veo trước khi operation xong")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định outputs/benchmarks/bench_<time>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="File baseline để so sánh")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả làm baseline mới")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Ngưỡng regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        quick=args.quick,
+        only=[prefix.strip() for prefix in args.only.split(",") if prefix.strip()],
+        latency_ms=args.latency_ms,
+        pending_polls=args.pending_polls,
+        seed=args.seed,
+    )
+
+    rows = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for warning in baseline_warnings(report, baseline):
+            print(f"⚠️ Khác baseline - {warning}")
+        rows = compare(report, baseline, args.threshold)
+        report["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "rows": rows}
+
+    out_path = args.out or os.path.join(OUTPUT_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    targets = [out_path] + ([args.baseline] if args.save_baseline else [])
+    for path in targets:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(report, rows)
+    print(f"\n💾 Kết quả: {out_path}" + (f" (baseline: {args.baseline})" if args.save_baseline else ""))
+
+    failed = any("error" in result for result in report["results"].values())
+    regressed = any(row["status"] in ("regression", "error") for row in rows)
+    return 1 if failed or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,20 @@
 # Core module
-from .gemini_client import GeminiClient
-from .prompt_engine import PromptEngine
-from .content_generator import ContentGenerator
+# Import lazy: chỉ load submodule (và SDK nặng bên trong) khi truy cập lần đầu
+import importlib
 
-__all__ = ['GeminiClient', 'PromptEngine', 'ContentGenerator']
+_EXPORTS = {
+    'GeminiClient': '.gemini_client',
+    'PromptEngine': '.prompt_engine',
+    'ContentGenerator': '.content_generator',
+    'MusicMatcher': '.music_matcher',
+    'TemplateRegistry': '.template_registry',
+    'ModelRouter': '.model_router',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,16 +3,40 @@ Content Generator
 Orchestrator kết hợp Gemini + Prompt Engine + Music để generate content hoàn chỉnh
 """
 import json
+import threading
+import time
+from collections import Counter
 from typing import Dict, List, Optional
 from .gemini_client import GeminiClient
 from .prompt_engine import PromptEngine, get_system_prompt
+from .music_matcher import MusicMatcher
+from .model_router import ModelRouter, local_hashtags
+from .template_registry import TemplateRegistry
+from services.profiler import profiled
+from services.telemetry import span
 
 
 class ContentGenerator:
-    def __init__(self):
+    # Số bài nhạc đưa vào prompt (thay vì cả catalog)
+    MUSIC_SHORTLIST_SIZE = 5
+    # Số sản phẩm gộp vào 1 request khi generate theo batch
+    PACK_SIZE = 4
+    # Field bắt buộc (text) của 1 kết quả
+    REQUIRED_FIELDS = ("visual_prompt", "title", "hook", "caption")
+    
+    def __init__(self, template_source=None):
+        """
+        Args:
+            template_source: Hàm trả về prompt templates từ Firebase (None = chỉ built-in)
+        """
         self.gemini = GeminiClient()
-        self.prompt_engine = PromptEngine()
+        self.prompt_engine = PromptEngine(TemplateRegistry(template_source))
+        self.router = ModelRouter(main_model=self.gemini.model_name)
+        self._matcher = None
+        self._matcher_key = None
+        self._matcher_lock = threading.Lock()
     
+    @profiled("generate")
     def generate(
         self,
         image_data: bytes,
@@ -44,31 +68,244 @@ class ContentGenerator:
         }
         
         # Lấy system prompt tùy chỉnh theo loại sản phẩm
-        system_prompt = self.prompt_engine.get_full_prompt(product_info)
+        with span("prompt.build", product_type=product_type):
+            system_prompt = self.prompt_engine.get_full_prompt(product_info)
         
         # Music list mặc định nếu không có
         if not music_list:
             music_list = self._get_default_music()
         
-        # Gọi Gemini để generate (hỗ trợ nhiều ảnh = 1 sản phẩm)
+        # Category: luôn local (keyword classifier)
+        started = time.perf_counter()
+        category = self.prompt_engine.get_category(product_type, price)
+        routing = {"category": self.router.record("category", "local", time.perf_counter() - started)}
+        
+        # Chấm điểm nhạc local -> chỉ gửi shortlist cho Gemini
+        matcher = self._get_matcher(music_list)
+        shortlist = matcher.shortlist(category, product_type, self.MUSIC_SHORTLIST_SIZE)
+        
+        # Gọi model chính chỉ cho các field creative (+ field được route "main")
+        started = time.perf_counter()
         result = self.gemini.generate_viral_content(
             image_data=image_data,
             product_info=product_info,
-            music_list=music_list,
+            music_list=shortlist or music_list,
             system_prompt=system_prompt,
-            additional_images=additional_images
+            additional_images=additional_images,
+            omit_fields=self.router.omit_fields(),
+            model_name=self.router.main_model
+        )
+        routing["creative"] = self.router.record(
+            "creative", "main", time.perf_counter() - started, self.gemini.last_call, error=not result
         )
         
+        if not isinstance(result, dict):
+            return None
         if result:
-            # Thêm metadata
-            result["_metadata"] = {
-                "product_type": product_type,
-                "num_images": 1 + (len(additional_images) if additional_images else 0),
-                "category": self.prompt_engine.get_category(product_type, price)
-            }
+            self._finalize(
+                result, product_type, category, music_list, shortlist, matcher,
+                num_images=1 + (len(additional_images) if additional_images else 0),
+                routing=routing
+            )
         
         return result
     
+    def generate_batch(
+        self,
+        products: List[Dict],
+        music_list: List[Dict] = None,
+        pack_size: int = None
+    ) -> Dict[str, Optional[Dict]]:
+        """
+        Generate content cho nhiều sản phẩm (catalog), gộp PACK_SIZE sản phẩm / 1 request Gemini
+        -> system prompt + danh sách nhạc chỉ tính token 1 lần cho cả nhóm
+        
+        Sản phẩm nào Gemini trả thiếu / sai schema sẽ được generate lại riêng bằng generate()
+        
+        Args:
+            products: List {"id", "image_data", "product_type", "price", "notes", "additional_images"}
+            music_list: Danh sách nhạc trending
+            pack_size: Số sản phẩm / request (mặc định PACK_SIZE)
+            
+        Returns:
+            Dict {product_id: result hoặc None nếu lỗi}
+            
+        Raises:
+            ValueError: products có id trùng nhau (kết quả sẽ ghi đè lẫn nhau)
+        """
+        counts = Counter(str(product["id"]) for product in products)
+        duplicates = sorted(pid for pid, count in counts.items() if count > 1)
+        if duplicates:
+            raise ValueError(f"ID sản phẩm bị trùng: {', '.join(duplicates)}")
+        
+        pack_size = pack_size or self.PACK_SIZE
+        music_list = music_list or self._get_default_music()
+        matcher = self._get_matcher(music_list)
+        results = {}
+        
+        for start in range(0, len(products), pack_size):
+            group = products[start:start + pack_size]
+            
+            packed, shortlist = [], []
+            for product in group:
+                product_info = {
+                    "type": product["product_type"],
+                    "price": product.get("price", ""),
+                    "notes": product.get("notes", "")
+                }
+                category = self.prompt_engine.get_category(product["product_type"], product.get("price", ""))
+                candidates = matcher.shortlist(category, product["product_type"], self.MUSIC_SHORTLIST_SIZE)
+                shortlist.extend(song for song in candidates if song not in shortlist)
+                packed.append({
+                    "id": str(product["id"]),
+                    "images": [product["image_data"]] + list(product.get("additional_images") or []),
+                    "product_info": product_info,
+                    "hints": self.prompt_engine.get_product_hints(product_info),
+                    "category": category,
+                    "candidates": candidates,
+                })
+            
+            # 1 sản phẩm thì không cần gộp
+            response, creative = None, None
+            if len(group) > 1:
+                started = time.perf_counter()
+                response = self.gemini.generate_packed_content(
+                    products=packed,
+                    music_list=shortlist or music_list,
+                    system_prompt=self.prompt_engine.system_prompt,
+                    omit_fields=self.router.omit_fields(),
+                    model_name=self.router.main_model
+                )
+                creative = self.router.record(
+                    "creative", "main", time.perf_counter() - started, self.gemini.last_call, error=not response
+                )
+                creative["shared_by"] = len(group)
+            response = response or {}
+            
+            for product, item in zip(group, packed):
+                result = response.get(item["id"])
+                if self._is_valid_result(result):
+                    result.pop("id", None)
+                    self._finalize(
+                        result, product["product_type"], item["category"], music_list,
+                        item["candidates"], matcher, num_images=len(item["images"]),
+                        routing={"creative": creative}, packed=True
+                    )
+                else:
+                    # Fallback: generate riêng sản phẩm này
+                    result = self.generate(
+                        image_data=product["image_data"],
+                        product_type=product["product_type"],
+                        price=product.get("price", ""),
+                        notes=product.get("notes", ""),
+                        music_list=music_list,
+                        additional_images=product.get("additional_images")
+                    )
+                results[item["id"]] = result
+        
+        return results
+    
+    def _is_valid_result(self, result) -> bool:
+        """Kết quả có đủ field bắt buộc (dùng để quyết định fallback)"""
+        if not isinstance(result, dict):
+            return False
+        if any(not isinstance(result.get(field), str) or not result.get(field).strip() for field in self.REQUIRED_FIELDS):
+            return False
+        return self.router.route("hashtags") != "main" or isinstance(result.get("hashtags"), list)
+    
+    def _finalize(
+        self,
+        result: Dict,
+        product_type: str,
+        category: str,
+        music_list: List[Dict],
+        shortlist: List[Dict],
+        matcher: MusicMatcher,
+        num_images: int,
+        routing: Dict = None,
+        packed: bool = False
+    ):
+        """Hậu xử lý kết quả Gemini: điền field route riêng, kiểm tra nhạc, thêm metadata"""
+        routing = dict(routing or {})
+        
+        hashtags_route = self.router.route("hashtags")
+        if hashtags_route != "main":
+            started = time.perf_counter()
+            hashtags = None
+            if hashtags_route == "lite":
+                hashtags = self._ask_lite(self.router.hashtags_prompt(product_type, result))
+            routing["hashtags"] = self.router.record(
+                "hashtags", hashtags_route, time.perf_counter() - started,
+                self.gemini.last_call if hashtags_route == "lite" else None,
+                error=hashtags_route == "lite" and not isinstance(hashtags, list)
+            )
+            # Lite lỗi -> hashtag local
+            result["hashtags"] = hashtags if isinstance(hashtags, list) else local_hashtags(product_type, category)
+        
+        music_route = self.router.route("music")
+        if music_route == "lite":
+            started = time.perf_counter()
+            music = self._ask_lite(self.router.music_prompt(product_type, result, shortlist or music_list))
+            result["music"] = music if isinstance(music, dict) else None
+            routing["music"] = self.router.record(
+                "music", "lite", time.perf_counter() - started, self.gemini.last_call, error=not isinstance(music, dict)
+            )
+        elif music_route == "local":
+            started = time.perf_counter()
+            result["music"] = None  # matcher chọn ở bước dưới
+        
+        # Gemini trả music sai kiểu (VD chỉ tên bài) / không chọn / chọn bài ngoài danh sách
+        # -> dùng bài matcher chọn
+        if not isinstance(result.get("music"), dict):
+            result["music"] = None
+        picked = (result.get("music") or {}).get("name", "")
+        if not any(song.get("name") == picked for song in music_list):
+            fallback = matcher.pick(category, product_type)
+            if fallback:
+                result["music"] = fallback
+        if music_route == "local":
+            routing["music"] = self.router.record("music", "local", time.perf_counter() - started)
+        
+        # Thêm metadata
+        result["_metadata"] = {
+            "product_type": product_type,
+            "num_images": num_images,
+            "category": category,
+            "music_candidates": [song.get("name") for song in shortlist],
+            "routing": {field: entry for field, entry in routing.items() if entry}
+        }
+        if packed:
+            result["_metadata"]["packed"] = True
+    
+    def _ask_lite(self, prompt: str):
+        """Gọi model nhẹ với prompt text, trả về JSON đã parse (None nếu lỗi)"""
+        response_text = self.gemini.generate_content(prompt, model_name=self.router.lite_model)
+        if not response_text:
+            return None
+        try:
+            return self.gemini.parse_json(response_text.strip())
+        except ValueError:
+            return None
+    
+    def _get_matcher(self, music_list: List[Dict]) -> MusicMatcher:
+        """MusicMatcher cho music_list, chỉ build lại khi danh sách nhạc đổi"""
+        key = (
+            self.prompt_engine.registry.version,
+            tuple((song.get("id"), song.get("name")) for song in music_list)
+        )
+        # Generator dùng chung giữa các thread của TaskRunner
+        with self._matcher_lock:
+            if self._matcher is None or key != self._matcher_key:
+                self._matcher = MusicMatcher(music_list, self.prompt_engine.templates)
+                self._matcher_key = key
+            return self._matcher
+    
+    def suggest_music(self, product_type: str, music_list: List[Dict] = None, price: str = "") -> Optional[Dict]:
+        """Chọn nhạc local (không gọi Gemini)"""
+        music_list = music_list or self._get_default_music()
+        category = self.prompt_engine.get_category(product_type, price)
+        return self._get_matcher(music_list).pick(category, product_type)
+    
     def _get_default_music(self) -> List[Dict]:
         """Danh sách nhạc mặc định khi không có data"""
         return [
@@ -107,7 +344,7 @@ class ContentGenerator:
         output.append("=" * 50)
         output.append("🎵 MUSIC")
         output.append("=" * 50)
-        music = result.get("music", {})
+        music = result.get("music") or {}
         output.append(f"Bài hát: {music.get('name', 'N/A')}")
         output.append(f"Lý do: {music.get('reason', 'N/A')}")
         output.append("")
@@ -5,24 +5,306 @@ Kết nối với Gemini 2.5 Flash để phân tích ảnh và generate content
 import os
 import json
 import base64
-from typing import Dict, Optional
+import hashlib
+import textwrap
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-import google.generativeai as genai
 from PIL import Image
 import io
 
+from services.image_processor import ImageProcessor
+from services.telemetry import observe, record_tokens, span
+from .hedging import LatencyHistogram, get_hedge_budget
+
 load_dotenv()
 
 
+# Các field trong JSON trả về (theo thứ tự trong prompt)
+OUTPUT_FIELDS = {
+    "visual_prompt": '    "visual_prompt": "Prompt TIẾNG VIỆT mô tả video cho Veo3. Bao gồm: góc quay, ánh sáng, chuyển động camera, hiệu ứng, mood. Dài 50-100 từ. VD: Quay cận cảnh nhẫn kim cương trên nền nhung đen, ánh sáng studio 3 điểm với rim light làm nổi bật viền platinum, hiệu ứng lấp lánh trên các mặt cắt kim cương, camera quay chậm xoay 360 độ, chất lượng 4K điện ảnh, không khí sang trọng lãng mạn"',
+    "title": '    "title": "Tiêu đề viral tiếng Việt có emoji, gây tò mò, dưới 50 ký tự"',
+    "hook": '    "hook": "Câu hook đầu video tiếng Việt, dưới 10 từ, gây sốc hoặc tò mò"',
+    "hashtags": '    "hashtags": ["#hashtag1", "#hashtag2", "...tối đa 10 hashtags tiếng Việt"]',
+    "music": '    "music": {\n        "name": "Tên bài hát phù hợp nhất từ danh sách",\n        "reason": "Lý do chọn bài này (tiếng Việt)"\n    }',
+    "caption": '    "caption": "Caption đầy đủ tiếng Việt cho video TikTok, bao gồm mô tả sản phẩm và call-to-action"',
+}
+
+
+def build_output_format(omit_fields: tuple = (), with_id: bool = False) -> str:
+    """JSON mẫu cho prompt, bỏ các field do route khác đảm nhận"""
+    lines = ['    "id": "ID sản phẩm"'] if with_id else []
+    lines += [line for field, line in OUTPUT_FIELDS.items() if field not in omit_fields]
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
 class GeminiClient:
+    # Tổng bytes ảnh gửi inline tối đa / request; lớn hơn -> upload qua File API
+    INLINE_MAX_BYTES = 8 * 1024 * 1024
+    # File API giữ file 48h; dùng lại handle tới expiration_time thật của file trừ khoảng an toàn
+    FILE_TTL = 46 * 3600  # khi file không có expiration_time
+    FILE_EXPIRY_MARGIN = 15 * 60
+    # Định dạng Gemini nhận trực tiếp (GIF... vẫn đi qua PIL)
+    INLINE_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
+    # Hedging: chờ token đầu tiên tới percentile này của lịch sử rồi mới bắn request phụ
+    HEDGE_QUANTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20  # ít mẫu hơn -> dùng ngưỡng mặc định
+    
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in .env")
         
-        genai.configure(api_key=api_key)
+        # Import SDK khi khởi tạo client (nặng ~1s) thay vì lúc import module
+        import google.generativeai as genai
+        
+        # GEMINI_API_ENDPOINT: gọi qua REST tới endpoint khác (proxy / fake server của benchmarks)
+        endpoint = os.getenv("GEMINI_API_ENDPOINT")
+        if endpoint:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        self._genai = genai
         self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
         self.model = genai.GenerativeModel(self.model_name)
+        self._models = {self.model_name: self.model}
+        self._local = threading.local()  # thông tin lần gọi gần nhất của từng thread
+        
+        # Hedged request (tùy chọn): GEMINI_HEDGE=1
+        self.hedge_enabled = os.getenv("GEMINI_HEDGE", "0") == "1"
+        self.hedge_delay = float(os.getenv("GEMINI_HEDGE_DELAY", "8"))
+        self._ttft: Dict[str, LatencyHistogram] = {}  # model -> time-to-first-token
+        # Tạo sẵn (thread chỉ được spawn khi submit) -> không race khi nhiều job cùng hedge lần đầu
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini")
+        
+        # Handle File API đã upload: content hash -> (file, hết hạn lúc)
+        self._files = {}
+        self._files_lock = threading.Lock()
+    
+    # ============ MODEL CALL ============
+    def get_model(self, model_name: str = None):
+        """GenerativeModel theo tên (tạo 1 lần rồi dùng lại)"""
+        model_name = model_name or self.model_name
+        if model_name not in self._models:
+            self._models[model_name] = self._genai.GenerativeModel(model_name)
+        return self._models[model_name]
+    
+    def _call(self, model_name: Optional[str], contents, hedge: bool = False):
+        """
+        Gọi generate_content, ghi lại model / latency / token của lần gọi (xem last_call)
+        
+        Args:
+            hedge: Request creative: stream để đo time-to-first-token (stage gemini.ttft),
+                   hedge thêm khi GEMINI_HEDGE=1
+        """
+        model_name = model_name or self.model_name
+        self._local.last_call = None
+        started = time.perf_counter()
+        with span("gemini.request", model=model_name) as attrs:
+            try:
+                if hedge and self.hedge_enabled:
+                    response, extra = self._hedged_generate(model_name, contents)
+                elif hedge:
+                    response, extra = self._streamed_generate(model_name, contents)
+                else:
+                    response, extra = self.get_model(model_name).generate_content(contents), {}
+            except Exception:
+                self._evict_files(contents)
+                raise
+            usage = getattr(response, "usage_metadata", None)
+            self._local.last_call = dict({
+                "model": model_name,
+                "latency": time.perf_counter() - started,
+                "input_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+                "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            }, **extra)
+            attrs.update({k: v for k, v in self._local.last_call.items() if k not in ("model", "latency")})
+        
+        record_tokens(model_name, self._local.last_call["input_tokens"], self._local.last_call["output_tokens"])
+        if "ttft" in extra:  # request creative (stream)
+            observe("gemini.ttft", extra["ttft"])
+        return response
+    
+    def _streamed_generate(self, model_name: str, contents):
+        """
+        Stream 1 request trên thread hiện tại (không hedge), đo thời gian tới chunk đầu tiên
+        
+        Returns:
+            Tuple (response đã đọc hết stream, {"ttft"})
+        """
+        started = time.perf_counter()
+        response = self.get_model(model_name).generate_content(contents, stream=True)
+        ttft = None
+        for _ in response:
+            if ttft is None:
+                ttft = time.perf_counter() - started
+        if ttft is None:  # stream rỗng
+            ttft = time.perf_counter() - started
+        # Cùng histogram với hedged request -> bật GEMINI_HEDGE là có sẵn ngưỡng p95
+        self._ttft.setdefault(model_name, LatencyHistogram()).record(ttft)
+        return response, {"ttft": ttft}
+    
+    def hedge_threshold(self, model_name: str) -> float:
+        """Ngưỡng chờ token đầu tiên trước khi hedge (p95 gần đây, hoặc mặc định khi ít mẫu)"""
+        histogram = self._ttft.get(model_name)
+        if histogram is None or len(histogram) < self.HEDGE_MIN_SAMPLES:
+            return self.hedge_delay
+        return histogram.percentile(self.HEDGE_QUANTILE)
+    
+    def _hedged_generate(self, model_name: str, contents):
+        """
+        Stream request chính; quá ngưỡng chưa có token đầu tiên -> bắn thêm 1 request giống hệt
+        (nếu còn ngân sách hedge), lấy request xong trước, hủy request còn lại
+        
+        Returns:
+            Tuple (response, {"ttft", "hedged", "winner"})
+        """
+        model = self.get_model(model_name)
+        histogram = self._ttft.setdefault(model_name, LatencyHistogram())
+        budget = get_hedge_budget()
+        budget.on_request()
+        
+        attempts = [self._start_attempt(model, contents, "primary")]
+        # first_token được set khi có chunk đầu tiên hoặc khi request kết thúc (kể cả lỗi)
+        if not attempts[0]["first_token"].wait(self.hedge_threshold(model_name)) and budget.try_acquire():
+            attempts.append(self._start_attempt(model, contents, "hedge"))
+        
+        pending = {attempt["future"]: attempt for attempt in attempts}
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = pending.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending.values():
+                    loser["cancel"].set()
+                # Histogram luôn nhận TTFT của request chính (kể cả khi hedge thắng) -> ngưỡng p95
+                # không bị kéo xuống dần; request chính chưa có token -> mẫu cận dưới = thời gian đã chờ
+                primary = attempts[0]
+                primary_first = primary["first_at"] if primary["first_token"].is_set() else None
+                histogram.record((primary_first or time.perf_counter()) - primary["started"])
+                # TTFT người dùng thấy: tính từ lúc bắt đầu request chính
+                ttft = attempt["first_at"] - primary["started"]
+                return future.result(), {"ttft": ttft, "hedged": len(attempts) > 1, "winner": attempt["name"]}
+        raise error
+    
+    def _start_attempt(self, model, contents, name: str) -> Dict:
+        attempt = {
+            "name": name,
+            "started": time.perf_counter(),
+            "first_at": None,
+            "first_token": threading.Event(),
+            "cancel": threading.Event(),
+        }
+        attempt["future"] = self._executor.submit(self._stream_attempt, model, contents, attempt)
+        return attempt
+    
+    @staticmethod
+    def _stream_attempt(model, contents, attempt: Dict):
+        """Chạy 1 request dạng stream; dừng đọc stream khi bị hủy (bên kia đã thắng)"""
+        try:
+            response = model.generate_content(contents, stream=True)
+            for _ in response:
+                if attempt["first_at"] is None:
+                    attempt["first_at"] = time.perf_counter()
+                    attempt["first_token"].set()
+                if attempt["cancel"].is_set():
+                    raise RuntimeError(f"Request {attempt['name']} đã bị hủy")
+            return response
+        finally:
+            if attempt["first_at"] is None:
+                attempt["first_at"] = time.perf_counter()
+            attempt["first_token"].set()
+    
+    @property
+    def last_call(self) -> Optional[Dict]:
+        """{"model", "latency", "input_tokens", "output_tokens"} của lần gọi gần nhất trên thread này"""
+        return getattr(self._local, "last_call", None)
+    
+    # ============ IMAGE PARTS ============
+    def image_parts(self, images: List[bytes], use_files: bool = None) -> list:
+        """
+        Chuyển list ảnh (bytes đã qua ImageProcessor) thành content parts cho Gemini
+        
+        - Gửi thẳng bytes JPEG/WebP dạng inline {mime_type, data}: không decode / encode lại
+        - Bộ ảnh lớn (> INLINE_MAX_BYTES) -> upload File API, handle được dùng lại giữa các lần gọi
+        - Định dạng khác -> fallback PIL như cũ (ảnh lỗi bị bỏ qua)
+        
+        Args:
+            use_files: Ép dùng / không dùng File API (None = tự quyết theo tổng bytes)
+        """
+        if use_files is None:
+            use_files = sum(len(data) for data in images) > self.INLINE_MAX_BYTES
+        parts = []
+        for data in images:
+            mime_type = ImageProcessor.detect_mime_type(data)
+            if mime_type not in self.INLINE_MIME_TYPES:
+                try:
+                    parts.append(Image.open(io.BytesIO(data)))
+                except Exception:
+                    continue
+            elif use_files:
+                parts.append(self._upload_file(data, mime_type) or {"mime_type": mime_type, "data": data})
+            else:
+                parts.append({"mime_type": mime_type, "data": data})
+        return parts
+    
+    def _upload_file(self, data: bytes, mime_type: str):
+        """Upload ảnh lên File API (tên file = content hash -> dùng lại được), None nếu lỗi"""
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        now = time.time()
+        with self._files_lock:
+            cached = self._files.get(digest)
+            if cached and cached[1] > now:
+                return cached[0]
+        
+        name = f"files/img-{digest}"
+        try:
+            try:
+                # Process khác (hoặc lần chạy trước) đã upload cùng ảnh
+                uploaded = self._genai.get_file(name)
+            except Exception:
+                uploaded = None
+            if uploaded is not None and self._file_usable_until(uploaded, now) <= now:
+                # Sắp hết hạn -> xóa để upload lại cùng tên
+                try:
+                    self._genai.delete_file(name)
+                except Exception:
+                    pass
+                uploaded = None
+            if uploaded is None:
+                uploaded = self._genai.upload_file(io.BytesIO(data), mime_type=mime_type, name=name)
+        except Exception as e:
+            print(f"❌ Lỗi upload File API: {e}")
+            return None
+        
+        with self._files_lock:
+            self._files[digest] = (uploaded, self._file_usable_until(uploaded, now))
+        return uploaded
+    
+    def _file_usable_until(self, uploaded, now: float) -> float:
+        """Thời điểm ngừng dùng lại handle: expiration_time của file - FILE_EXPIRY_MARGIN"""
+        expiration = getattr(uploaded, "expiration_time", None)
+        try:
+            expires_at = expiration.timestamp() if expiration else 0
+        except Exception:
+            expires_at = 0
+        if expires_at <= 0:  # không có thông tin hết hạn
+            return now + self.FILE_TTL
+        return expires_at - self.FILE_EXPIRY_MARGIN
+    
+    def _evict_files(self, contents):
+        """Bỏ cache các handle File API có trong request lỗi (file có thể đã bị xóa phía API)"""
+        if not isinstance(contents, list):
+            return
+        used = {id(part) for part in contents}
+        with self._files_lock:
+            for digest in [d for d, (handle, _) in self._files.items() if id(handle) in used]:
+                del self._files[digest]
         
     def analyze_image(self, image_data: bytes, prompt: str) -> Optional[str]:
         """
@@ -36,11 +318,8 @@ class GeminiClient:
             Response text từ Gemini
         """
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Gọi Gemini với ảnh
-            response = self.model.generate_content([prompt, image])
+            # Gọi Gemini với ảnh (bytes gửi thẳng, không decode)
+            response = self._call(None, [prompt] + self.image_parts([image_data]))
             
             return response.text
             
@@ -48,12 +327,12 @@ class GeminiClient:
             print(f"❌ Lỗi Gemini: {e}")
             return None
     
-    def generate_content(self, prompt: str) -> Optional[str]:
+    def generate_content(self, prompt: str, model_name: str = None) -> Optional[str]:
         """
         Generate content chỉ với text (không có ảnh)
         """
         try:
-            response = self.model.generate_content(prompt)
+            response = self._call(model_name, prompt)
             return response.text
         except Exception as e:
             print(f"❌ Lỗi Gemini: {e}")
@@ -65,7 +344,9 @@ class GeminiClient:
         product_info: Dict,
         music_list: list,
         system_prompt: str,
-        additional_images: list = None
+        additional_images: list = None,
+        omit_fields: tuple = (),
+        model_name: str = None
     ) -> Optional[Dict]:
         """
         Generate nội dung viral cho TikTok từ ảnh sản phẩm
@@ -76,23 +357,26 @@ class GeminiClient:
             music_list: Danh sách nhạc trending để AI chọn
             system_prompt: System instruction cho AI
             additional_images: List các ảnh phụ (bytes) của cùng 1 sản phẩm
+            omit_fields: Field không cần Gemini tạo (VD "hashtags", "music" khi route local)
+            model_name: Model dùng cho request (None = GEMINI_MODEL)
             
         Returns:
             Dict chứa visual_prompt, title, hook, hashtags, music
         """
         try:
             # Tạo list tất cả ảnh (nhiều góc của 1 sản phẩm)
-            images = [Image.open(io.BytesIO(image_data))]
-            
-            if additional_images:
-                for img_bytes in additional_images:
-                    try:
-                        images.append(Image.open(io.BytesIO(img_bytes)))
-                    except:
-                        continue
+            images = self.image_parts([image_data] + list(additional_images or []))
             
             num_images = len(images)
             
+            # Nhạc do route khác chọn -> không cần gửi danh sách nhạc
+            music_section = ""
+            if "music" not in omit_fields:
+                music_section = f"""
+=== DANH SÁCH NHẠC TRENDING VIỆT NAM ===
+{json.dumps(music_list, indent=2, ensure_ascii=False)}
+"""
+            
             # Tạo prompt đầy đủ - TIẾNG VIỆT
             full_prompt = f"""
 {system_prompt}
@@ -101,43 +385,22 @@ class GeminiClient:
 - Loại: {product_info.get('type', 'Trang sức')}
 - Ghi chú: {product_info.get('notes', 'Không có')}
 - Số ảnh: {num_images} ảnh (các góc khác nhau của CÙNG 1 sản phẩm)
-
-=== DANH SÁCH NHẠC TRENDING VIỆT NAM ===
-{json.dumps(music_list, indent=2, ensure_ascii=False)}
-
+{music_section}
 === YÊU CẦU ===
 Phân tích TẤT CẢ {num_images} ảnh (đây là các góc khác nhau của CÙNG 1 sản phẩm).
 Tạo NỘI DUNG TIẾNG VIỆT cho thị trường Việt Nam.
 
 Trả về JSON với format sau:
-{{
-    "visual_prompt": "Prompt TIẾNG VIỆT mô tả video cho Veo3. Bao gồm: góc quay, ánh sáng, chuyển động camera, hiệu ứng, mood. Dài 50-100 từ. VD: Quay cận cảnh nhẫn kim cương trên nền nhung đen, ánh sáng studio 3 điểm với rim light làm nổi bật viền platinum, hiệu ứng lấp lánh trên các mặt cắt kim cương, camera quay chậm xoay 360 độ, chất lượng 4K điện ảnh, không khí sang trọng lãng mạn",
-    "title": "Tiêu đề viral tiếng Việt có emoji, gây tò mò, dưới 50 ký tự",
-    "hook": "Câu hook đầu video tiếng Việt, dưới 10 từ, gây sốc hoặc tò mò",
-    "hashtags": ["#hashtag1", "#hashtag2", "...tối đa 10 hashtags tiếng Việt"],
-    "music": {{
-        "name": "Tên bài hát phù hợp nhất từ danh sách",
-        "reason": "Lý do chọn bài này (tiếng Việt)"
-    }},
-    "caption": "Caption đầy đủ tiếng Việt cho video TikTok, bao gồm mô tả sản phẩm và call-to-action"
-}}
+{build_output_format(omit_fields)}
 
 CHỈ TRẢ VỀ JSON, KHÔNG CÓ TEXT KHÁC.
 """
             
             # Gửi tất cả ảnh cùng prompt
             content_parts = [full_prompt] + images
-            response = self.model.generate_content(content_parts)
+            response = self._call(model_name, content_parts, hedge=True)
             response_text = response.text.strip()
-            
-            # Parse JSON từ response
-            # Xử lý trường hợp Gemini wrap trong ```json ... ```
-            if response_text.startswith("```"):
-                lines = response_text.split("\n")
-                response_text = "\n".join(lines[1:-1])
-            
-            result = json.loads(response_text)
-            return result
+            return self.parse_json(response_text)
             
         except json.JSONDecodeError as e:
             print(f"❌ Lỗi parse JSON: {e}")
@@ -147,6 +410,98 @@ CHỈ TRẢ VỀ JSON, KHÔNG CÓ TEXT KHÁC.
             print(f"❌ Lỗi generate content: {e}")
             return None
     
+    def generate_packed_content(
+        self,
+        products: List[Dict],
+        music_list: list,
+        system_prompt: str,
+        omit_fields: tuple = (),
+        model_name: str = None
+    ) -> Optional[Dict[str, Dict]]:
+        """
+        Generate nội dung cho NHIỀU sản phẩm trong 1 request
+        (system prompt + danh sách nhạc chỉ gửi 1 lần cho cả nhóm)
+        
+        Args:
+            products: List {"id", "images": [bytes], "product_info": {...}, "hints": str}
+            music_list: Danh sách nhạc chung cho cả nhóm
+            system_prompt: System instruction (không kèm gợi ý riêng từng sản phẩm)
+            omit_fields: Field không cần Gemini tạo
+            model_name: Model dùng cho request (None = GEMINI_MODEL)
+            
+        Returns:
+            Dict {product_id: result} (chưa validate), hoặc None nếu request lỗi
+        """
+        response_text = ""
+        try:
+            use_files = sum(len(img) for p in products for img in p["images"]) > self.INLINE_MAX_BYTES
+            
+            music_section = ""
+            if "music" not in omit_fields:
+                music_section = f"""
+=== DANH SÁCH NHẠC TRENDING VIỆT NAM ===
+{json.dumps(music_list, indent=2, ensure_ascii=False)}
+"""
+            
+            content_parts = [f"""
+{system_prompt}
+{music_section}
+=== YÊU CẦU ===
+Có {len(products)} sản phẩm KHÁC NHAU bên dưới, mỗi sản phẩm có ID, thông tin và ảnh riêng
+(nhiều ảnh = các góc khác nhau của CÙNG 1 sản phẩm).
+Tạo NỘI DUNG TIẾNG VIỆT riêng cho TỪNG sản phẩm, chỉ dựa trên ảnh của chính sản phẩm đó.
+"""]
+            for product in products:
+                info = product["product_info"]
+                images = self.image_parts(product["images"], use_files=use_files)
+                content_parts.append(f"""
+=== SẢN PHẨM ID: {product['id']} ===
+- Loại: {info.get('type', 'Trang sức')}
+- Ghi chú: {info.get('notes', 'Không có')}
+- Số ảnh: {len(images)} ảnh
+{product.get('hints', '')}""")
+                content_parts.extend(images)
+            
+            item_format = textwrap.indent(build_output_format(omit_fields, with_id=True), " " * 8).strip()
+            content_parts.append(f"""
+Trả về JSON với format sau (mỗi sản phẩm 1 phần tử, "id" đúng như ID ở trên):
+{{
+    "products": [
+        {item_format}
+    ]
+}}
+
+CHỈ TRẢ VỀ JSON, KHÔNG CÓ TEXT KHÁC.
+""")
+            
+            response = self._call(model_name, content_parts, hedge=True)
+            response_text = response.text.strip()
+            data = self.parse_json(response_text)
+            
+            items = data.get("products", []) if isinstance(data, dict) else data
+            return {
+                str(item["id"]): item
+                for item in items
+                if isinstance(item, dict) and item.get("id") is not None
+            }
+            
+        except json.JSONDecodeError as e:
+            print(f"❌ Lỗi parse JSON (packed): {e}")
+            print(f"Response: {response_text[:500]}")
+            return None
+        except Exception as e:
+            print(f"❌ Lỗi generate content (packed): {e}")
+            return None
+    
+    @staticmethod
+    def parse_json(response_text: str):
+        """Parse JSON từ response (xử lý trường hợp Gemini wrap trong ```json ... ```)"""
+        with span("gemini.parse", chars=len(response_text)):
+            if response_text.startswith("```"):
+                lines = response_text.split("\n")
+                response_text = "\n".join(lines[1:-1])
+            return json.loads(response_text)
+    
     def test_connection(self) -> bool:
         """Test kết nối với Gemini API"""
         try:
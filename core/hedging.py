@@ -0,0 +1,83 @@
+"""
+Hedging
+Công cụ cho hedged request: ước lượng ngưỡng chờ từ phân phối latency gần đây + giới hạn số request phụ
+
+- LatencyHistogram: cửa sổ trượt N mẫu latency gần nhất, tính percentile
+- HedgeBudget: token bucket dùng chung cả process; mỗi request thường nạp `ratio` token,
+  mỗi request hedge tốn 1 token -> số request phụ <= ratio x số request (+ burst)
+"""
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LatencyHistogram:
+    """Latency của N lần gọi gần nhất (giây)"""
+
+    WINDOW = 200
+
+    def __init__(self, window: int = None):
+        self._samples = deque(maxlen=window or self.WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentile q (0-1) của cửa sổ hiện tại, None nếu chưa có mẫu"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[index]
+
+
+class HedgeBudget:
+    """Token bucket giới hạn tỷ lệ request hedge"""
+
+    def __init__(self, ratio: float = 0.05, burst: float = 2.0):
+        """
+        Args:
+            ratio: Tỷ lệ hedge tối đa so với số request (0.05 = 5%)
+            burst: Số hedge tối đa được dồn lại khi lâu không dùng
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def on_request(self):
+        """Gọi mỗi khi có 1 request chính"""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """Xin 1 lượt hedge (False nếu đã hết ngân sách)"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+
+_budget: Optional[HedgeBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_hedge_budget() -> HedgeBudget:
+    """HedgeBudget dùng chung trong process (GEMINI_HEDGE_RATIO, mặc định 5%)"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = HedgeBudget(ratio=float(os.getenv("GEMINI_HEDGE_RATIO", "0.05")))
+        return _budget
@@ -0,0 +1,171 @@
+"""
+Model Router
+Định tuyến từng phần việc của 1 lần generate tới model / heuristic phù hợp
+
+- Route: "main" (GEMINI_MODEL), "lite" (GEMINI_LITE_MODEL), "local" (heuristic, không gọi API)
+- Field creative (visual_prompt, title, hook, caption) luôn đi model chính
+- hashtags / music mặc định chạy local: hashtag mix theo quy tắc SYSTEM_PROMPT, nhạc do MusicMatcher chọn
+- Cấu hình theo field: GEMINI_ROUTES="hashtags=lite,music=main"
+- Ghi latency + token + chi phí ước tính cho từng route (cộng dồn trong services.telemetry)
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from services.keyword_classifier import fold_text
+from services.taxonomy import get_taxonomy
+from services.telemetry import record_route
+from .prompt_engine import detect_product_kind
+
+ROUTES = ("main", "lite", "local")
+
+# Field có thể tách khỏi request chính -> route mặc định
+DEFAULT_ROUTES = {
+    "hashtags": "local",
+    "music": "local",
+}
+
+# Giá ước tính USD / 1M token (input, output)
+MODEL_PRICING = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+
+# Hashtag mix theo SYSTEM_PROMPT: 3 viral + 3 ngách + 4 sản phẩm
+VIRAL_HASHTAGS = ["#tiktokviral", "#fyp", "#xuhuong"]
+NICHE_HASHTAGS = ["#jewelry", "#trangsuc", "#phukien"]
+CATEGORY_HASHTAGS = {
+    "luxury": ["#trangsuccaocap", "#kimcuong"],
+    "teen": ["#phukienxinh", "#genz"],
+    "classic": ["#vangta", "#trangsucvang"],
+    "fashion": ["#ootd", "#phoido"],
+}
+HASHTAG_COUNT = 10
+
+
+def parse_routes(spec: str = None) -> Dict[str, str]:
+    """
+    Đọc cấu hình route "field=route,field=route" (field / route không hợp lệ bị bỏ qua)
+
+    Returns:
+        Dict {field: route}, field không cấu hình dùng DEFAULT_ROUTES
+    """
+    routes = dict(DEFAULT_ROUTES)
+    for item in (spec or "").split(","):
+        field, _, route = item.partition("=")
+        field, route = field.strip(), route.strip().lower()
+        if field in DEFAULT_ROUTES and route in ROUTES:
+            routes[field] = route
+    return routes
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
+    """Chi phí ước tính (USD) của 1 lần gọi"""
+    price_in, price_out = MODEL_PRICING.get(model_name, MODEL_PRICING["gemini-2.5-flash"])
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def to_hashtag(keyword: str) -> str:
+    """"Nhẫn kim cương" -> "#nhankimcuong" (bỏ dấu, bỏ mọi ký tự không phải chữ / số); "" nếu rỗng"""
+    tag = re.sub(r"[\W_]+", "", fold_text(keyword))
+    return f"#{tag}" if tag else ""
+
+
+def local_hashtags(product_type: str, category: str) -> List[str]:
+    """
+    Hashtag mix không cần gọi AI: viral + ngách + theo loại SP / category
+
+    Hashtag sản phẩm lấy từ keyword của loại SP trong taxonomy (không dùng nhãn tự do trên UI
+    như "Charm / Mặt dây"); loại "other" / không nhận ra -> chỉ dùng hashtag category
+    """
+    product_tags = []
+    kind = detect_product_kind(product_type)
+    entry = get_taxonomy().get(kind) if kind and kind != "other" else None
+    for keyword in (entry or {}).get("keywords", []):
+        tag = to_hashtag(keyword)
+        if tag:
+            product_tags.append(tag)
+    product_tags = list(dict.fromkeys(product_tags))[:2] + CATEGORY_HASHTAGS.get(category, [])
+
+    hashtags = list(dict.fromkeys(VIRAL_HASHTAGS + NICHE_HASHTAGS + product_tags))
+    return hashtags[:HASHTAG_COUNT]
+
+
+class ModelRouter:
+    """Chọn route cho từng field + ghi latency / token / chi phí theo route vào telemetry"""
+
+    def __init__(self, routes: Dict[str, str] = None, main_model: str = None, lite_model: str = None):
+        """
+        Args:
+            routes: {field: route}, None = đọc GEMINI_ROUTES
+            main_model: Model chính (None = GEMINI_MODEL)
+            lite_model: Model nhẹ (None = GEMINI_LITE_MODEL)
+        """
+        self.routes = routes or parse_routes(os.getenv("GEMINI_ROUTES"))
+        self.main_model = main_model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.lite_model = lite_model or os.getenv("GEMINI_LITE_MODEL", "gemini-2.5-flash-lite")
+
+    def route(self, field: str) -> str:
+        return self.routes.get(field, "main")
+
+    def model_for(self, route: str) -> Optional[str]:
+        """Tên model của route (None cho local)"""
+        return {"main": self.main_model, "lite": self.lite_model}.get(route)
+
+    def omit_fields(self) -> tuple:
+        """Các field không cần model chính tạo"""
+        return tuple(field for field, route in self.routes.items() if route != "main")
+
+    def record(self, field: str, route: str, latency: float, call: Dict = None, error: bool = False) -> Dict:
+        """
+        Ghi 1 lần chạy của route
+
+        Args:
+            call: GeminiClient.last_call (None cho route local)
+
+        Returns:
+            Bản ghi lần chạy {"route", "model", "latency", "input_tokens", "output_tokens", "cost"}
+        """
+        call = call or {}
+        model = call.get("model") or self.model_for(route)
+        entry = {
+            "route": route,
+            "model": model if route != "local" else None,
+            "latency": round(latency, 3),
+            "input_tokens": call.get("input_tokens", 0),
+            "output_tokens": call.get("output_tokens", 0),
+            "cost": estimate_cost(model, call.get("input_tokens", 0), call.get("output_tokens", 0)) if call else 0.0,
+        }
+        record_route(
+            field, route, latency, entry["input_tokens"], entry["output_tokens"], entry["cost"], error=error
+        )
+        return entry
+
+    # ============ LITE MODEL PROMPTS ============
+    @staticmethod
+    def hashtags_prompt(product_type: str, result: Dict) -> str:
+        return f"""
+Tạo {HASHTAG_COUNT} hashtag TikTok tiếng Việt cho video trang sức.
+Mix: 3 hashtag viral + 3 hashtag ngách trang sức + 4 hashtag theo sản phẩm.
+- Loại sản phẩm: {product_type}
+- Title: {result.get('title', '')}
+- Hook: {result.get('hook', '')}
+
+CHỈ TRẢ VỀ JSON: ["#hashtag1", "#hashtag2", ...]
+"""
+
+    @staticmethod
+    def music_prompt(product_type: str, result: Dict, shortlist: List[Dict]) -> str:
+        return f"""
+Chọn 1 bài nhạc phù hợp nhất cho video TikTok trang sức từ danh sách bên dưới.
+- Loại sản phẩm: {product_type}
+- Mô tả video: {result.get('visual_prompt', '')}
+- Hook: {result.get('hook', '')}
+
+=== DANH SÁCH NHẠC ===
+{json.dumps(shortlist, indent=2, ensure_ascii=False)}
+
+CHỈ TRẢ VỀ JSON: {{"name": "Tên bài hát từ danh sách", "reason": "Lý do chọn (tiếng Việt)"}}
+"""
@@ -0,0 +1,130 @@
+"""
+Music Matcher
+Chấm điểm toàn bộ danh sách nhạc theo vibe của sản phẩm bằng vector tag (NumPy)
+
+- Mỗi bài hát -> vector tag từ `vibe` + `suitable_for`
+- Mỗi category trong PRODUCT_TEMPLATES -> vector tag từ `music_vibe`
+- Điểm = cosine similarity, tính cho cả catalog bằng 1 phép nhân ma trận
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .prompt_engine import PRODUCT_TEMPLATES
+
+
+def _norm_tag(tag: str) -> str:
+    return str(tag).strip().lower()
+
+
+class MusicMatcher:
+    """Xếp hạng nhạc phù hợp cho một category / loại sản phẩm"""
+
+    # Trọng số cho tag `suitable_for` so với `vibe`
+    SUITABLE_WEIGHT = 1.5
+
+    def __init__(self, songs: List[Dict], templates: Dict = None):
+        self.songs = list(songs or [])
+        self.templates = templates or PRODUCT_TEMPLATES
+
+        # Vocabulary: tất cả tag xuất hiện trong catalog + music_vibe của templates
+        vocab = {}
+        for song in self.songs:
+            for tag in list(song.get("vibe", [])) + list(song.get("suitable_for", [])):
+                vocab.setdefault(_norm_tag(tag), len(vocab))
+        for template in self.templates.values():
+            for tag in template.get("music_vibe", []):
+                vocab.setdefault(_norm_tag(tag), len(vocab))
+        self.vocab = vocab
+        self.tags = list(vocab.keys())
+
+        # Ma trận bài hát x tag, chuẩn hóa L2 theo hàng
+        matrix = np.zeros((len(self.songs), len(vocab)), dtype=np.float32)
+        for i, song in enumerate(self.songs):
+            for tag in song.get("vibe", []):
+                matrix[i, vocab[_norm_tag(tag)]] = 1.0
+            for tag in song.get("suitable_for", []):
+                matrix[i, vocab[_norm_tag(tag)]] = self.SUITABLE_WEIGHT
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = matrix / norms
+
+        # Vector query của từng category được tính sẵn
+        self._category_vectors = {
+            name: self._encode(template.get("music_vibe", []) + [name])
+            for name, template in self.templates.items()
+        }
+
+    def _encode(self, tags: List[str]) -> np.ndarray:
+        """Encode list tag thành vector query (đã chuẩn hóa)"""
+        vector = np.zeros(len(self.vocab), dtype=np.float32)
+        for tag in tags:
+            idx = self.vocab.get(_norm_tag(tag))
+            if idx is not None:
+                vector[idx] = 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _query_vector(self, category: str, product_type: str = "") -> np.ndarray:
+        vector = self._category_vectors.get(category)
+        if vector is None:
+            vector = self._encode(self.templates.get(category, {}).get("music_vibe", []))
+
+        # Tag trong catalog xuất hiện trong tên loại SP (VD: "kim cương", "bông tai")
+        product_lower = product_type.lower()
+        extra = [tag for tag in self.tags if tag and tag in product_lower] if product_lower else []
+        if extra:
+            vector = vector + self._encode(extra)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else vector
+        return vector
+
+    def score(self, category: str, product_type: str = "") -> np.ndarray:
+        """Điểm của toàn bộ catalog (1 phép nhân ma trận)"""
+        if not self.songs:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ self._query_vector(category, product_type)
+
+    def rank(self, category: str, product_type: str = "", top_k: int = 5) -> List[Tuple[Dict, float]]:
+        """
+        Xếp hạng nhạc cho category
+
+        Args:
+            category: luxury / teen / classic / fashion
+            product_type: Loại sản phẩm (để khớp thêm tag `suitable_for`)
+            top_k: Số bài trả về
+
+        Returns:
+            List (song, score) theo điểm giảm dần; hòa điểm thì giữ thứ tự catalog
+        """
+        scores = self.score(category, product_type)
+        if scores.size == 0:
+            return []
+        order = np.lexsort((np.arange(scores.size), -scores))[:top_k]
+        return [(self.songs[i], float(scores[i])) for i in order]
+
+    def shortlist(self, category: str, product_type: str = "", top_k: int = 5) -> List[Dict]:
+        """Top-k bài để đưa vào prompt thay cho cả catalog"""
+        return [song for song, _ in self.rank(category, product_type, top_k)]
+
+    def pick(self, category: str, product_type: str = "") -> Optional[Dict]:
+        """
+        Chọn 1 bài (deterministic) - dùng làm fallback khi Gemini không chọn được
+
+        Returns:
+            Dict {name, artist, reason, score} hoặc None nếu catalog rỗng
+        """
+        ranked = self.rank(category, product_type, top_k=1)
+        if not ranked:
+            return None
+        song, score = ranked[0]
+        template = self.templates.get(category, {})
+        wanted = {_norm_tag(t) for t in template.get("music_vibe", [])}
+        matched = [t for t in song.get("vibe", []) if _norm_tag(t) in wanted]
+        reason = f"Hợp vibe {', '.join(matched)}" if matched else "Phù hợp với phong cách sản phẩm"
+        return {
+            "name": song.get("name", ""),
+            "artist": song.get("artist", ""),
+            "reason": reason,
+            "score": round(score, 4),
+        }
@@ -2,6 +2,10 @@
 Prompt Engine
 System prompts và templates cho 3 modules: Visual, Copywriting, DJ
 """
+from typing import List, Optional
+
+from services.keyword_classifier import KeywordClassifier
+from services.taxonomy import get_taxonomy
 
 # ============================================================
 # MASTER SYSTEM PROMPT - Dạy AI tư duy như TikToker chuyên nghiệp
@@ -134,6 +138,35 @@ PRODUCT_TEMPLATES = {
 }
 
 
+# ============================================================
+# KEYWORDS ĐỂ DETECT CATEGORY (theo thứ tự ưu tiên)
+# ============================================================
+
+CATEGORY_KEYWORDS = {
+    "luxury": ['kim cương', 'diamond', 'platinum', 'bạch kim'],
+    "teen": ['hạt', 'charm', 'teen', 'dây da'],
+    "classic": ['vàng', 'gold', 'truyền thống', '24k', '18k'],
+}
+
+# Category và loại SP là 2 classifier riêng: "nhẫn kim cương" vừa là ring vừa là luxury,
+# trong khi mỗi classifier chỉ lấy nhãn của keyword dài nhất
+CATEGORY_CLASSIFIER = KeywordClassifier(CATEGORY_KEYWORDS)
+
+_product_classifier = None
+_product_classifier_version = None
+
+
+def get_product_classifier() -> KeywordClassifier:
+    """Classifier loại SP (ring, necklace, ...) theo taxonomy, build lại khi taxonomy đổi"""
+    global _product_classifier, _product_classifier_version
+    taxonomy = get_taxonomy()
+    version = taxonomy.current_version()
+    if _product_classifier is None or _product_classifier_version != version:
+        _product_classifier = KeywordClassifier(taxonomy.keyword_tables())
+        _product_classifier_version = version
+    return _product_classifier
+
+
 # ============================================================
 # HELPER FUNCTIONS
 # ============================================================
@@ -148,11 +181,15 @@ def get_template_for_category(category: str) -> dict:
     return PRODUCT_TEMPLATES.get(category, PRODUCT_TEMPLATES["fashion"])
 
 
-def detect_product_category(product_type: str, price: str = "") -> str:
+def detect_product_category(product_type: str, price: str = "", labels: List[str] = None) -> str:
     """
     Tự động detect category dựa trên loại SP và giá
+    
+    Args:
+        labels: Nhãn đã classify sẵn (batch), bỏ qua để tự classify product_type
     """
-    product_lower = product_type.lower()
+    if labels is None:
+        labels = CATEGORY_CLASSIFIER.classify(product_type)
     
     # Parse giá
     price_value = 0
@@ -162,54 +199,88 @@ def detect_product_category(product_type: str, price: str = "") -> str:
         price_value = int(price_clean) if price_clean else 0
     
     # Luxury: Kim cương, giá > 10 triệu
-    if any(k in product_lower for k in ['kim cương', 'diamond', 'platinum', 'bạch kim']):
+    if "luxury" in labels:
         return "luxury"
     if price_value > 10000000:  # > 10 triệu
         return "luxury"
     
     # Teen: Vòng tay hạt, giá rẻ
-    if any(k in product_lower for k in ['hạt', 'charm', 'teen', 'dây da']):
+    if "teen" in labels:
         return "teen"
     if price_value > 0 and price_value < 500000:  # < 500k
         return "teen"
     
     # Classic: Vàng, truyền thống
-    if any(k in product_lower for k in ['vàng', 'gold', 'truyền thống', '24k', '18k']):
+    if "classic" in labels:
         return "classic"
     
     # Default: Fashion
     return "fashion"
 
 
+def detect_product_kind(product_type: str) -> Optional[str]:
+    """Loại SP theo data/categories.json (ring, necklace, ...), None nếu không khớp"""
+    kind = get_taxonomy().lookup(product_type)
+    if kind:
+        return kind
+    return get_product_classifier().first(product_type)
+
+
+def detect_categories_batch(products: List[tuple]) -> List[str]:
+    """
+    Detect category cho nhiều SP (VD: cả catalog SKU)
+    
+    Args:
+        products: List (product_type, price)
+    """
+    return [
+        detect_product_category(product_type, price, labels=labels)
+        for (product_type, price), labels in zip(
+            products, CATEGORY_CLASSIFIER.classify_many(p[0] for p in products)
+        )
+    ]
+
+
 class PromptEngine:
     """Engine để generate prompts tùy chỉnh"""
     
-    def __init__(self):
+    def __init__(self, registry=None):
+        """
+        Args:
+            registry: TemplateRegistry (None = chỉ dùng PRODUCT_TEMPLATES built-in)
+        """
+        from .template_registry import TemplateRegistry
+        
         self.system_prompt = SYSTEM_PROMPT
-        self.templates = PRODUCT_TEMPLATES
+        self.registry = registry or TemplateRegistry()
+    
+    @property
+    def templates(self) -> dict:
+        """Templates đang dùng (built-in + Firebase)"""
+        return self.registry.templates()
     
     def get_full_prompt(self, product_info: dict) -> str:
         """Tạo prompt đầy đủ cho một sản phẩm"""
+        enhanced_prompt = f"""
+{self.system_prompt}
+
+{self.get_product_hints(product_info)}"""
+        return enhanced_prompt
+    
+    def get_product_hints(self, product_info: dict) -> str:
+        """Phần gợi ý riêng của 1 sản phẩm (template theo category + visual style theo loại)"""
         category = detect_product_category(
             product_info.get('type', ''),
             product_info.get('price', '')
         )
-        template = self.templates.get(category, self.templates["fashion"])
+        template = self.registry.get(category)
         
-        enhanced_prompt = f"""
-{self.system_prompt}
-
-=== GỢI Ý CHO SẢN PHẨM NÀY ===
-Category detected: {category.upper()}
-Visual keywords gợi ý: {', '.join(template['visual_keywords'])}
-Lighting gợi ý: {template['lighting']}
-Mood gợi ý: {template['mood']}
-Music vibe phù hợp: {', '.join(template['music_vibe'])}
-
-Hook patterns hay cho loại này:
-{chr(10).join(f'- {h}' for h in template['hook_patterns'])}
-"""
-        return enhanced_prompt
+        kind = detect_product_kind(product_info.get('type', ''))
+        visual_style = get_taxonomy().visual_style(kind) if kind else ""
+        
+        return f"""=== GỢI Ý CHO SẢN PHẨM NÀY ===
+{template.hints_head}Visual style theo loại SP: {visual_style or 'Tự chọn theo ảnh'}
+{template.hints_tail}"""
     
     def get_category(self, product_type: str, price: str = "") -> str:
         """Wrapper cho detect_product_category"""
@@ -0,0 +1,178 @@
+"""
+Template Registry
+Quản lý prompt templates theo category: built-in (PRODUCT_TEMPLATES) + templates lưu trên Firebase
+
+- Template Firebase ghi đè (theo từng field) lên template built-in cùng tên
+- Mỗi template được validate + compile 1 lần, cache theo (tên, version)
+- Templates Firebase được lưu local để lần khởi động sau dùng ngay (kể cả khi offline)
+- Hot-swap: nguồn thay đổi -> compile lại template đổi version, không cần restart
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from services.local_store import DATA_DIR, get_store
+from .prompt_engine import PRODUCT_TEMPLATES
+
+TEMPLATE_CACHE_PATH = os.path.join(DATA_DIR, "prompt_templates_cache.json")
+
+REQUIRED_FIELDS = {
+    "visual_keywords": list,
+    "lighting": str,
+    "mood": str,
+    "music_vibe": list,
+    "hook_patterns": list,
+}
+
+
+class TemplateError(ValueError):
+    """Template không hợp lệ"""
+
+
+class CompiledTemplate:
+    """Template đã validate, các đoạn gợi ý trong prompt được render sẵn"""
+
+    def __init__(self, name: str, data: dict, version: str):
+        for field, field_type in REQUIRED_FIELDS.items():
+            if not isinstance(data.get(field), field_type):
+                raise TemplateError(f"Template '{name}': thiếu hoặc sai kiểu field '{field}'")
+        if not data["hook_patterns"]:
+            raise TemplateError(f"Template '{name}': hook_patterns rỗng")
+
+        self.name = name
+        self.version = version
+        self.data = data
+        self.music_vibe = list(data["music_vibe"])
+
+        # Render sẵn phần gợi ý (trước / sau dòng visual style theo loại SP)
+        self.hints_head = (
+            f"Category detected: {name.upper()}\n"
+            f"Visual keywords gợi ý: {', '.join(data['visual_keywords'])}\n"
+        )
+        self.hints_tail = (
+            f"Lighting gợi ý: {data['lighting']}\n"
+            f"Mood gợi ý: {data['mood']}\n"
+            f"Music vibe phù hợp: {', '.join(data['music_vibe'])}\n"
+            f"\n"
+            f"Hook patterns hay cho loại này:\n"
+            + "\n".join(f"- {h}" for h in data["hook_patterns"])
+            + "\n"
+        )
+
+
+def _template_version(data: dict) -> str:
+    """Version do người sửa đặt (field "version"), không có thì dùng hash nội dung"""
+    if data.get("version") is not None:
+        return str(data["version"])
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+class TemplateRegistry:
+    """Registry templates đã compile, tự cập nhật khi nguồn Firebase thay đổi"""
+
+    REFRESH_INTERVAL = 5.0  # giây giữa các lần kiểm tra nguồn
+
+    def __init__(self, source: Optional[Callable[[], dict]] = None):
+        """
+        Args:
+            source: Hàm trả về templates từ Firebase (VD: FirebaseDB.get_prompt_templates)
+        """
+        self.source = source
+        self.store = get_store(TEMPLATE_CACHE_PATH)
+        self._lock = threading.Lock()
+        self._compiled: Dict[tuple, CompiledTemplate] = {}
+        self._active: Dict[str, CompiledTemplate] = {}
+        self._remote = None
+        self._last_refresh = 0.0
+        self.version = ""
+
+        # Khởi động từ bản lưu local, rồi mới hỏi Firebase
+        self._applied = self.store.read(default={}) or {}
+        self._apply(self._applied)
+        self.refresh(force=True)
+
+    # ============ PUBLIC ============
+    def get(self, category: str) -> CompiledTemplate:
+        """Template đã compile cho category (không có thì dùng fashion)"""
+        self.refresh()
+        active = self._active
+        return active.get(category) or active["fashion"]
+
+    def templates(self) -> Dict[str, dict]:
+        """Dữ liệu raw của các template đang dùng"""
+        self.refresh()
+        return {name: compiled.data for name, compiled in self._active.items()}
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Kiểm tra nguồn Firebase, compile + swap nếu có thay đổi
+        (nguồn lỗi / trống không ghi đè bộ template đã cache)
+
+        Returns:
+            True nếu bộ template đang dùng đã thay đổi
+        """
+        if self.source is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.REFRESH_INTERVAL:
+            return False
+        self._last_refresh = now
+
+        try:
+            remote = self.source()
+        except Exception as e:
+            print(f"Error loading prompt templates: {e}")
+            return False
+        # None = đọc lỗi (VD offline) -> giữ bộ template đang dùng
+        if remote is None:
+            return False
+        # Mirror trả cùng object khi không đổi -> bỏ qua nhanh
+        if remote is self._remote:
+            return False
+        self._remote = remote
+        # Nguồn trống không đè bản cache đang có dữ liệu
+        if not remote and self._applied:
+            return False
+
+        old_version = self.version
+        self._apply(remote)
+        self._applied = remote
+        if self.version != old_version:
+            self.store.write(remote)
+            return True
+        return False
+
+    # ============ INTERNAL ============
+    def _apply(self, remote: dict):
+        active = {}
+        for name in list(PRODUCT_TEMPLATES) + [n for n in remote if n not in PRODUCT_TEMPLATES]:
+            override = remote.get(name)
+            data = dict(PRODUCT_TEMPLATES.get(name, {}))
+            if isinstance(override, dict):
+                data.update(override)
+            compiled = self._compile(name, data)
+            if compiled is None and name in PRODUCT_TEMPLATES:
+                compiled = self._compile(name, dict(PRODUCT_TEMPLATES[name]))
+            if compiled is not None:
+                active[name] = compiled
+
+        with self._lock:
+            self._active = active
+            self.version = "|".join(f"{n}:{c.version}" for n, c in sorted(active.items()))
+
+    def _compile(self, name: str, data: dict) -> Optional[CompiledTemplate]:
+        version = _template_version(data)
+        key = (name, version)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            try:
+                compiled = CompiledTemplate(name, data, version)
+            except TemplateError as e:
+                print(f"⚠️ {e} - bỏ qua")
+                return None
+            self._compiled[key] = compiled
+        return compiled
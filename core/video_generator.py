@@ -9,6 +9,8 @@ import requests
 from typing import Optional, Dict, Tuple
 from datetime import datetime
 
+from services.telemetry import span
+
 # Google Auth
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
@@ -19,6 +21,9 @@ class VideoGenerator:
     Generate video using Google Veo 3.0 via Vertex AI
     """
     
+    POLL_INTERVAL = 10  # giây giữa các lần poll operation
+    RETRY_INTERVAL = 5  # giây chờ khi poll lỗi
+    
     def __init__(self):
         self.credentials = None
         self.project_id = os.getenv("GOOGLE_CLOUD_PROJECT", "")
@@ -38,7 +43,8 @@ class VideoGenerator:
                 )
         
         # Veo 3.0 endpoint
-        self.base_url = f"https://{self.region}-aiplatform.googleapis.com/v1"
+        # VERTEX_API_ENDPOINT: đổi endpoint (proxy / fake server của benchmarks)
+        self.base_url = os.getenv("VERTEX_API_ENDPOINT") or f"https://{self.region}-aiplatform.googleapis.com/v1"
         self.model = "veo-2.0-generate-001"  # Veo model
         
     def _get_access_token(self) -> Optional[str]:
@@ -106,12 +112,13 @@ class VideoGenerator:
             }
             
             # Start video generation (async operation)
-            response = requests.post(
-                self._get_endpoint(),
-                headers=self._get_headers(),
-                json=payload,
-                timeout=30
-            )
+            with span("veo.submit", duration_seconds=duration_seconds, aspect_ratio=aspect_ratio):
+                response = requests.post(
+                    self._get_endpoint(),
+                    headers=self._get_headers(),
+                    json=payload,
+                    timeout=30
+                )
             
             if response.status_code != 200:
                 error_msg = response.json().get("error", {}).get("message", response.text)
@@ -125,7 +132,9 @@ class VideoGenerator:
                 return False, "Không nhận được operation ID", None
             
             # Poll for completion
-            video_data = self._poll_operation(operation_name)
+            with span("veo.poll") as attrs:
+                video_data = self._poll_operation(operation_name)
+                attrs["success"] = bool(video_data)
             
             if not video_data:
                 return False, "Timeout hoặc lỗi khi tạo video", None
@@ -175,7 +184,7 @@ class VideoGenerator:
                 )
                 
                 if response.status_code != 200:
-                    time.sleep(5)
+                    time.sleep(self.RETRY_INTERVAL)
                     continue
                 
                 result = response.json()
@@ -194,11 +203,11 @@ class VideoGenerator:
                     return None
                 
                 # Still processing, wait and retry
-                time.sleep(10)
+                time.sleep(self.POLL_INTERVAL)
                 
             except Exception as e:
                 print(f"Poll error: {e}")
-                time.sleep(5)
+                time.sleep(self.RETRY_INTERVAL)
         
         return None  # Timeout
     
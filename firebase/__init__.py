@@ -1,5 +1,22 @@
 # Firebase module
-from .config import get_firebase_config
-from .db_service import FirebaseDB
+# Import lazy: requests / thread SSE chỉ được load khi dùng Firebase lần đầu
+import importlib
 
-__all__ = ['get_firebase_config', 'FirebaseDB']
+_EXPORTS = {
+    'get_firebase_config': '.config',
+    'FirebaseDB': '.db_service',
+    'RTDBClient': '.rest_client',
+    'get_rest_client': '.rest_client',
+    'HistoryWriter': '.history_writer',
+    'get_history_writer': '.history_writer',
+    'StreamMirror': '.stream_mirror',
+    'get_stream_mirror': '.stream_mirror',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,281 @@
+"""
+Analytics Export
+Export generation_history / post_history / post_metrics ra file cột (Parquet hoặc Arrow IPC)
+để phân tích local, chia partition theo ngày
+
+- Đọc từng trang theo key (orderBy=$key) -> không tải cả node 1 lần
+- Flatten các field hay dùng (category, nhạc, hashtags, hook pattern, metrics)
+- Incremental: lưu watermark (key cuối đã export) cho từng node. Key generation được sinh lúc
+  enqueue nên record từ spool replay muộn có thể nằm dưới watermark -> mỗi lần đọc lùi lại
+  EXPORT_OVERLAP_HOURS (mặc định 72h) và bỏ các key đã export trong cửa sổ đó
+- Schema cố định cho từng dataset (không để Arrow tự suy kiểu -> partition lệch schema);
+  record thiếu / sai ngày vào partition date=unknown
+- Post cũ không được export lại khi metrics đổi - dùng dataset post_metrics (snapshot theo thời gian)
+
+Chạy: python -m firebase.analytics_export --out outputs/analytics [--format parquet|arrow] [--full]
+"""
+import os
+import re
+import shutil
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from services.local_store import get_store
+
+from .history_writer import push_id_prefix, push_id_time
+
+PAGE_SIZE = 1000
+FLUSH_ROWS = 50_000
+OVERLAP_MS = int(float(os.getenv("EXPORT_OVERLAP_HOURS", "72")) * 3600 * 1000)
+UNKNOWN_DATE = "unknown"
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Hook patterns viral (theo SYSTEM_PROMPT) -> tên pattern
+HOOK_PATTERNS = [
+    ("pov", re.compile(r"^\s*pov\b", re.IGNORECASE)),
+    ("dung_neu", re.compile(r"^\s*đừng\b", re.IGNORECASE)),
+    ("ai_cho_phep", re.compile(r"ai cho phép", re.IGNORECASE)),
+    ("price", re.compile(r"\d+\s*(k|tr|triệu|đ|vnd)\b", re.IGNORECASE)),
+    ("question", re.compile(r"\?\s*$")),
+]
+
+
+def hook_pattern(hook: str) -> str:
+    """Phân loại hook theo pattern viral"""
+    for name, pattern in HOOK_PATTERNS:
+        if pattern.search(hook or ""):
+            return name
+    return "other"
+
+
+def partition_date(timestamp) -> str:
+    """YYYY-MM-DD từ timestamp ISO; thiếu / sai định dạng -> UNKNOWN_DATE"""
+    date = str(timestamp or "")[:10]
+    return date if _DATE_RE.match(date) else UNKNOWN_DATE
+
+
+# ============ FLATTEN ============
+def flatten_generation(key: str, item: dict) -> dict:
+    output = item.get("output") or {}
+    metadata = output.get("_metadata") or {}
+    hashtags = output.get("hashtags") or []
+    music = output.get("music")
+    timestamp = item.get("timestamp", "")
+    return {
+        "id": key,
+        "timestamp": timestamp,
+        "date": partition_date(timestamp),
+        "product_type": item.get("product_type", ""),
+        "category": item.get("category") or metadata.get("category", ""),
+        "num_images": int(item.get("num_images") or metadata.get("num_images") or 1),
+        "title": output.get("title", ""),
+        "hook": output.get("hook", ""),
+        "hook_pattern": hook_pattern(output.get("hook", "")),
+        "hashtags": [str(h) for h in hashtags],
+        "num_hashtags": len(hashtags),
+        "music_name": music.get("name", "") if isinstance(music, dict) else "",
+        "visual_prompt_len": len(output.get("visual_prompt", "")),
+        "caption_len": len(output.get("caption", "")),
+    }
+
+
+def flatten_post(key: str, item: dict) -> dict:
+    metrics = item.get("metrics") or {}
+    posted_at = item.get("posted_at", "")
+    return {
+        "id": key,
+        "generation_id": item.get("generation_id", ""),
+        "posted_at": posted_at,
+        "date": partition_date(posted_at),
+        "platform": item.get("platform", ""),
+        "video_url": item.get("video_url", ""),
+        "views": int(metrics.get("views") or 0),
+        "likes": int(metrics.get("likes") or 0),
+        "comments": int(metrics.get("comments") or 0),
+        "shares": int(metrics.get("shares") or 0),
+        "metrics_updated_at": item.get("metrics_updated_at", ""),
+    }
+
+
+def flatten_metric_snapshot(key: str, item: dict) -> dict:
+    ts = item.get("ts", "")
+    row = {
+        "id": key,
+        "post_id": item.get("post_id", ""),
+        "ts": ts,
+        "date": partition_date(ts),
+    }
+    # Snapshot chỉ có field scrape được -> field thiếu để null, không phải 0
+    for field in ("views", "likes", "comments", "shares"):
+        row[field] = None if item.get(field) is None else int(item[field])
+    return row
+
+
+# Kiểu cột của từng dataset ("string" / "int64" / "list<string>")
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    "generations": {
+        "id": "string", "timestamp": "string", "date": "string", "product_type": "string",
+        "category": "string", "num_images": "int64", "title": "string", "hook": "string",
+        "hook_pattern": "string", "hashtags": "list<string>", "num_hashtags": "int64",
+        "music_name": "string", "visual_prompt_len": "int64", "caption_len": "int64",
+    },
+    "posts": {
+        "id": "string", "generation_id": "string", "posted_at": "string", "date": "string",
+        "platform": "string", "video_url": "string", "views": "int64", "likes": "int64",
+        "comments": "int64", "shares": "int64", "metrics_updated_at": "string",
+    },
+    "post_metrics": {
+        "id": "string", "post_id": "string", "ts": "string", "date": "string",
+        "views": "int64", "likes": "int64", "comments": "int64", "shares": "int64",
+    },
+}
+
+# node -> (thư mục output, hàm flatten)
+EXPORTS: Dict[str, Tuple[str, Callable[[str, dict], dict]]] = {
+    "generation_history": ("generations", flatten_generation),
+    "post_history": ("posts", flatten_post),
+    "post_metrics": ("post_metrics", flatten_metric_snapshot),
+}
+
+
+def arrow_schema(subdir: str):
+    import pyarrow as pa
+
+    types = {"string": pa.string(), "int64": pa.int64(), "list<string>": pa.list_(pa.string())}
+    return pa.schema([(name, types[kind]) for name, kind in SCHEMAS[subdir].items()])
+
+
+def _read_watermark(value) -> Tuple[Optional[str], List[str]]:
+    """(key cuối, các key đã export trong cửa sổ overlap); watermark cũ chỉ là key string"""
+    if isinstance(value, dict):
+        return value.get("key"), list(value.get("recent") or [])
+    return value, []
+
+
+class AnalyticsExporter:
+    """Export incremental các node RTDB ra dataset cột chia partition theo ngày"""
+
+    def __init__(self, client, out_dir: str, file_format: str = "parquet"):
+        """
+        Args:
+            client: RTDBClient
+            out_dir: Thư mục gốc của dataset
+            file_format: "parquet" hoặc "arrow" (Arrow IPC / Feather v2)
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Cần cài pyarrow để export analytics: pip install pyarrow")
+
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError(f"Format không hỗ trợ: {file_format}")
+
+        self.client = client
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.watermarks = get_store(os.path.join(out_dir, "_watermarks.json"))
+
+    def iter_pages(self, node: str, after_key: Optional[str] = None) -> Iterator[List[Tuple[str, dict]]]:
+        """Đọc node theo từng trang (key tăng dần), bắt đầu sau after_key"""
+        cursor = after_key
+        while True:
+            params = {"orderBy": "$key", "limitToFirst": PAGE_SIZE + (1 if cursor else 0)}
+            if cursor:
+                params["startAt"] = cursor
+            data = self.client.get(node, **params) or {}
+            items = sorted((k, v) for k, v in data.items() if k != cursor and isinstance(v, dict))
+            if not items:
+                return
+            yield items
+            cursor = items[-1][0]
+            if len(items) < PAGE_SIZE:
+                return
+
+    def export_node(self, node: str, full: bool = False) -> int:
+        """
+        Export 1 node (incremental từ watermark, trừ khi full=True)
+
+        Returns:
+            Số dòng đã ghi
+        """
+        subdir, flatten = EXPORTS[node]
+        watermarks = dict(self.watermarks.read(default={}) or {})
+        last_key, recent = (None, []) if full else _read_watermark(watermarks.get(node))
+        if full:
+            shutil.rmtree(os.path.join(self.out_dir, subdir), ignore_errors=True)
+
+        # Đọc lùi OVERLAP_MS trước watermark, bỏ key đã export (record replay muộn từ spool)
+        start_key = last_key
+        last_time = push_id_time(last_key) if last_key else None
+        if last_time is not None:
+            start_key = push_id_prefix(max(0, last_time - OVERLAP_MS))
+        exported = set(recent)
+
+        run_id = uuid.uuid4().hex[:8]
+        rows, total, part = [], 0, 0
+        for page in self.iter_pages(node, start_key):
+            for key, item in page:
+                if key in exported:
+                    continue
+                rows.append(flatten(key, item))
+                exported.add(key)
+            if last_key is None or page[-1][0] > last_key:
+                last_key = page[-1][0]
+            if len(rows) >= FLUSH_ROWS:
+                self._write(subdir, rows, f"{run_id}-{part}")
+                total += len(rows)
+                rows, part = [], part + 1
+        if rows:
+            self._write(subdir, rows, f"{run_id}-{part}")
+            total += len(rows)
+
+        if last_key and (total or full or watermarks.get(node) != last_key):
+            # Chỉ giữ key còn nằm trong cửa sổ overlap của lần export sau
+            last_time = push_id_time(last_key)
+            cutoff = last_time - OVERLAP_MS if last_time is not None else None
+            watermarks[node] = {
+                "key": last_key,
+                "recent": sorted(
+                    k for k in exported
+                    if cutoff is not None and (push_id_time(k) or 0) >= cutoff
+                ),
+            }
+            self.watermarks.write(watermarks)
+        return total
+
+    def export_all(self, full: bool = False) -> Dict[str, int]:
+        return {node: self.export_node(node, full) for node in EXPORTS}
+
+    def _write(self, subdir: str, rows: List[dict], part_id: str):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        table = pa.Table.from_pylist(rows, schema=arrow_schema(subdir))
+        ds.write_dataset(
+            table,
+            os.path.join(self.out_dir, subdir),
+            format="parquet" if self.file_format == "parquet" else "ipc",
+            partitioning=["date"],
+            partitioning_flavor="hive",
+            basename_template=f"part-{part_id}-{{i}}.{'parquet' if self.file_format == 'parquet' else 'arrow'}",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from firebase.config import get_firebase_config
+    from firebase.rest_client import get_rest_client
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Export lịch sử + metrics ra Parquet / Arrow")
+    parser.add_argument("--out", default="outputs/analytics", help="Thư mục output")
+    parser.add_argument("--format", default="parquet", choices=["parquet", "arrow"])
+    parser.add_argument("--full", action="store_true", help="Xóa dataset cũ, export lại từ đầu")
+    args = parser.parse_args()
+
+    exporter = AnalyticsExporter(get_rest_client(get_firebase_config()["databaseURL"]), args.out, args.format)
+    for node, count in exporter.export_all(args.full).items():
+        print(f"📊 {node}: {count} dòng")
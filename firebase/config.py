@@ -1,6 +1,6 @@
 """
 Firebase Configuration
-Sử dụng Pyrebase4 để kết nối với Firebase Realtime Database
+Config kết nối Firebase Realtime Database (REST)
 """
 import os
 from dotenv import load_dotenv
@@ -1,25 +1,35 @@
 """
 Firebase Database Service
-CRUD operations cho Realtime Database
+CRUD operations cho Realtime Database (qua REST client có connection pool)
 """
-import pyrebase
 from datetime import datetime
+from typing import List
 from .config import get_firebase_config
+from .rest_client import get_rest_client
+from .stream_mirror import get_stream_mirror
+from .history_writer import build_generation, generate_push_id, generation_paths, get_history_writer
 
 
 class FirebaseDB:
-    def __init__(self):
+    def __init__(self, stream: bool = False):
+        """
+        Args:
+            stream: True = giữ mirror in-memory của music_trending / prompt_templates
+                    qua streaming (SSE), các lần đọc sau không tốn round-trip
+        """
         config = get_firebase_config()
-        self.firebase = pyrebase.initialize_app(config)
-        self.db = self.firebase.database()
+        self.db = get_rest_client(config.get("databaseURL"))
+        self.mirror = get_stream_mirror(self.db) if stream else None
     
     # ============ MUSIC TRENDING ============
     def get_music_trending(self):
         """Lấy danh sách nhạc trending từ Firebase"""
+        if self.mirror and self.mirror.is_ready("music_trending"):
+            return self.mirror.get("music_trending")
         try:
-            data = self.db.child("music_trending").get()
-            if data.val():
-                return data.val()
+            data = self.db.get("music_trending")
+            if data:
+                return data
             return None
         except Exception as e:
             print(f"Error getting music trending: {e}")
@@ -33,7 +43,7 @@ class FirebaseDB:
                 "source": "tiktok_scraper",
                 "songs": songs
             }
-            self.db.child("music_trending").set(data)
+            self.db.set("music_trending", data)
             return True
         except Exception as e:
             print(f"Error updating music trending: {e}")
@@ -42,9 +52,9 @@ class FirebaseDB:
     def is_music_cache_valid(self, max_hours=24):
         """Kiểm tra cache nhạc còn hợp lệ không"""
         try:
-            data = self.db.child("music_trending").child("last_updated").get()
-            if data.val():
-                last_updated = datetime.fromisoformat(data.val())
+            last_updated = self.db.get("music_trending/last_updated")
+            if last_updated:
+                last_updated = datetime.fromisoformat(last_updated)
                 hours_diff = (datetime.now() - last_updated).total_seconds() / 3600
                 return hours_diff < max_hours
             return False
@@ -55,30 +65,96 @@ class FirebaseDB:
     def save_generation(self, data: dict):
         """Lưu lịch sử generate content"""
         try:
-            generation = {
-                "timestamp": datetime.now().isoformat(),
-                "product_type": data.get("product_type", "unknown"),
-                "price": data.get("price", ""),
-                "notes": data.get("notes", ""),
-                "output": data.get("output", {}),
-                "status": "completed"
-            }
-            result = self.db.child("generation_history").push(generation)
-            return result.get("name", None)
+            key = generate_push_id()
+            self.db.update("", generation_paths(key, build_generation(data)))
+            return key
         except Exception as e:
             print(f"Error saving generation: {e}")
             return None
     
-    def get_generation_history(self, limit=20):
-        """Lấy lịch sử generate gần đây"""
+    def save_generation_async(self, data: dict):
+        """Lưu lịch sử qua write-behind queue (gom batch, không chặn UI)"""
+        return get_history_writer(self.db).enqueue(data)
+    
+    def get_generation_history(self, limit=20, product_type=None, category=None):
+        """Lấy lịch sử generate gần đây (cũ -> mới)"""
+        page = self.query_generation_history(limit, product_type=product_type, category=category)
+        return list(reversed(page["items"]))
+    
+    def query_generation_history(
+        self,
+        limit: int = 20,
+        cursor: dict = None,
+        product_type: str = None,
+        category: str = None,
+        summary: bool = False
+    ) -> dict:
+        """
+        Query lịch sử có index + phân trang (mới -> cũ)
+        
+        Args:
+            limit: Số item mỗi trang
+            cursor: next_cursor của trang trước (None = trang đầu)
+            product_type / category: Lọc server-side (dùng index ghép type_ts / category_ts)
+            summary: True = đọc generation_index (không có output) cho list view
+            
+        Returns:
+            {"items": [...], "next_cursor": dict hoặc None}; mỗi item có thêm "id"
+        """
+        if product_type:
+            order_by, prefix = "type_ts", f"{product_type}|"
+        elif category:
+            order_by, prefix = "category_ts", f"{category}|"
+        else:
+            order_by, prefix = "timestamp", ""
+        
+        # endAt chỉ nhận value (REST không có tham số key) -> lấy dư rồi lọc theo (value, key):
+        # +1 để biết còn trang sau, +1 cho chính item ở cursor
+        params = {"orderBy": order_by, "limitToLast": limit + (2 if cursor else 1)}
+        if cursor:
+            params["endAt"] = cursor["value"]
+        elif prefix:
+            params["endAt"] = prefix + "\uf8ff"
+        if prefix:
+            params["startAt"] = prefix
+        
+        node = "generation_index" if summary else "generation_history"
         try:
-            data = self.db.child("generation_history").order_by_child("timestamp").limit_to_last(limit).get()
-            if data.val():
-                return list(data.val().values())
-            return []
+            data = self.db.get(node, **params) or {}
         except Exception as e:
             print(f"Error getting history: {e}")
-            return []
+            return {"items": [], "next_cursor": None}
+        
+        items = sorted(
+            ((item.get(order_by) or "", key, item) for key, item in data.items()),
+            reverse=True
+        )
+        if cursor:
+            boundary = (cursor["value"], cursor["key"])
+            items = [entry for entry in items if (entry[0], entry[1]) < boundary]
+        
+        page = items[:limit]
+        next_cursor = None
+        if len(items) > limit and page:
+            next_cursor = {"value": page[-1][0], "key": page[-1][1]}
+        
+        return {
+            "items": [dict(item, id=key) for _, key, item in page],
+            "next_cursor": next_cursor
+        }
+    
+    def get_generation(self, generation_id: str):
+        """Lấy 1 record lịch sử đầy đủ (kèm output)"""
+        try:
+            return self.db.get(f"generation_history/{generation_id}")
+        except Exception as e:
+            print(f"Error getting generation: {e}")
+            return None
+    
+    def get_generations(self, generation_ids: List[str]) -> dict:
+        """Lấy nhiều record lịch sử đầy đủ song song (1 lượt round-trip); id lỗi -> None"""
+        paths = [f"generation_history/{generation_id}" for generation_id in generation_ids]
+        return dict(zip(generation_ids, self.db.get_many(paths)))
     
     # ============ POST HISTORY ============
     def save_post(self, generation_id: str, platform: str, video_url: str):
@@ -92,10 +168,13 @@ class FirebaseDB:
                 "metrics": {
                     "views": 0,
                     "likes": 0,
-                    "comments": 0
-                }
+                    "comments": 0,
+                    "shares": 0
+                },
+                # Được MetricsIngestor cập nhật định kỳ khi còn true
+                "metrics_active": True
             }
-            self.db.child("post_history").push(post)
+            self.db.push("post_history", post)
             return True
         except Exception as e:
             print(f"Error saving post: {e}")
@@ -103,19 +182,24 @@ class FirebaseDB:
     
     # ============ PROMPT TEMPLATES ============
     def get_prompt_templates(self):
-        """Lấy prompt templates đã lưu"""
+        """Lấy prompt templates đã lưu ({} nếu node trống, None nếu lỗi đọc)"""
+        if self.mirror and self.mirror.is_ready("prompt_templates"):
+            # Trả nguyên object của mirror -> registry nhận ra dữ liệu không đổi (so sánh `is`)
+            templates = self.mirror.get("prompt_templates")
+            return {} if templates is None else templates
         try:
-            data = self.db.child("prompt_templates").get()
-            if data.val():
-                return data.val()
-            return {}
-        except:
+            data = self.db.get("prompt_templates")
+            if data:
+                return data
             return {}
+        except Exception as e:
+            print(f"Error getting prompt templates: {e}")
+            return None
     
     def save_prompt_template(self, name: str, template: dict):
         """Lưu prompt template mới"""
         try:
-            self.db.child("prompt_templates").child(name).set(template)
+            self.db.set(f"prompt_templates/{name}", template)
             return True
         except:
             return False
@@ -0,0 +1,324 @@
+"""
+History Writer
+Ghi lịch sử generate kiểu write-behind: không chặn UI, gom batch rồi mới gửi Firebase
+
+- Queue in-memory có giới hạn, 1 thread nền flush theo batch bằng multi-path update()
+  (ghi generation_history + bản tóm tắt generation_index trong cùng 1 request)
+- Mất mạng / chưa cấu hình Firebase -> ghi vào spool local (append-only JSONL), giới hạn
+  HISTORY_SPOOL_MAX_MB: vượt ngưỡng thì bỏ các record cũ nhất (máy không dùng Firebase không phình mãi)
+- Kết nối lại -> replay spool lên Firebase rồi xóa
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from services.local_store import DATA_DIR
+from services.telemetry import span
+
+SPOOL_PATH = os.path.join(DATA_DIR, "history_spool.jsonl")
+SPOOL_MAX_BYTES = int(float(os.getenv("HISTORY_SPOOL_MAX_MB", "20")) * 1024 * 1024)
+
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand = [0] * 12
+
+
+def push_id_prefix(ms: int) -> str:
+    """8 ký tự thời gian đầu của push id tại thời điểm ms (dùng làm startAt theo thời gian)"""
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(_PUSH_CHARS[ms % 64])
+        ms //= 64
+    return "".join(reversed(time_chars))
+
+
+def push_id_time(key: str) -> Optional[int]:
+    """Thời điểm (ms) tạo push id; None nếu key không phải push id"""
+    if len(key) != 20 or any(c not in _PUSH_CHARS for c in key):
+        return None
+    ms = 0
+    for c in key[:8]:
+        ms = ms * 64 + _PUSH_CHARS.index(c)
+    return ms
+
+
+def generate_push_id() -> str:
+    """Sinh key giống Firebase push() (sắp xếp theo thời gian) để ghi bằng update()"""
+    global _last_push_time
+    with _push_lock:
+        now = int(time.time() * 1000)
+        duplicate = now == _last_push_time
+        _last_push_time = now
+        key = push_id_prefix(now)
+
+        if not duplicate:
+            for i in range(12):
+                _last_rand[i] = random.randrange(64)
+        else:
+            # Cùng ms -> tăng phần random để key vẫn tăng dần
+            i = 11
+            while i >= 0 and _last_rand[i] == 63:
+                _last_rand[i] = 0
+                i -= 1
+            if i >= 0:
+                _last_rand[i] += 1
+        return key + "".join(_PUSH_CHARS[r] for r in _last_rand)
+
+
+def build_generation(data: dict) -> dict:
+    """Record lịch sử generate theo schema của node generation_history"""
+    output = data.get("output", {}) or {}
+    timestamp = data.get("timestamp") or datetime.now().isoformat()
+    product_type = data.get("product_type", "unknown")
+    category = data.get("category") or output.get("_metadata", {}).get("category", "")
+    return {
+        "timestamp": timestamp,
+        "product_type": product_type,
+        "category": category,
+        # Index ghép "<filter>|<timestamp>" để vừa lọc vừa sắp theo thời gian
+        "type_ts": f"{product_type}|{timestamp}",
+        "category_ts": f"{category}|{timestamp}",
+        "price": data.get("price", ""),
+        "notes": data.get("notes", ""),
+        "num_images": data.get("num_images", 1),
+        "output": output,
+        "status": "completed"
+    }
+
+
+def build_summary(record: dict) -> dict:
+    """Bản tóm tắt (không có output) cho node generation_index - dùng cho list view"""
+    output = record.get("output", {}) or {}
+    summary = {
+        field: record.get(field)
+        for field in ("timestamp", "product_type", "category", "type_ts", "category_ts", "num_images")
+    }
+    summary["title"] = output.get("title", "")
+    summary["music"] = (output.get("music") or {}).get("name", "")
+    return summary
+
+
+def generation_paths(key: str, record: dict) -> dict:
+    """Multi-path update ghi record đầy đủ + bản tóm tắt trong 1 request"""
+    return {
+        f"generation_history/{key}": record,
+        f"generation_index/{key}": build_summary(record),
+    }
+
+
+class HistoryWriter:
+    """Sink ghi lịch sử generate bất đồng bộ, theo batch"""
+
+    MAX_QUEUE = 1000
+    BATCH_SIZE = 50
+    FLUSH_INTERVAL = 2.0  # giây
+    RETRY_INTERVAL = 30.0  # giây giữa các lần thử replay spool
+
+    def __init__(self, client=None, spool_path: str = SPOOL_PATH, spool_max_bytes: int = SPOOL_MAX_BYTES):
+        """
+        Args:
+            client: RTDBClient (None = chỉ ghi spool local)
+            spool_path: File JSONL lưu các record chưa gửi được
+            spool_max_bytes: Dung lượng tối đa của spool
+        """
+        self.client = client
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.MAX_QUEUE)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_replay_attempt = 0.0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ============ PUBLIC ============
+    def enqueue(self, data: dict) -> str:
+        """
+        Đưa 1 record vào hàng đợi (không chặn)
+
+        Returns:
+            Key của record trong generation_history
+        """
+        key = generate_push_id()
+        item = (key, build_generation(data))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Queue đầy -> ghi thẳng spool, lần flush sau sẽ replay
+            self._spool([item])
+        return key
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Chờ mọi record đã enqueue được ghi xong (kể cả batch thread nền đang ghi)
+
+        Returns:
+            False nếu hết timeout mà vẫn còn record chưa xử lý
+        """
+        deadline = time.monotonic() + timeout
+        done = self._queue.all_tasks_done
+        with done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                done.wait(remaining)
+        return True
+
+    def close(self):
+        """Dừng thread nền, flush nốt phần còn lại"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+
+    @property
+    def pending(self) -> int:
+        """Số record đang chờ trong queue"""
+        return self._queue.qsize()
+
+    # ============ BACKGROUND ============
+    def _run(self):
+        while True:
+            batch = self._drain()
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            elif self._stop.is_set():
+                return
+            self._maybe_replay()
+
+    def _drain(self) -> List[tuple]:
+        """Lấy tối đa BATCH_SIZE record, chờ tối đa FLUSH_INTERVAL cho record đầu"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.FLUSH_INTERVAL))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[tuple]) -> bool:
+        """1 multi-path update cho cả batch; lỗi -> ghi spool"""
+        if self.client is None:
+            self._spool(batch)
+            return False
+        try:
+            with span("firebase.write", records=len(batch)):
+                self.client.update("", self._paths(batch))
+            return True
+        except Exception as e:
+            print(f"Error flushing history ({len(batch)} items): {e}")
+            self._spool(batch)
+            return False
+
+    @staticmethod
+    def _paths(batch) -> dict:
+        paths = {}
+        for key, record in batch:
+            paths.update(generation_paths(key, record))
+        return paths
+
+    # ============ SPOOL ============
+    def _spool(self, batch: List[tuple]):
+        lines = "".join(
+            json.dumps({"key": key, "record": record}, ensure_ascii=False) + "\n"
+            for key, record in batch
+        )
+        with self._spool_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+                with open(self.spool_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if os.path.getsize(self.spool_path) > self.spool_max_bytes:
+                    self._trim_spool()
+            except Exception as e:
+                print(f"❌ Lỗi ghi spool lịch sử: {e}")
+
+    def _trim_spool(self):
+        """Giữ các dòng mới nhất trong ~80% spool_max_bytes (gọi khi đang giữ _spool_lock)"""
+        with open(self.spool_path, "rb") as f:
+            lines = f.readlines()
+        kept, size = [], 0
+        for line in reversed(lines):
+            size += len(line)
+            if size > self.spool_max_bytes * 0.8:
+                break
+            kept.append(line)
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.writelines(reversed(kept))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.spool_path)
+        print(f"⚠️ Spool lịch sử vượt {self.spool_max_bytes / 1024 / 1024:.1f} MB, bỏ {len(lines) - len(kept)} record cũ nhất")
+
+    def _read_spool(self) -> Dict[str, dict]:
+        records = {}
+        with open(self.spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    records[entry["key"]] = entry["record"]
+                except (ValueError, KeyError):
+                    continue  # Dòng cuối bị cắt dở khi crash
+        return records
+
+    def _maybe_replay(self):
+        """Replay spool lên Firebase (giới hạn tần suất thử lại)"""
+        if self.client is None or not os.path.exists(self.spool_path):
+            return
+        now = time.monotonic()
+        if now - self._last_replay_attempt < self.RETRY_INTERVAL:
+            return
+        self._last_replay_attempt = now
+
+        with self._spool_lock:
+            try:
+                records = self._read_spool()
+            except Exception as e:
+                print(f"❌ Lỗi đọc spool lịch sử: {e}")
+                return
+            try:
+                keys = list(records)
+                for i in range(0, len(keys), self.BATCH_SIZE):
+                    chunk = keys[i:i + self.BATCH_SIZE]
+                    self.client.update("", self._paths((key, records[key]) for key in chunk))
+                os.remove(self.spool_path)
+                if records:
+                    print(f"💾 Đã replay {len(records)} lịch sử từ spool")
+            except Exception as e:
+                # Key cố định -> replay lại lần sau không tạo bản trùng
+                print(f"Error replaying history spool: {e}")
+
+
+_writer: Optional[HistoryWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer(client=None) -> HistoryWriter:
+    """HistoryWriter dùng chung trong process"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter(client)
+        elif client is not None and _writer.client is None:
+            _writer.client = client
+        return _writer
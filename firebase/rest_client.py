@@ -0,0 +1,148 @@
+"""
+Firebase Realtime Database REST Client
+Client REST gọn thay cho pyrebase: 1 session keep-alive dùng chung cho cả process
+
+- Connection pool (HTTPAdapter) + gzip
+- Timeout + retry với backoff cho lỗi mạng / 429 / 5xx
+- Gửi song song nhiều request qua thread pool có giới hạn
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RTDBClient:
+    """REST client cho Firebase Realtime Database"""
+
+    POOL_SIZE = 10
+    MAX_WORKERS = 6
+    TIMEOUT = (5, 20)  # (connect, read) giây
+    RETRIES = 3
+    BACKOFF = 0.5
+
+    def __init__(self, database_url: str, auth_token: Optional[str] = None):
+        if not database_url:
+            raise ValueError("FIREBASE_DATABASE_URL not found in .env")
+
+        self.database_url = database_url.rstrip("/")
+        self.auth_token = auth_token
+
+        retry = Retry(
+            total=self.RETRIES,
+            backoff_factor=self.BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # POST (push) không idempotent -> chỉ retry khi lỗi kết nối
+            allowed_methods=frozenset({"GET", "PUT", "PATCH", "DELETE"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.POOL_SIZE, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        })
+
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="rtdb")
+
+    # ============ LOW LEVEL ============
+    def _url(self, path: str) -> str:
+        return f"{self.database_url}/{path.strip('/')}.json"
+
+    def _params(self, params: Optional[Dict]) -> Dict:
+        query = {}
+        for key, value in (params or {}).items():
+            # orderBy / startAt / endAt / equalTo phải là giá trị JSON
+            query[key] = json.dumps(value) if key in ("orderBy", "startAt", "endAt", "equalTo") else value
+        if self.auth_token:
+            query["auth"] = self.auth_token
+        return query
+
+    def request(self, method: str, path: str, data: Any = None, params: Dict = None) -> Any:
+        """
+        Gửi 1 request tới RTDB
+
+        Returns:
+            JSON response đã parse (None nếu node trống)
+
+        Raises:
+            requests.RequestException khi lỗi mạng / HTTP sau khi đã retry
+        """
+        body = None
+        headers = None
+        if data is not None:
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            headers = {"Content-Type": "application/json"}
+
+        response = self.session.request(
+            method,
+            self._url(path),
+            params=self._params(params),
+            data=body,
+            headers=headers,
+            timeout=self.TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    # ============ CRUD ============
+    def get(self, path: str, **params) -> Any:
+        return self.request("GET", path, params=params)
+
+    def set(self, path: str, data: Any) -> Any:
+        return self.request("PUT", path, data=data)
+
+    def update(self, path: str, data: Dict) -> Any:
+        """PATCH - hỗ trợ multi-path update: {"a/b": 1, "c/d": 2}"""
+        return self.request("PATCH", path, data=data)
+
+    def push(self, path: str, data: Any) -> Optional[str]:
+        """POST - trả về key mới"""
+        result = self.request("POST", path, data=data)
+        return result.get("name") if result else None
+
+    def delete(self, path: str) -> None:
+        self.request("DELETE", path)
+
+    # ============ PIPELINING ============
+    def submit(self, method: str, path: str, data: Any = None, params: Dict = None):
+        """Gửi request trên thread pool, trả về Future"""
+        return self._executor.submit(self.request, method, path, data, params)
+
+    def get_many(self, paths: List[str]) -> List[Any]:
+        """
+        GET nhiều node song song (trên cùng connection pool)
+
+        Returns:
+            List kết quả theo thứ tự paths; node lỗi -> None
+        """
+        futures = [self.submit("GET", path) for path in paths]
+        results = []
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Error getting {path}: {e}")
+                results.append(None)
+        return results
+
+
+# ============ SHARED CLIENT ============
+_clients: Dict[str, RTDBClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_rest_client(database_url: str, auth_token: Optional[str] = None) -> RTDBClient:
+    """Client dùng chung trong process (giữ connection pool khi FirebaseDB bị tạo lại)"""
+    key = f"{database_url}|{auth_token or ''}"
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = RTDBClient(database_url, auth_token)
+        return _clients[key]
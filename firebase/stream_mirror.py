@@ -0,0 +1,266 @@
+"""
+Stream Mirror
+Giữ bản sao in-memory (dùng chung cả process) của các node ít thay đổi
+(music_trending, prompt_templates) qua RTDB streaming REST (Server-Sent Events)
+
+- Mỗi node 1 thread nền giữ kết nối SSE, áp dụng event put / patch tăng dần
+- Mất kết nối -> tự kết nối lại với backoff
+- Session mới đọc thẳng từ mirror: không tốn round-trip mạng
+"""
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+
+def apply_event(root: Any, path: str, data: Any, merge: bool = False) -> Any:
+    """
+    Áp dụng 1 event put/patch vào cây dữ liệu (copy-on-write)
+
+    Chỉ các node trên đường đi tới path được copy nông; nhánh không đổi dùng chung với cây cũ
+    -> reader đang giữ cây cũ không thấy thay đổi, event nhỏ không phải copy cả node lớn
+
+    Args:
+        root: Giá trị hiện tại của node (không bị sửa)
+        path: Path trong event ("/" = cả node)
+        data: Dữ liệu mới (None = xóa)
+        merge: True với event patch (mỗi key là path con tương đối, VD "songs/0/name")
+
+    Returns:
+        Cây mới sau khi áp dụng
+    """
+    parts = [p for p in path.split("/") if p]
+    if not merge:
+        return _update(root, parts, lambda _: data)
+    if not isinstance(data, dict) or not data:
+        return root
+    tree = _patch_tree(data)
+    return _update(root, parts, lambda node: _apply_tree(node, tree))
+
+
+class _Leaf:
+    """Giá trị cần ghi tại 1 path trong cây patch"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _patch_tree(data: dict) -> dict:
+    """{"songs/0/name": v, "last_updated": t} -> {"songs": {"0": {"name": Leaf}}, "last_updated": Leaf}"""
+    tree = {}
+    for key, value in data.items():
+        key_parts = [p for p in str(key).split("/") if p]
+        if not key_parts:
+            continue
+        branch = tree
+        for part in key_parts[:-1]:
+            child = branch.get(part)
+            if not isinstance(child, dict):
+                child = branch[part] = {}
+            branch = child
+        branch[key_parts[-1]] = _Leaf(value)
+    return tree
+
+
+def _apply_tree(node, tree: dict) -> Any:
+    """Ghi cả cây patch, mỗi node trên đường đi chỉ copy 1 lần"""
+    new_node = _writable(node, list(tree))
+    for key, branch in tree.items():
+        value = branch.value if isinstance(branch, _Leaf) else _apply_tree(_child(node, key), branch)
+        _set(new_node, key, value)
+    return new_node or None
+
+
+def _update(node, parts: List[str], update) -> Any:
+    """Bản sao của node với giá trị tại parts thay bằng update(giá trị cũ)"""
+    if not parts:
+        return update(node)
+    new_node = _writable(node, parts[:1])
+    _set(new_node, parts[0], _update(_child(node, parts[0]), parts[1:], update))
+    return new_node or None  # RTDB bỏ node rỗng
+
+
+def _writable(node, keys: List[str]):
+    """Bản sao nông để ghi các key con; list + key không phải số -> chuyển thành dict"""
+    if isinstance(node, dict):
+        return dict(node)
+    if isinstance(node, list):
+        if all(key.isdigit() for key in keys):
+            return list(node)
+        return {str(i): value for i, value in enumerate(node) if value is not None}
+    return {}
+
+
+def _child(node, key: str):
+    """Node con theo key (RTDB trả array cho các key 0..n)"""
+    if isinstance(node, list):
+        index = int(key) if key.isdigit() else -1
+        return node[index] if 0 <= index < len(node) else None
+    if isinstance(node, dict):
+        return node.get(key)
+    return None
+
+
+def _set(node, key: str, value):
+    """Gán node[key] = value (None = xóa), tự nới list nếu cần"""
+    if isinstance(node, list):
+        index = int(key)
+        if value is None:
+            if index < len(node):
+                node[index] = None
+            return
+        node.extend([None] * (index + 1 - len(node)))
+        node[index] = value
+    elif value is None:
+        node.pop(key, None)
+    else:
+        node[key] = value
+
+
+class NodeMirror:
+    """Bản sao 1 node RTDB, đồng bộ qua SSE trên thread nền"""
+
+    READ_TIMEOUT = 90  # RTDB gửi keep-alive ~30s/lần
+    MIN_BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, client, node: str):
+        """
+        Args:
+            client: RTDBClient (lấy URL + auth)
+            node: Path của node cần mirror
+        """
+        self.client = client
+        self.node = node
+        self.value = None
+        self.last_event_at = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+        self._thread = threading.Thread(target=self._run, name=f"rtdb-stream-{node}", daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        """Đã nhận snapshot đầu tiên chưa"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def get(self) -> Any:
+        """Giá trị hiện tại (chia sẻ giữa các session - không sửa trực tiếp)"""
+        return self.value
+
+    def close(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()
+
+    # ============ BACKGROUND ============
+    def _run(self):
+        backoff = self.MIN_BACKOFF
+        session = requests.Session()
+        while not self._stop.is_set():
+            try:
+                self._listen(session)
+                backoff = self.MIN_BACKOFF
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                print(f"Stream {self.node} lost: {e}")
+            # Backoff có jitter trước khi kết nối lại
+            self._stop.wait(backoff * (0.5 + random.random()))
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    def _listen(self, session: requests.Session):
+        response = session.get(
+            self.client._url(self.node),
+            params=self.client._params(None),
+            headers={"Accept": "text/event-stream"},
+            stream=True,
+            timeout=(5, self.READ_TIMEOUT),
+        )
+        response.raise_for_status()
+        self._response = response
+        try:
+            event, data_lines = None, []
+            for line in response.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line is None:
+                    continue
+                if line == "":
+                    if event:
+                        self._handle(event, "\n".join(data_lines))
+                    event, data_lines = None, []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[5:].strip())
+        finally:
+            self._response = None
+            response.close()
+
+    def _handle(self, event: str, raw: str):
+        if event in ("put", "patch"):
+            payload = json.loads(raw)
+            with self._lock:
+                self.value = apply_event(
+                    self.value, payload.get("path", "/"), payload.get("data"), merge=event == "patch"
+                )
+                self.last_event_at = time.time()
+            self._ready.set()
+        elif event in ("cancel", "auth_revoked"):
+            # Server đóng stream (mất quyền / token hết hạn) -> kết nối lại
+            raise ConnectionError(f"stream {event}: {raw}")
+        # keep-alive: bỏ qua
+
+
+class StreamMirror:
+    """Tập các NodeMirror dùng chung cho cả process"""
+
+    DEFAULT_NODES = ("music_trending", "prompt_templates")
+
+    def __init__(self, client, nodes: List[str] = DEFAULT_NODES):
+        self.mirrors: Dict[str, NodeMirror] = {node: NodeMirror(client, node) for node in nodes}
+
+    def get(self, node: str, default: Any = None) -> Any:
+        """
+        Đọc node từ mirror
+
+        Returns:
+            Giá trị trong mirror; default nếu node không được mirror / chưa sync xong
+        """
+        mirror = self.mirrors.get(node)
+        if mirror is None or not mirror.ready:
+            return default
+        return mirror.get()
+
+    def is_ready(self, node: str) -> bool:
+        mirror = self.mirrors.get(node)
+        return bool(mirror and mirror.ready)
+
+    def close(self):
+        for mirror in self.mirrors.values():
+            mirror.close()
+
+
+_mirror: Optional[StreamMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_stream_mirror(client) -> StreamMirror:
+    """StreamMirror dùng chung trong process (chỉ mở stream 1 lần)"""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = StreamMirror(client)
+        return _mirror
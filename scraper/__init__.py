@@ -1,5 +1,17 @@
 # Scraper module
-from .tiktok_music import TikTokMusicScraper
-from .selectors import TIKTOK_SELECTORS
+# Import lazy: Playwright chỉ được load khi thật sự scrape
+import importlib
 
-__all__ = ['TikTokMusicScraper', 'TIKTOK_SELECTORS']
+_EXPORTS = {
+    'TikTokMusicScraper': '.tiktok_music',
+    'TIKTOK_SELECTORS': '.selectors',
+    'MetricsIngestor': '.metrics_pipeline',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,191 @@
+"""
+Metrics Pipeline
+Định kỳ cập nhật metrics (views, likes, ...) cho các video đã đăng trong post_history
+
+- Chỉ lấy post còn "sống": đăng trong N ngày gần đây, hoặc metrics vẫn đang tăng
+- Scrape song song (1 browser, nhiều tab), parse số dạng "1.2M" / "35.4K"
+- Ghi snapshot time-series vào post_metrics/<push_id> (log phẳng theo thời gian, có post_id)
+  + metrics mới nhất vào post, tất cả bằng multi-path update theo batch
+"""
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from firebase.history_writer import generate_push_id
+
+METRIC_FIELDS = ("views", "likes", "comments", "shares")
+
+_SUFFIXES = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+
+def parse_count(text) -> Optional[int]:
+    """
+    Parse số đếm kiểu TikTok thành int
+
+    VD: "1.2M" -> 1200000, "35.4K" -> 35400, "1,234" -> 1234, "987" -> 987
+
+    Returns:
+        int, hoặc None nếu không parse được
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return int(text)
+    raw = str(text).strip().upper().replace(" ", "")
+    match = re.fullmatch(r"([\d.,]+)([KMB]?)", raw)
+    if not match:
+        return None
+    number, suffix = match.groups()
+    if suffix:
+        # "1,2K" (dấu phẩy thập phân) == "1.2K"
+        number = number.replace(",", ".")
+        try:
+            return int(round(float(number) * _SUFFIXES[suffix]))
+        except ValueError:
+            return None
+    digits = re.sub(r"[.,]", "", number)
+    return int(digits) if digits else None
+
+
+class MetricsIngestor:
+    """Pipeline kéo post_history -> scrape metrics -> ghi snapshot"""
+
+    MAX_AGE_DAYS = 7
+    CONCURRENCY = 4
+    CHUNK_SIZE = 200  # số video / 1 phiên browser
+    WRITE_BATCH = 100  # số post / 1 multi-path update
+    MIN_GROWTH = 0.01  # views tăng < 1% giữa 2 lần -> coi như đã "đứng"
+
+    def __init__(self, client, scrape_fn: Callable[[List[str], int], Dict[str, Optional[Dict]]] = None):
+        """
+        Args:
+            client: RTDBClient
+            scrape_fn: Hàm (urls, concurrency) -> {url: metrics text}; mặc định scrape bằng Playwright
+        """
+        self.client = client
+        if scrape_fn is None:
+            from .tiktok_music import scrape_video_metrics_sync
+            scrape_fn = scrape_video_metrics_sync
+        self.scrape_fn = scrape_fn
+
+    def select_posts(self, max_age_days: int = None) -> Dict[str, dict]:
+        """
+        Post cần cập nhật: đăng trong max_age_days ngày, hoặc metrics_active = true
+
+        Returns:
+            Dict {post_id: post}
+        """
+        max_age_days = max_age_days or self.MAX_AGE_DAYS
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        recent = self.client.get("post_history", orderBy="posted_at", startAt=cutoff) or {}
+        active = self.client.get("post_history", orderBy="metrics_active", equalTo=True) or {}
+        posts = dict(active)
+        posts.update(recent)
+        return {pid: post for pid, post in posts.items() if post.get("video_url")}
+
+    def run_once(self, max_age_days: int = None) -> Dict[str, int]:
+        """
+        Chạy 1 lượt ingest
+
+        Returns:
+            Thống kê {"selected", "scraped", "failed", "written"}
+        """
+        max_age_days = max_age_days or self.MAX_AGE_DAYS
+        posts = self.select_posts(max_age_days)
+        stats = {"selected": len(posts), "scraped": 0, "failed": 0, "written": 0}
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+
+        items = list(posts.items())
+        for start in range(0, len(items), self.CHUNK_SIZE):
+            chunk = items[start:start + self.CHUNK_SIZE]
+            urls = list({post["video_url"] for _, post in chunk})
+            scraped = self.scrape_fn(urls, self.CONCURRENCY)
+
+            updates = {}
+            pending = 0
+            for post_id, post in chunk:
+                metrics = self._parse(scraped.get(post["video_url"]))
+                if metrics is None:
+                    stats["failed"] += 1
+                    continue
+                stats["scraped"] += 1
+                updates.update(self._snapshot_paths(post_id, post, metrics, cutoff))
+                pending += 1
+                if pending >= self.WRITE_BATCH:
+                    self.client.update("", updates)
+                    stats["written"] += pending
+                    updates, pending = {}, 0
+            if updates:
+                self.client.update("", updates)
+                stats["written"] += pending
+
+        return stats
+
+    def run_forever(self, interval_minutes: float = 60, max_age_days: int = None):
+        """Chạy định kỳ (dùng cho worker / cron container)"""
+        while True:
+            started = time.time()
+            try:
+                stats = self.run_once(max_age_days)
+                print(f"📈 Metrics: {stats}")
+            except Exception as e:
+                print(f"❌ Lỗi ingest metrics: {e}")
+            time.sleep(max(0, interval_minutes * 60 - (time.time() - started)))
+
+    # ============ INTERNAL ============
+    @staticmethod
+    def _parse(raw: Optional[Dict]) -> Optional[Dict[str, int]]:
+        """Chỉ giữ field parse được (field thiếu không được coi là 0)"""
+        if not raw:
+            return None
+        metrics = {field: parse_count(raw.get(field)) for field in METRIC_FIELDS}
+        metrics = {field: value for field, value in metrics.items() if value is not None}
+        return metrics or None
+
+    def _snapshot_paths(self, post_id: str, post: dict, metrics: Dict[str, int], cutoff: str) -> dict:
+        """
+        Multi-path update cho 1 post: snapshot mới + metrics mới nhất + cờ active
+
+        Snapshot chỉ chứa field scrape được lần này; metrics mới nhất giữ giá trị cũ cho field thiếu
+        """
+        now = datetime.now().isoformat()
+        previous = post.get("metrics") or {}
+        latest = {f: previous[f] for f in METRIC_FIELDS if previous.get(f) is not None}
+        latest.update(metrics)
+        changed = any(value != previous.get(f) for f, value in metrics.items())
+        still_young = post.get("posted_at", "") >= cutoff
+        if "views" in metrics:
+            prev_views = previous.get("views") or 0
+            growing = prev_views == 0 or (metrics["views"] - prev_views) / prev_views >= self.MIN_GROWTH
+            active = still_young or (changed and growing)
+        else:
+            # Không đọc được views -> không đủ dữ liệu đánh giá, giữ cờ cũ
+            active = still_young or bool(post.get("metrics_active"))
+
+        return {
+            f"post_metrics/{generate_push_id()}": dict(metrics, post_id=post_id, ts=now),
+            f"post_history/{post_id}/metrics": latest,
+            f"post_history/{post_id}/metrics_updated_at": now,
+            f"post_history/{post_id}/metrics_active": active,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from firebase.config import get_firebase_config
+    from firebase.rest_client import get_rest_client
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Cập nhật metrics cho post_history")
+    parser.add_argument("--days", type=int, default=MetricsIngestor.MAX_AGE_DAYS, help="Tuổi tối đa của post (ngày)")
+    parser.add_argument("--interval", type=float, default=0, help="Chạy lặp mỗi N phút (0 = chạy 1 lần)")
+    args = parser.parse_args()
+
+    ingestor = MetricsIngestor(get_rest_client(get_firebase_config()["databaseURL"]))
+    if args.interval:
+        ingestor.run_forever(args.interval, args.days)
+    else:
+        print(ingestor.run_once(args.days))
@@ -3,12 +3,25 @@ TikTok Music Scraper
 Scrape nhạc trending từ TikTok Creative Center hoặc video
 """
 import asyncio
-import json
-import os
 from datetime import datetime
 from typing import List, Dict, Optional
 from playwright.async_api import async_playwright
 from .selectors import TIKTOK_SELECTORS, CREATIVE_CENTER_SELECTORS
+from services.local_store import load_music_cache, save_music_cache
+from services.keyword_classifier import KeywordClassifier
+from services.telemetry import span
+
+
+# Keyword trong tên bài -> vibe
+VIBE_RULES = {
+    "dance": (['remix', 'dance', 'edm', 'drop'], ['Sôi động', 'Remix', 'Nhảy']),
+    "love": (['love', 'tình', 'yêu', 'heart'], ['Lãng mạn', 'Cảm xúc']),
+    "soft": (['piano', 'acoustic', 'nhẹ'], ['Nhẹ nhàng', 'Sang trọng']),
+    "viral": (['trending', 'hot', 'viral'], ['Trendy', 'Viral']),
+}
+DEFAULT_VIBES = ['Trendy', 'Phổ biến']
+
+VIBE_CLASSIFIER = KeywordClassifier({group: rule[0] for group, rule in VIBE_RULES.items()})
 
 
 class TikTokMusicScraper:
@@ -19,15 +32,16 @@ class TikTokMusicScraper:
         
     async def _init_browser(self):
         """Khởi tạo browser với Playwright"""
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(
-            headless=self.headless,
-            args=['--disable-blink-features=AutomationControlled']
-        )
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent=self.user_agent,
-        )
+        with span("scrape.browser_init"):
+            playwright = await async_playwright().start()
+            browser = await playwright.chromium.launch(
+                headless=self.headless,
+                args=['--disable-blink-features=AutomationControlled']
+            )
+            context = await browser.new_context(
+                viewport={'width': 1920, 'height': 1080},
+                user_agent=self.user_agent,
+            )
         return playwright, browser, context
     
     async def scrape_trending_music(self, limit: int = 10) -> List[Dict]:
@@ -138,55 +152,86 @@ class TikTokMusicScraper:
             print(f"❌ Lỗi scrape video: {e}")
             return None
     
+    async def scrape_video_metrics_many(self, video_urls: List[str], concurrency: int = 4) -> Dict[str, Optional[Dict]]:
+        """
+        Scrape metrics (views, likes, comments, shares) của nhiều video song song
+        
+        Dùng chung 1 browser, tối đa `concurrency` tab cùng lúc.
+        
+        Returns:
+            Dict {video_url: metrics dạng text hoặc None nếu lỗi}
+        """
+        results = {}
+        if not video_urls:
+            return results
+        
+        playwright, browser, context = await self._init_browser()
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def scrape_one(url: str):
+            async with semaphore:
+                with span("scrape.metrics.page"):
+                    page = await context.new_page()
+                    try:
+                        await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout)
+                        await page.wait_for_selector(TIKTOK_SELECTORS["likes"], timeout=self.timeout)
+                        metrics = {}
+                        for field in ("views", "likes", "comments", "shares"):
+                            el = await page.query_selector(TIKTOK_SELECTORS[field])
+                            metrics[field] = (await el.inner_text()).strip() if el else None
+                        results[url] = metrics
+                    except Exception as e:
+                        print(f"  ❌ Lỗi scrape metrics {url}: {e}")
+                        results[url] = None
+                    finally:
+                        await page.close()
+        
+        try:
+            await asyncio.gather(*(scrape_one(url) for url in video_urls))
+        finally:
+            await browser.close()
+            await playwright.stop()
+        
+        return results
+    
     def _analyze_vibe(self, song_name: str) -> List[str]:
         """Phân tích vibe của bài hát dựa trên tên"""
         vibes = []
-        name_lower = song_name.lower()
-        
-        # Keyword mapping
-        if any(k in name_lower for k in ['remix', 'dance', 'edm', 'drop']):
-            vibes.extend(['Sôi động', 'Remix', 'Nhảy'])
-        if any(k in name_lower for k in ['love', 'tình', 'yêu', 'heart']):
-            vibes.extend(['Lãng mạn', 'Cảm xúc'])
-        if any(k in name_lower for k in ['piano', 'acoustic', 'nhẹ']):
-            vibes.extend(['Nhẹ nhàng', 'Sang trọng'])
-        if any(k in name_lower for k in ['trending', 'hot', 'viral']):
-            vibes.extend(['Trendy', 'Viral'])
+        for group in VIBE_CLASSIFIER.classify(song_name):
+            for vibe in VIBE_RULES[group][1]:
+                if vibe not in vibes:
+                    vibes.append(vibe)
         
         # Default vibe nếu không detect được
-        if not vibes:
-            vibes = ['Trendy', 'Phổ biến']
-        
-        return list(set(vibes))
+        return vibes or list(DEFAULT_VIBES)
     
     def _load_cache(self) -> List[Dict]:
         """Load nhạc từ cache local khi scrape fail"""
-        cache_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'music_cache.json')
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
+        return load_music_cache()
     
     def save_to_cache(self, songs: List[Dict]):
         """Lưu nhạc vào cache local"""
-        cache_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'music_cache.json')
-        try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(songs, f, indent=2, ensure_ascii=False)
+        if save_music_cache(songs):
             print(f"💾 Đã lưu {len(songs)} bài vào cache")
-        except Exception as e:
-            print(f"❌ Lỗi lưu cache: {e}")
 
 
 # Sync wrapper để dùng trong Streamlit
 def scrape_trending_music_sync(limit: int = 10) -> List[Dict]:
     """Sync wrapper cho async scraper"""
     scraper = TikTokMusicScraper(headless=True)
-    return asyncio.run(scraper.scrape_trending_music(limit))
+    with span("scrape.music", limit=limit):
+        return asyncio.run(scraper.scrape_trending_music(limit))
 
 
 def scrape_video_music_sync(video_url: str) -> Optional[Dict]:
     """Sync wrapper cho async video scraper"""
     scraper = TikTokMusicScraper(headless=True)
-    return asyncio.run(scraper.scrape_video_music(video_url))
+    with span("scrape.video"):
+        return asyncio.run(scraper.scrape_video_music(video_url))
+
+
+def scrape_video_metrics_sync(video_urls: List[str], concurrency: int = 4) -> Dict[str, Optional[Dict]]:
+    """Sync wrapper cho scrape metrics nhiều video"""
+    scraper = TikTokMusicScraper(headless=True)
+    with span("scrape.metrics", urls=len(video_urls)):
+        return asyncio.run(scraper.scrape_video_metrics_many(video_urls, concurrency))
@@ -1,4 +1,11 @@
 # Services module
 from .image_processor import ImageProcessor
+from .local_store import LocalStore, load_music_cache, save_music_cache
+from .keyword_classifier import KeywordClassifier, fold_text
+from .taxonomy import Taxonomy, get_taxonomy
+from .task_runner import TaskRunner, get_task_runner
+from .session_history import SessionHistory
+from .thumbnail_cache import ThumbnailCache, get_thumbnail_cache
+from .image_dedup import dedupe_images
 
-__all__ = ['ImageProcessor']
+__all__ = ['ImageProcessor', 'LocalStore', 'load_music_cache', 'save_music_cache', 'KeywordClassifier', 'fold_text', 'Taxonomy', 'get_taxonomy', 'TaskRunner', 'get_task_runner', 'SessionHistory', 'ThumbnailCache', 'get_thumbnail_cache', 'dedupe_images']
@@ -0,0 +1,134 @@
+"""
+Image Dedup
+Phát hiện ảnh gần trùng (cùng góc chụp lại nhiều lần) trước khi gửi lên Gemini
+
+- Hash cảm nhận dHash + pHash (64 bit) tính bằng NumPy trên ảnh xám đã thu nhỏ
+- Ảnh có khoảng cách Hamming nhỏ ở cả 2 hash -> cùng cụm
+- Mỗi cụm giữ ảnh nét nhất (phương sai Laplacian lớn nhất)
+"""
+import io
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+ANALYSIS_SIZE = 256  # cạnh dài của ảnh xám dùng để hash + đo độ nét
+DHASH_THRESHOLD = 10  # số bit khác tối đa (/64) để coi là gần trùng
+PHASH_THRESHOLD = 10
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Ma trận DCT-II trực chuẩn n x n"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def dhash(gray: Image.Image) -> int:
+    """Difference hash: so sánh độ sáng các pixel kề nhau trên lưới 9x8"""
+    pixels = np.asarray(gray.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray: Image.Image) -> int:
+    """Perceptual hash: 8x8 hệ số DCT tần số thấp so với median"""
+    pixels = np.asarray(gray.resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].flatten()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def sharpness(gray: Image.Image) -> float:
+    """Độ nét = phương sai của Laplacian (ảnh mờ -> cạnh yếu -> phương sai nhỏ)"""
+    pixels = np.asarray(gray, dtype=np.float64)
+    if pixels.shape[0] < 3 or pixels.shape[1] < 3:
+        return 0.0
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def analyze(image_data: bytes) -> Optional[Dict]:
+    """
+    dHash, pHash và độ nét của 1 ảnh
+
+    Returns:
+        {"dhash", "phash", "sharpness"}, hoặc None nếu không đọc được ảnh
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft("L", (ANALYSIS_SIZE, ANALYSIS_SIZE))  # JPEG: decode ở độ phân giải thấp
+        gray = image.convert("L")
+        gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+    except Exception as e:
+        print(f"Lỗi phân tích ảnh: {e}")
+        return None
+    return {"dhash": dhash(gray), "phash": phash(gray), "sharpness": sharpness(gray)}
+
+
+def dedupe_images(
+    images: List[bytes],
+    dhash_threshold: int = DHASH_THRESHOLD,
+    phash_threshold: int = PHASH_THRESHOLD
+) -> Tuple[List[bytes], Dict]:
+    """
+    Gom cụm ảnh gần trùng, mỗi cụm giữ ảnh nét nhất
+
+    Thứ tự ảnh giữ lại theo ảnh xuất hiện đầu tiên của mỗi cụm
+    -> cụm của ảnh chính (index 0) vẫn đứng đầu
+
+    Returns:
+        Tuple (ảnh giữ lại, report)
+        report = {"kept": [index], "dropped": [{"index", "duplicate_of", "distance"}]}
+    """
+    features = [analyze(data) for data in images]
+
+    # Union-find trên các cặp gần trùng
+    parent = list(range(len(images)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    distances = {}
+    for i in range(len(images)):
+        for j in range(i + 1, len(images)):
+            if features[i] is None or features[j] is None:
+                continue
+            d_dist = hamming(features[i]["dhash"], features[j]["dhash"])
+            p_dist = hamming(features[i]["phash"], features[j]["phash"])
+            if d_dist <= dhash_threshold and p_dist <= phash_threshold:
+                distances[(i, j)] = distances[(j, i)] = max(d_dist, p_dist)
+                parent[find(j)] = find(i)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(images)):
+        clusters.setdefault(find(i), []).append(i)
+
+    kept, dropped = [], []
+    for members in clusters.values():
+        best = max(members, key=lambda i: features[i]["sharpness"] if features[i] else -1.0)
+        kept.append(best)
+        for i in members:
+            if i != best:
+                dropped.append({"index": i, "duplicate_of": best, "distance": distances.get((i, best))})
+
+    # clusters giữ thứ tự chèn = thứ tự ảnh đầu tiên của mỗi cụm
+    report = {"kept": kept, "dropped": sorted(dropped, key=lambda d: d["index"])}
+    return [images[i] for i in kept], report
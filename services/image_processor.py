@@ -2,9 +2,11 @@
 Image Processor
 Xử lý và validate ảnh trước khi gửi lên Gemini
 """
-from PIL import Image
+from PIL import Image, features
 import io
-from typing import Tuple, Optional
+import math
+import os
+from typing import Dict, List, Tuple, Optional
 
 
 class ImageProcessor:
@@ -15,6 +17,37 @@ class ImageProcessor:
     
     SUPPORTED_FORMATS = ['JPEG', 'PNG', 'WEBP', 'GIF']
     
+    # Cách Gemini tính token ảnh: ảnh <= 384px cả 2 chiều = 258 token,
+    # lớn hơn thì được cắt/scale thành các tile 768x768, mỗi tile 258 token
+    TILE_SIZE = 768
+    SMALL_IMAGE_MAX = 384
+    TOKENS_PER_TILE = 258
+    MAX_TILES_PER_IMAGE = 4  # 2x2 tile ~ 1536px: đủ chi tiết cho trang sức
+    DEFAULT_TOKEN_BUDGET = 258 * 12  # ghi đè bằng env GEMINI_IMAGE_TOKEN_BUDGET (đọc lúc gọi)
+    
+    # Magic bytes -> MIME type (nhận diện định dạng không cần decode ảnh)
+    MIME_SIGNATURES = [
+        (b"\xff\xd8\xff", "image/jpeg"),
+        (b"\x89PNG\r\n\x1a\n", "image/png"),
+        (b"GIF87a", "image/gif"),
+        (b"GIF89a", "image/gif"),
+    ]
+    
+    @staticmethod
+    def detect_mime_type(image_data: bytes) -> Optional[str]:
+        """
+        MIME type của ảnh theo magic bytes
+        
+        Returns:
+            VD "image/jpeg", hoặc None nếu không nhận ra
+        """
+        if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+            return "image/webp"
+        for signature, mime_type in ImageProcessor.MIME_SIGNATURES:
+            if image_data.startswith(signature):
+                return mime_type
+        return None
+    
     @staticmethod
     def validate_image(image_data: bytes) -> Tuple[bool, str]:
         """
@@ -93,6 +126,121 @@ class ImageProcessor:
         except:
             return None
     
+    @staticmethod
+    def make_thumbnail(image_data: bytes, size: int = 256) -> Optional[bytes]:
+        """
+        Tạo thumbnail WebP nhỏ để preview (không gửi ảnh gốc ra browser)
+        
+        Returns:
+            Bytes WebP, hoặc None nếu không đọc được ảnh
+        """
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            image.draft("RGB", (size, size))  # JPEG: decode ở độ phân giải thấp
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="WEBP", quality=80)
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"Lỗi tạo thumbnail: {e}")
+            return None
+    
+    # ============ TOKEN BUDGET ============
+    @staticmethod
+    def estimate_image_tokens(width: int, height: int) -> int:
+        """Số token Gemini tính cho 1 ảnh kích thước width x height"""
+        if width <= ImageProcessor.SMALL_IMAGE_MAX and height <= ImageProcessor.SMALL_IMAGE_MAX:
+            return ImageProcessor.TOKENS_PER_TILE
+        tiles = math.ceil(width / ImageProcessor.TILE_SIZE) * math.ceil(height / ImageProcessor.TILE_SIZE)
+        return tiles * ImageProcessor.TOKENS_PER_TILE
+    
+    @staticmethod
+    def plan_dimensions(width: int, height: int, max_tiles: int) -> Tuple[int, int]:
+        """
+        Kích thước lớn nhất (giữ tỷ lệ, không phóng to) dùng tối đa max_tiles tile
+        
+        Thử mọi lưới cols x rows <= max_tiles, chọn lưới cho scale lớn nhất -> chiều bị giới hạn
+        khớp đúng bội số TILE_SIZE (không tốn tile cho vài pixel thừa)
+        """
+        tile = ImageProcessor.TILE_SIZE
+        best = 0.0
+        for cols in range(1, max_tiles + 1):
+            rows = max_tiles // cols
+            best = max(best, min(cols * tile / width, rows * tile / height, 1.0))
+        # floor để không vượt biên tile do làm tròn
+        return max(1, int(width * best)), max(1, int(height * best))
+    
+    @staticmethod
+    def encode_for_budget(
+        images: List[bytes],
+        token_budget: int = None
+    ) -> Tuple[List[bytes], Dict]:
+        """
+        Encode bộ ảnh (nhiều góc) sao cho tổng token ảnh nằm trong token_budget
+        
+        - Chia đều số tile cho các ảnh (tối thiểu 1, tối đa MAX_TILES_PER_IMAGE)
+        - Nhiều ảnh hơn số tile của ngân sách -> chỉ giữ các ảnh đầu (ảnh chính luôn được giữ),
+          index các ảnh bị bỏ nằm trong report["over_budget"], số ảnh bị bỏ trong report["dropped"]
+        - Resize về kích thước khớp tile, WebP (hoặc JPEG nếu Pillow không có WebP),
+          quality giảm dần khi mỗi ảnh được ít tile
+        
+        Args:
+            images: Bytes ảnh gốc (đã validate)
+            token_budget: Token tối đa cho phần ảnh của 1 request (None = env GEMINI_IMAGE_TOKEN_BUDGET)
+        
+        Returns:
+            Tuple (list bytes đã encode - ảnh lỗi / vượt ngân sách bị bỏ, report)
+            report = {"budget", "total_tokens", "total_bytes", "over_budget": [index ảnh bị bỏ], "dropped",
+                      "images": [{width, height, tokens, bytes, format}]}
+        """
+        token_budget = token_budget or int(os.getenv("GEMINI_IMAGE_TOKEN_BUDGET", ImageProcessor.DEFAULT_TOKEN_BUDGET))
+        total_tiles = token_budget // ImageProcessor.TOKENS_PER_TILE
+        max_images = max(1, total_tiles)
+        tiles_per_image = max(1, min(ImageProcessor.MAX_TILES_PER_IMAGE, total_tiles // max(1, min(len(images), max_images))))
+        quality = {1: 75, 2: 80, 3: 80}.get(tiles_per_image, 85)
+        image_format = "WEBP" if features.check("webp") else "JPEG"
+        
+        encoded, details, over_budget = [], [], []
+        for index, image_data in enumerate(images):
+            if len(encoded) >= max_images:
+                over_budget.append(index)
+                continue
+            try:
+                image = Image.open(io.BytesIO(image_data))
+                width, height = ImageProcessor.plan_dimensions(image.width, image.height, tiles_per_image)
+                image.draft("RGB", (width, height))  # JPEG: decode ở độ phân giải thấp
+                if image.size != (width, height):
+                    image = image.resize((width, height), Image.Resampling.LANCZOS)
+                if image.mode not in ("RGB", "RGBA") or (image_format == "JPEG" and image.mode == "RGBA"):
+                    image = image.convert("RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, format=image_format, quality=quality)
+            except Exception as e:
+                print(f"Lỗi encode ảnh: {e}")
+                continue
+            
+            data = buffer.getvalue()
+            encoded.append(data)
+            details.append({
+                "width": width,
+                "height": height,
+                "tokens": ImageProcessor.estimate_image_tokens(width, height),
+                "bytes": len(data),
+                "format": image_format,
+            })
+        
+        report = {
+            "budget": token_budget,
+            "total_tokens": sum(d["tokens"] for d in details),
+            "total_bytes": sum(d["bytes"] for d in details),
+            "over_budget": over_budget,
+            "dropped": len(over_budget),
+            "images": details,
+        }
+        return encoded, report
+    
     @staticmethod
     def process_for_gemini(image_data: bytes) -> Tuple[Optional[bytes], str]:
         """
@@ -0,0 +1,92 @@
+"""
+Keyword Classifier
+Phân loại text theo bảng keyword bằng 1 regex tổng hợp (1 lượt quét / chuỗi)
+
+- Bỏ dấu tiếng Việt trước khi so khớp: "nhan kim cuong" == "nhẫn kim cương"
+- Keyword 1 từ có dấu ("tình", "yêu", "nhẫn") dễ trùng từ khác khi bỏ dấu ("tinh tế", "yếu")
+  -> text có dấu phải khớp đúng dấu, chỉ text gõ không dấu mới so khớp bỏ dấu
+- Khớp nguyên từ; keyword dài nhất tại mỗi vị trí thắng và chỉ mang nhãn của chính nó
+  ("mặt dây chuyền" là charm, không kéo theo nhãn của "dây chuyền")
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Set
+
+
+def fold_text(text: str) -> str:
+    """Lowercase + bỏ dấu tiếng Việt (đ -> d)"""
+    text = str(text or "").lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _lower(text: str) -> str:
+    return unicodedata.normalize("NFC", str(text or "").lower())
+
+
+class KeywordClassifier:
+    """
+    Compile bảng {label: [keywords]} thành 1 regex
+
+    Keyword khớp nguyên từ ("hat" không match "chat" / "hate").
+    """
+
+    def __init__(self, tables: Dict[str, Iterable[str]]):
+        self.labels = list(tables.keys())
+        self._order = {label: i for i, label in enumerate(self.labels)}
+
+        # keyword đã bỏ dấu -> nhãn khớp bỏ dấu / {dạng có dấu: nhãn} cho keyword nhạy dấu
+        self._loose: Dict[str, Set[str]] = {}
+        self._strict: Dict[str, Dict[str, Set[str]]] = {}
+        for label, keywords in tables.items():
+            for keyword in keywords:
+                original = _lower(keyword).strip()
+                folded = fold_text(original)
+                if not folded:
+                    continue
+                if " " not in folded and folded != original:
+                    self._strict.setdefault(folded, {}).setdefault(original, set()).add(label)
+                else:
+                    self._loose.setdefault(folded, set()).add(label)
+
+        # Keyword dài đứng trước để regex ưu tiên match dài nhất
+        keywords = set(self._loose) | set(self._strict)
+        alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        self._pattern = re.compile(r"(?<!\w)(?:" + alternation + r")(?!\w)") if alternation else None
+
+    def classify(self, text: str) -> List[str]:
+        """
+        Các nhãn khớp với text
+
+        Returns:
+            List nhãn (không trùng), theo thứ tự khai báo trong bảng
+        """
+        if self._pattern is None:
+            return []
+        original = _lower(text)
+        folded = fold_text(original)
+        # Bỏ dấu giữ nguyên độ dài (NFC) -> cắt được đoạn có dấu tương ứng với match
+        accented = folded != original and len(folded) == len(original)
+
+        found: Set[str] = set()
+        for match in self._pattern.finditer(folded):
+            keyword = match.group(0)
+            found |= self._loose.get(keyword, set())
+            forms = self._strict.get(keyword)
+            if not forms:
+                continue
+            if accented:
+                found |= forms.get(original[match.start():match.end()], set())
+            else:
+                for labels in forms.values():
+                    found |= labels
+        return sorted(found, key=self._order.__getitem__)
+
+    def first(self, text: str, default: str = None) -> str:
+        """Nhãn đầu tiên (theo thứ tự ưu tiên của bảng) khớp với text"""
+        labels = self.classify(text)
+        return labels[0] if labels else default
+
+    def classify_many(self, texts: Iterable[str]) -> List[List[str]]:
+        """Phân loại hàng loạt (VD: hàng nghìn SKU / bài hát)"""
+        return [self.classify(text) for text in texts]
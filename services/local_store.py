@@ -0,0 +1,180 @@
+"""
+Local Store
+Datastore local cho các file JSON trong data/ (music cache, ...)
+
+- Ghi an toàn: ghi ra file tạm -> fsync -> rename (không bao giờ thấy file bị cắt dở)
+- File lock để nhiều session Streamlit không ghi chồng lên nhau
+- Format gọn: JSON minified bọc trong envelope có schema version
+- Đọc bằng mmap, kết quả parse được cache đến khi mtime của file thay đổi
+"""
+import json
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+SCHEMA_VERSION = 1
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+MUSIC_CACHE_PATH = os.path.join(DATA_DIR, "music_cache.json")
+
+
+class LocalStore:
+    """Một file JSON local với ghi atomic + lock và cache đọc theo mtime"""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.lock_path = self.path + ".lock"
+        self._mutex = threading.Lock()
+        self._cache_key = None
+        self._cache_value = None
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock độc quyền giữa các process (qua file .lock bên cạnh)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a+b") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def read(self, default: Any = None) -> Any:
+        """
+        Đọc dữ liệu từ file
+
+        Kết quả được cache trong process đến khi file đổi mtime/size.
+        Giá trị trả về được chia sẻ giữa các lần gọi - không sửa trực tiếp.
+
+        Returns:
+            Dữ liệu đã parse, hoặc default nếu file không có / hỏng
+        """
+        key = self._stat_key()
+        if key is None:
+            return default
+
+        with self._mutex:
+            if key == self._cache_key:
+                return self._cache_value
+
+            try:
+                with open(self.path, "rb") as f:
+                    if key[1] == 0:
+                        return default
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        raw = json.loads(mm[:].decode("utf-8"))
+            except Exception as e:
+                print(f"❌ Lỗi đọc {os.path.basename(self.path)}: {e}")
+                return default
+
+            value = self._unwrap(raw)
+            self._cache_key = key
+            self._cache_value = value
+            return value
+
+    def write(self, data: Any) -> bool:
+        """
+        Ghi dữ liệu ra file (atomic)
+
+        Returns:
+            True nếu ghi thành công
+        """
+        envelope = {
+            "schema": SCHEMA_VERSION,
+            "updated_at": datetime.now().isoformat(),
+            "data": data,
+        }
+        payload = json.dumps(envelope, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        directory = os.path.dirname(self.path)
+
+        try:
+            with self._file_lock():
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory
+                )
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(payload)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                self._fsync_dir(directory)
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi ghi {os.path.basename(self.path)}: {e}")
+            return False
+
+    @staticmethod
+    def _fsync_dir(directory: str):
+        """fsync thư mục để rename được lưu bền (không hỗ trợ trên Windows)"""
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    @staticmethod
+    def _unwrap(raw: Any) -> Any:
+        """Bóc envelope; file format cũ (JSON trần) vẫn đọc được"""
+        if isinstance(raw, dict) and "schema" in raw and "data" in raw:
+            if raw["schema"] > SCHEMA_VERSION:
+                print(f"⚠️ Schema {raw['schema']} mới hơn bản hỗ trợ ({SCHEMA_VERSION})")
+            return raw["data"]
+        return raw
+
+
+# ============ SHARED INSTANCES ============
+_stores: Dict[str, LocalStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str) -> LocalStore:
+    """Lấy LocalStore dùng chung trong process cho 1 file"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = LocalStore(path)
+        return _stores[path]
+
+
+def load_music_cache() -> List[Dict]:
+    """Đọc danh sách nhạc từ data/music_cache.json"""
+    songs = get_store(MUSIC_CACHE_PATH).read(default=[])
+    return songs if isinstance(songs, list) else []
+
+
+def save_music_cache(songs: List[Dict]) -> bool:
+    """Ghi danh sách nhạc vào data/music_cache.json"""
+    return get_store(MUSIC_CACHE_PATH).write(songs)
@@ -0,0 +1,163 @@
+"""
+Profiler
+Profile 1 lần generate khi cần chẩn đoán chậm (opt-in, không cần tool ngoài)
+
+- Bật: PROFILE_GENERATION=1 (mọi lần generate) hoặc checkbox debug trong sidebar (lần generate tiếp theo)
+- cProfile cho thread chạy generate + tracemalloc đo peak bộ nhớ và các dòng cấp phát nhiều nhất
+  (tracemalloc thấy bộ nhớ Python / NumPy, không thấy buffer C riêng của PIL)
+- Lưu outputs/profiles/<thời gian>_<label>.prof (mở bằng pstats / snakeviz) + .json tóm tắt top-N hotspot
+- Mỗi thời điểm chỉ 1 profile chạy (cProfile / tracemalloc dùng chung process); lần lồng nhau bị bỏ qua
+- cProfile chỉ đo thread gọi profile_run, còn tracemalloc đo cả process: job khác chạy song song
+  (TaskRunner) cũng được tính vào peak / allocations -> report ghi "memory_scope" = "process" và
+  số job chạy cùng lúc ("concurrent_tasks") để UI cảnh báo
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+PROFILE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "outputs", "profiles"))
+TOP_N = int(os.getenv("PROFILE_TOP_N", "15"))
+
+_active = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("PROFILE_GENERATION", "0") == "1"
+
+
+def _function_label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":  # built-in
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def hotspots(stats: pstats.Stats, sort: str = "tottime", top: int = TOP_N) -> List[Dict]:
+    """Top-N hàm theo thời gian tự thân (tottime) hoặc tích lũy (cumulative)"""
+    index = {"tottime": 2, "cumulative": 3}[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:top]
+    return [
+        {
+            "function": _function_label(func),
+            "calls": str(primitive_calls) if primitive_calls == total_calls else f"{total_calls}/{primitive_calls}",
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        }
+        for func, (primitive_calls, total_calls, tottime, cumtime, _) in rows
+    ]
+
+
+@contextmanager
+def profile_run(label: str, enabled: bool = None, top: int = TOP_N, concurrent: Callable[[], int] = None):
+    """
+    Profile khối code bên trong
+
+    VD:
+        with profile_run("generate") as report:
+            ...
+        report -> {"label", "duration", "peak_memory_mb", "hotspots", "cumulative", "allocations", "file"}
+                  (None khi không bật / đang có profile khác chạy)
+
+    Args:
+        enabled: None = đọc PROFILE_GENERATION
+        top: Số hotspot giữ lại trong tóm tắt
+    """
+    if enabled is None:
+        enabled = profiling_enabled()
+    if not enabled or not _active.acquire(blocking=False):
+        yield None
+        return
+
+    report: Dict = {"label": label, "memory_scope": "process"}
+    concurrent_tasks = concurrent() if concurrent else 0
+    started_tracing = not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    try:
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            if concurrent:
+                concurrent_tasks = max(concurrent_tasks, concurrent())
+            report["concurrent_tasks"] = concurrent_tasks
+            report["duration"] = round(time.perf_counter() - started, 3)
+            report["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            report["allocations"] = [
+                {"line": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                 "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]
+            ]
+            if started_tracing:
+                tracemalloc.stop()
+            _save(profiler, report, top)
+    finally:
+        _active.release()
+
+
+def _save(profiler: cProfile.Profile, report: Dict, top: int):
+    """Tóm tắt hotspot + ghi .prof / .json (lỗi ghi file không làm hỏng lần generate)"""
+    try:
+        stats = pstats.Stats(profiler)
+        report["hotspots"] = hotspots(stats, "tottime", top)
+        report["cumulative"] = hotspots(stats, "cumulative", top)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{report['label']}"
+        report["file"] = os.path.join(PROFILE_DIR, f"{name}.prof")
+        stats.dump_stats(report["file"])
+        with open(os.path.join(PROFILE_DIR, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"❌ Lỗi lưu profile: {e}")
+
+
+def format_report(report: Dict, top: int = 5) -> str:
+    """Tóm tắt ngắn để in ra console"""
+    lines = [f"🔬 Profile {report['label']}: {report['duration']}s | peak {report['peak_memory_mb']} MB | {report.get('file', '')}"]
+    for row in report.get("hotspots", [])[:top]:
+        lines.append(f"   {row['tottime']:>8.3f}s  {row['function']}")
+    return "\n".join(lines)
+
+
+def profiled(label: str):
+    """Decorator: profile hàm khi PROFILE_GENERATION=1, in tóm tắt ra console"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile_run(label) as report:
+                result = fn(*args, **kwargs)
+            if report:
+                print(format_report(report))
+            return result
+        return wrapper
+    return decorator
+
+
+def recent_profiles(limit: int = 10) -> List[str]:
+    """File .prof gần nhất (mới nhất trước)"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")), reverse=True)
+    return [os.path.join(PROFILE_DIR, f) for f in files[:limit]]
+
+
+def load_report(prof_path: str) -> Optional[Dict]:
+    """Đọc lại tóm tắt .json đi kèm file .prof"""
+    try:
+        with open(prof_path[:-len(".prof")] + ".json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
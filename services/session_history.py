@@ -0,0 +1,98 @@
+"""
+Session History
+Lịch sử generate của 1 session Streamlit với bộ nhớ có giới hạn
+
+- Chỉ giữ MAX_IN_MEMORY entry mới nhất trong RAM (ring buffer)
+- Entry cũ bị đẩy ra được ghi xuống file JSONL, sidebar đọc lại theo trang khi cần
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List
+
+SPILL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "outputs", "history"))
+
+
+class SessionHistory:
+    """Ring buffer lịch sử + spill xuống đĩa"""
+
+    MAX_IN_MEMORY = 20
+    SPILL_TTL = 86400  # giây; file spill của session cũ hơn sẽ bị xóa
+
+    def __init__(self, maxlen: int = None, spill_dir: str = SPILL_DIR):
+        self._items = deque(maxlen=maxlen or self.MAX_IN_MEMORY)
+        self._lock = threading.Lock()
+        self.spill_path = os.path.join(spill_dir, f"{uuid.uuid4().hex}.jsonl")
+        self.spilled = 0
+        self._cleanup(spill_dir)
+
+    def _cleanup(self, spill_dir: str):
+        """Xóa file spill của các session đã hết hạn"""
+        if not os.path.isdir(spill_dir):
+            return
+        cutoff = time.time() - self.SPILL_TTL
+        for name in os.listdir(spill_dir):
+            path = os.path.join(spill_dir, name)
+            try:
+                if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def append(self, entry: dict):
+        """Thêm entry; entry cũ nhất bị đẩy ra sẽ được ghi xuống file"""
+        with self._lock:
+            if len(self._items) == self._items.maxlen:
+                self._spill(self._items[0])
+            self._items.append(entry)
+
+    def recent(self, n: int = 5) -> List[dict]:
+        """n entry mới nhất trong RAM (cũ -> mới)"""
+        with self._lock:
+            return list(self._items)[-n:]
+
+    def older(self, page: int = 0, page_size: int = 10) -> List[dict]:
+        """
+        Đọc các entry đã spill (mới -> cũ), theo trang
+
+        Args:
+            page: Trang thứ mấy (0 = mới nhất)
+        """
+        if not self.spilled or not os.path.exists(self.spill_path):
+            return []
+        with open(self.spill_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        end = len(lines) - page * page_size
+        start = max(0, end - page_size)
+        items = []
+        for line in reversed(lines[start:max(end, 0)]):
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+        return items
+
+    def __len__(self) -> int:
+        return len(self._items) + self.spilled
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            self.spilled = 0
+
+    def _spill(self, entry: dict):
+        try:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self.spilled += 1
+        except Exception as e:
+            print(f"❌ Lỗi spill lịch sử: {e}")
@@ -0,0 +1,140 @@
+"""
+Startup Report
+Đo thời gian import từng module lúc app khởi động (python -X importtime)
+
+- Lấy danh sách import top-level của app.py (AST) -> không phải sửa tay khi app đổi import
+- Import trong subprocess sạch -> số đo không bị ảnh hưởng bởi module đã load sẵn
+- HEAVY_MODULES: SDK nặng chỉ được load khi dùng tính năng, không được có mặt lúc cold start
+
+Chạy: python -m services.startup_report [--top 20] [--budget-ms 2000]
+"""
+import ast
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+
+# SDK nặng -> tính năng dùng nó
+HEAVY_MODULES = {
+    "playwright": "scrape nhạc / metrics",
+    "google.oauth2": "tạo video Veo",
+    "google.generativeai": "Gemini",
+    "pyarrow": "export analytics",
+}
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def module_available(name: str) -> bool:
+    """Module có cài không (không import thật)"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def app_imports(path: str = APP_PATH) -> List[str]:
+    """Các module app.py import ở top-level (kể cả trong try/except)"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    modules = []
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+        elif isinstance(node, (ast.Try, ast.If)):
+            nodes.extend(node.body + node.orelse)
+    return list(dict.fromkeys(modules))
+
+
+def measure_imports(modules: List[str]) -> List[Dict]:
+    """
+    Import các module trong subprocess với -X importtime
+
+    Returns:
+        List {"module", "self_ms", "cumulative_ms", "depth"} theo thứ tự import
+    """
+    # Giống app.py: module lỗi import (chưa cài) thì bỏ qua, đo tiếp các module khác
+    code = (
+        "import importlib\n"
+        f"for name in {modules!r}:\n"
+        "    try:\n"
+        "        importlib.import_module(name)\n"
+        "    except Exception as e:\n"
+        "        print(f'{name}: {e}')\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    for line in proc.stdout.splitlines():
+        print(f"⚠️ Không import được {line}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows
+
+
+def build_report(rows: List[Dict], top: int = 20) -> Dict:
+    """
+    Tổng hợp số đo import
+
+    Returns:
+        {"total_ms", "top": module top-level tốn nhất, "heavy_loaded": SDK nặng bị load lúc khởi động}
+    """
+    loaded = {row["module"] for row in rows}
+    top_level = [row for row in rows if row["depth"] == 0]
+    return {
+        "total_ms": round(sum(row["self_ms"] for row in rows), 1),
+        "top": sorted(top_level, key=lambda r: r["cumulative_ms"], reverse=True)[:top],
+        "heavy_loaded": [
+            name for name in HEAVY_MODULES
+            if any(m == name or m.startswith(name + ".") for m in loaded)
+        ],
+    }
+
+
+def startup_report(top: int = 20) -> Dict:
+    """Đo chi phí import lúc khởi động của app.py"""
+    return build_report(measure_imports(app_imports()), top)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Đo thời gian import lúc khởi động app")
+    parser.add_argument("--top", type=int, default=20, help="Số module hiển thị")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Fail nếu tổng thời gian import vượt ngưỡng (0 = không kiểm tra)")
+    args = parser.parse_args()
+
+    report = startup_report(args.top)
+    print(f"⏱️ Tổng import: {report['total_ms']:.1f} ms")
+    for row in report["top"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+
+    failed = False
+    for name in report["heavy_loaded"]:
+        print(f"⚠️ {name} bị load lúc khởi động (chỉ cần cho {HEAVY_MODULES[name]})")
+        failed = True
+    if args.budget_ms and report["total_ms"] > args.budget_ms:
+        print(f"❌ Vượt ngân sách {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
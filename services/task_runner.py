@@ -0,0 +1,126 @@
+"""
+Task Runner
+Thread pool + registry dùng chung cả process cho các job chạy lâu (generate, tạo video...)
+
+- submit() trả về task_id ngay, UI poll trạng thái thay vì chặn script thread của Streamlit
+- Kết quả được giữ RESULT_TTL giây để session đọc lại (kể cả sau khi rerun)
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Task:
+    """Trạng thái 1 job: pending -> running -> done / failed"""
+
+    def __init__(self, task_id: str, label: str = "", owner: str = ""):
+        self.id = task_id
+        self.label = label
+        self.owner = owner
+        self.status = "pending"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def elapsed(self) -> float:
+        """Số giây đã chạy (hoặc đã chờ nếu chưa chạy)"""
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.created_at)
+
+
+class TaskRunner:
+    """Chạy job trên thread pool, tra cứu theo task_id"""
+
+    MAX_WORKERS = 4
+    RESULT_TTL = 3600  # giây giữ task đã xong
+
+    def __init__(self, max_workers: int = None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.MAX_WORKERS, thread_name_prefix="task"
+        )
+        self._tasks: Dict[str, Task] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, label: str = "", owner: str = "", **kwargs) -> str:
+        """
+        Đưa job vào hàng đợi
+
+        Args:
+            fn: Hàm chạy nền (không được gọi st.* bên trong)
+            label: Tên hiển thị trên UI
+            owner: ID session / operator (để lọc task)
+
+        Returns:
+            task_id
+        """
+        self._prune()
+        task = Task(uuid.uuid4().hex[:12], label, owner)
+        with self._lock:
+            self._tasks[task.id] = task
+        self._executor.submit(self._run, task, fn, args, kwargs)
+        return task.id
+
+    def get(self, task_id: str) -> Optional[Task]:
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def list(self, owner: str = None) -> List[Task]:
+        """Các task (của owner nếu có), mới nhất trước"""
+        with self._lock:
+            tasks = [t for t in self._tasks.values() if owner is None or t.owner == owner]
+        return sorted(tasks, key=lambda t: t.created_at, reverse=True)
+
+    def forget(self, task_id: str):
+        """Xóa task khỏi registry (sau khi UI đã lấy kết quả)"""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    @property
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for t in self._tasks.values() if not t.done)
+
+    # ============ INTERNAL ============
+    @staticmethod
+    def _run(task: Task, fn: Callable, args: tuple, kwargs: dict):
+        task.status = "running"
+        task.started_at = time.time()
+        # finished_at gán trước status: task.done = True thì luôn có finished_at (cho _prune)
+        try:
+            task.result = fn(*args, **kwargs)
+            task.finished_at = time.time()
+            task.status = "done"
+        except Exception as e:
+            task.error = str(e)
+            task.finished_at = time.time()
+            task.status = "failed"
+            print(f"❌ Task {task.label or task.id} lỗi: {e}")
+
+    def _prune(self):
+        """Bỏ các task đã xong quá RESULT_TTL (session không quay lại lấy)"""
+        cutoff = time.time() - self.RESULT_TTL
+        with self._lock:
+            for task_id in [k for k, t in self._tasks.items() if t.done and t.finished_at is not None and t.finished_at < cutoff]:
+                del self._tasks[task_id]
+
+
+_runner: Optional[TaskRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_task_runner() -> TaskRunner:
+    """TaskRunner dùng chung trong process"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TaskRunner()
+        return _runner
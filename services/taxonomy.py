@@ -0,0 +1,118 @@
+"""
+Taxonomy
+Danh mục loại sản phẩm từ data/categories.json - nguồn dữ liệu duy nhất cho
+danh sách loại SP trên UI, keyword detect loại SP và visual_style trong prompt
+
+- Load file 1 lần, build index: tên vi / tên en / keyword (đã bỏ dấu) -> loại SP
+- Tự reload khi file thay đổi (kiểm tra mtime tối đa mỗi CHECK_INTERVAL giây)
+- File hỏng / rỗng (đang sửa tay, ghi dở) -> giữ taxonomy đã load trước đó
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .keyword_classifier import fold_text
+from .local_store import DATA_DIR, get_store
+
+CATEGORIES_PATH = os.path.join(DATA_DIR, "categories.json")
+
+
+class Taxonomy:
+    """Index tra cứu loại sản phẩm, O(1) theo tên / keyword"""
+
+    CHECK_INTERVAL = 2.0
+
+    def __init__(self, path: str = CATEGORIES_PATH):
+        self.store = get_store(path)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._raw = None
+        self._last_check = 0.0
+        self._warned = False
+        self._kinds: Dict[str, dict] = {}
+        self._index: Dict[str, str] = {}
+        self._options: List[str] = []
+        self._refresh(force=True)
+
+    def _refresh(self, force: bool = False):
+        """Reload nếu file đã đổi (LocalStore trả object mới khi mtime đổi)"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            raw = self.store.read(default=None)
+            if raw is self._raw:
+                return
+            if not isinstance(raw, dict) or not raw:
+                if self._kinds:
+                    if not self._warned:
+                        print(f"⚠️ {self.store.path} hỏng hoặc rỗng, giữ danh mục cũ")
+                        self._warned = True
+                    return
+                raw = {}
+            self._build(raw)
+            self._raw = raw
+            self._warned = False
+            self.version += 1
+
+    def _build(self, raw: dict):
+        kinds, index, options = {}, {}, []
+        for kind, info in raw.items():
+            kinds[kind] = info
+            names = [info.get("vi", ""), info.get("en", ""), kind] + info.get("variants", [])
+            for name in names + info.get("keywords", []):
+                folded = fold_text(name).strip()
+                if folded:
+                    index.setdefault(folded, kind)
+            options.append(info.get("vi") or kind)
+            options.extend(info.get("variants", []))
+        self._kinds, self._index, self._options = kinds, index, options
+
+    # ============ LOOKUP ============
+    def current_version(self) -> int:
+        """Version sau khi kiểm tra file (tăng mỗi lần reload) - để cache dữ liệu build từ taxonomy"""
+        self._refresh()
+        return self.version
+
+    def lookup(self, name: str) -> Optional[str]:
+        """Tên vi / en / keyword -> loại SP (ring, necklace, ...). Không phân biệt dấu"""
+        self._refresh()
+        return self._index.get(fold_text(name).strip())
+
+    def get(self, kind: str) -> Optional[dict]:
+        """Thông tin đầy đủ của 1 loại SP"""
+        self._refresh()
+        return self._kinds.get(kind)
+
+    def visual_style(self, kind: str) -> str:
+        """visual_style của loại SP (chuỗi rỗng nếu không có)"""
+        info = self.get(kind)
+        return info.get("visual_style", "") if info else ""
+
+    def product_options(self) -> List[str]:
+        """Danh sách loại SP cho selectbox trên UI (theo thứ tự trong file)"""
+        self._refresh()
+        return list(self._options)
+
+    def keyword_tables(self) -> Dict[str, List[str]]:
+        """{loại SP: [tên + keywords]} để compile KeywordClassifier"""
+        self._refresh()
+        return {
+            kind: [info.get("vi", ""), info.get("en", "")] + info.get("variants", []) + info.get("keywords", [])
+            for kind, info in self._kinds.items()
+        }
+
+
+_taxonomy = None
+_taxonomy_lock = threading.Lock()
+
+
+def get_taxonomy() -> Taxonomy:
+    """Taxonomy dùng chung trong process"""
+    global _taxonomy
+    with _taxonomy_lock:
+        if _taxonomy is None:
+            _taxonomy = Taxonomy()
+        return _taxonomy
@@ -0,0 +1,288 @@
+"""
+Telemetry
+Tracing + metrics nhẹ cho pipeline generate (không cần thư viện ngoài)
+
+- span("gemini.request", model=...) đo thời gian 1 stage, lồng nhau theo contextvars (trace / parent)
+- Token Gemini (usage_metadata) cộng dồn theo model
+- Route của ModelRouter (field x main / lite / local): số lần, lỗi, latency, token, chi phí ước tính
+- Export: Prometheus text (histogram theo stage + counter token) và JSON dạng OTLP (resourceSpans)
+- METRICS_PORT=9464 -> mở endpoint /metrics cho Prometheus scrape
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+SERVICE_NAME = "jewelry-viral-gen"
+MAX_SPANS = 1000  # số span gần nhất giữ lại để export
+WINDOW = 500  # số mẫu / stage để tính percentile
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class _Registry:
+    """Lưu span + số liệu tổng hợp, dùng chung cả process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = deque(maxlen=MAX_SPANS)
+        self.stages: Dict[str, Dict] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.routes: Dict[tuple, Dict] = {}
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {
+                    "count": 0, "errors": 0, "sum": 0.0,
+                    "buckets": [0] * len(BUCKETS), "window": deque(maxlen=WINDOW),
+                }
+            stage["count"] += 1
+            stage["errors"] += int(error)
+            stage["sum"] += seconds
+            stage["window"].append(seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stage["buckets"][i] += 1
+
+
+_registry = _Registry()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Đo 1 stage; attributes có thể bổ sung trong lúc chạy (VD token sau khi gọi API)
+
+    VD:
+        with span("gemini.request", model=name) as attrs:
+            ...
+            attrs["output_tokens"] = 123
+    """
+    parent = _current.get()
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time(),
+        "attributes": attributes,
+        "error": None,
+    }
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        record["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        record["duration"] = time.perf_counter() - started
+        record["end"] = record["start"] + record["duration"]
+        _registry.observe(name, record["duration"], record["error"] is not None)
+        with _registry.lock:
+            _registry.spans.append(record)
+
+
+def observe(name: str, seconds: float, error: bool = False):
+    """Ghi 1 số đo không gắn với span (VD time-to-first-token)"""
+    _registry.observe(name, seconds, error)
+
+
+def record_tokens(model: str, input_tokens: int, output_tokens: int):
+    """Cộng dồn token Gemini (usage_metadata) theo model"""
+    with _registry.lock:
+        totals = _registry.tokens.setdefault(model, {"calls": 0, "input": 0, "output": 0})
+        totals["calls"] += 1
+        totals["input"] += input_tokens or 0
+        totals["output"] += output_tokens or 0
+
+
+def record_route(field: str, route: str, latency: float, input_tokens: int = 0, output_tokens: int = 0,
+                 cost: float = 0.0, error: bool = False):
+    """Cộng dồn 1 lần chạy route của ModelRouter (latency cũng vào stage route.<field>.<route>)"""
+    _registry.observe(f"route.{field}.{route}", latency, error)
+    with _registry.lock:
+        totals = _registry.routes.setdefault((field, route), {
+            "calls": 0, "errors": 0, "latency": 0.0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+        })
+        totals["calls"] += 1
+        totals["errors"] += int(error)
+        totals["latency"] += latency
+        totals["input_tokens"] += input_tokens or 0
+        totals["output_tokens"] += output_tokens or 0
+        totals["cost"] += cost
+
+
+# ============ ĐỌC SỐ LIỆU ============
+def stage_stats() -> List[Dict]:
+    """Thống kê theo stage: count, errors, avg, p50, p95 (giây)"""
+    with _registry.lock:
+        items = [(name, dict(stage, window=sorted(stage["window"]))) for name, stage in _registry.stages.items()]
+
+    def percentile(samples: list, q: float) -> float:
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))] if samples else 0.0
+
+    return [
+        {
+            "stage": name,
+            "count": stage["count"],
+            "errors": stage["errors"],
+            "avg": stage["sum"] / stage["count"],
+            "p50": percentile(stage["window"], 0.5),
+            "p95": percentile(stage["window"], 0.95),
+        }
+        for name, stage in sorted(items)
+    ]
+
+
+def token_totals() -> Dict[str, Dict[str, int]]:
+    with _registry.lock:
+        return {model: dict(totals) for model, totals in _registry.tokens.items()}
+
+
+def route_totals() -> List[Dict]:
+    """Thống kê tích lũy theo (field, route), kèm latency trung bình"""
+    with _registry.lock:
+        items = [(key, dict(totals)) for key, totals in _registry.routes.items()]
+    return [
+        dict(totals, field=field, route=route, avg_latency=totals["latency"] / totals["calls"])
+        for (field, route), totals in sorted(items)
+    ]
+
+
+def recent_spans(limit: int = 50) -> List[Dict]:
+    """Các span gần nhất (mới nhất trước)"""
+    with _registry.lock:
+        return list(_registry.spans)[-limit:][::-1]
+
+
+# ============ EXPORT ============
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text() -> str:
+    """Số liệu dạng Prometheus text exposition format"""
+    lines = [
+        "# HELP jvg_stage_duration_seconds Thời gian từng stage của pipeline",
+        "# TYPE jvg_stage_duration_seconds histogram",
+    ]
+    with _registry.lock:
+        stages = {name: dict(stage, buckets=list(stage["buckets"])) for name, stage in _registry.stages.items()}
+        tokens = {model: dict(totals) for model, totals in _registry.tokens.items()}
+        routes = {key: dict(totals) for key, totals in _registry.routes.items()}
+
+    for name, stage in sorted(stages.items()):
+        label = f'stage="{_label(name)}"'
+        for bound, count in zip(BUCKETS, stage["buckets"]):
+            lines.append(f'jvg_stage_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'jvg_stage_duration_seconds_bucket{{{label},le="+Inf"}} {stage["count"]}')
+        lines.append(f"jvg_stage_duration_seconds_sum{{{label}}} {stage['sum']:.6f}")
+        lines.append(f"jvg_stage_duration_seconds_count{{{label}}} {stage['count']}")
+
+    lines += ["# HELP jvg_stage_errors_total Số lần stage lỗi", "# TYPE jvg_stage_errors_total counter"]
+    for name, stage in sorted(stages.items()):
+        lines.append(f'jvg_stage_errors_total{{stage="{_label(name)}"}} {stage["errors"]}')
+
+    lines += ["# HELP jvg_gemini_tokens_total Token Gemini theo model", "# TYPE jvg_gemini_tokens_total counter"]
+    for model, totals in sorted(tokens.items()):
+        for kind in ("input", "output"):
+            lines.append(f'jvg_gemini_tokens_total{{model="{_label(model)}",type="{kind}"}} {totals[kind]}')
+    lines += ["# HELP jvg_gemini_calls_total Số lần gọi Gemini theo model", "# TYPE jvg_gemini_calls_total counter"]
+    for model, totals in sorted(tokens.items()):
+        lines.append(f'jvg_gemini_calls_total{{model="{_label(model)}"}} {totals["calls"]}')
+
+    lines += ["# HELP jvg_route_calls_total Số lần chạy theo field / route", "# TYPE jvg_route_calls_total counter"]
+    for (field, route), totals in sorted(routes.items()):
+        lines.append(f'jvg_route_calls_total{{field="{_label(field)}",route="{_label(route)}"}} {totals["calls"]}')
+    lines += ["# HELP jvg_route_cost_usd_total Chi phí ước tính (USD) theo field / route",
+              "# TYPE jvg_route_cost_usd_total counter"]
+    for (field, route), totals in sorted(routes.items()):
+        lines.append(f'jvg_route_cost_usd_total{{field="{_label(field)}",route="{_label(route)}"}} {totals["cost"]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_json(limit: int = MAX_SPANS) -> Dict:
+    """Các span gần nhất theo cấu trúc OTLP/JSON (gửi được tới OTel collector /v1/traces)"""
+    spans = []
+    for record in reversed(recent_spans(limit)):
+        item = {
+            "traceId": record["trace_id"],
+            "spanId": record["span_id"],
+            "name": record["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(record["start"] * 1e9)),
+            "endTimeUnixNano": str(int(record["end"] * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in record["attributes"].items()],
+            "status": {"code": 2, "message": record["error"]} if record["error"] else {"code": 1},
+        }
+        if record["parent_id"]:
+            item["parentSpanId"] = record["parent_id"]
+        spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Mở endpoint /metrics (1 lần / process)
+
+    Args:
+        port: Cổng (None = đọc METRICS_PORT, không có thì không mở)
+    """
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"❌ Không mở được metrics server cổng {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,197 @@
+"""
+Thumbnail Cache
+Thumbnail WebP cho preview upload + lịch sử, tạo 1 lần cho mỗi nội dung ảnh
+
+- Key = hash nội dung ảnh + kích thước
+- Cache 2 tầng: RAM (LRU) + đĩa (outputs/thumbnails/)
+- Đĩa được dọn định kỳ trên thread nền: xóa file quá MAX_DISK_AGE_DAYS ngày không dùng,
+  rồi xóa file cũ nhất đến khi tổng dung lượng <= MAX_DISK_MB
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .image_processor import ImageProcessor
+
+THUMBNAIL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "outputs", "thumbnails"))
+
+
+class ThumbnailCache:
+    """LRU in-memory + cache trên đĩa cho thumbnail"""
+
+    MAX_ITEMS = 256
+    DEFAULT_SIZE = 256
+    MAX_DISK_MB = float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "200"))
+    MAX_DISK_AGE_DAYS = float(os.getenv("THUMBNAIL_CACHE_MAX_AGE_DAYS", "30"))
+    PRUNE_EVERY = 100  # dọn đĩa sau mỗi N lần ghi thumbnail mới
+
+    def __init__(self, cache_dir: str = THUMBNAIL_DIR, max_items: int = None):
+        self.cache_dir = cache_dir
+        self.max_items = max_items or self.MAX_ITEMS
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._aliases = {}  # VD: file_id của UploadedFile -> key (khỏi hash lại mỗi rerun)
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def key_for(image_data: bytes, size: int = DEFAULT_SIZE) -> str:
+        digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+        return f"{digest}_{size}"
+
+    def get(self, image_data: bytes, size: int = DEFAULT_SIZE, alias: str = None) -> Optional[bytes]:
+        """
+        Thumbnail của ảnh (tạo nếu chưa có)
+
+        Args:
+            image_data: Bytes ảnh gốc
+            size: Cạnh dài tối đa (px)
+            alias: ID ổn định của file (nếu có) để bỏ qua bước hash
+
+        Returns:
+            Bytes WebP, hoặc None nếu không đọc được ảnh
+        """
+        return self._get(image_data, size, alias)[1]
+
+    def get_key(self, image_data: bytes, size: int = DEFAULT_SIZE) -> Optional[str]:
+        """Key của thumbnail (tạo nếu chưa có) để lưu kèm lịch sử, None nếu không đọc được ảnh"""
+        key, thumbnail = self._get(image_data, size)
+        return key if thumbnail is not None else None
+
+    def get_by_key(self, key: str) -> Optional[bytes]:
+        """Thumbnail theo key (RAM -> đĩa), None nếu chưa có"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                thumbnail = f.read()
+        except OSError:
+            return None
+        self._remember(key, thumbnail)
+        self._touch(path)
+        return thumbnail
+
+    def prune_disk(self, max_mb: float = None, max_age_days: float = None) -> int:
+        """
+        Dọn thumbnail trên đĩa
+
+        Returns:
+            Số file đã xóa
+        """
+        max_bytes = (max_mb if max_mb is not None else self.MAX_DISK_MB) * 1024 * 1024
+        cutoff = time.time() - (max_age_days if max_age_days is not None else self.MAX_DISK_AGE_DAYS) * 86400
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".webp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()  # cũ nhất trước
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    # ============ INTERNAL ============
+    def _get(self, image_data: bytes, size: int, alias: str = None) -> Tuple[str, Optional[bytes]]:
+        with self._lock:
+            key = self._aliases.get((alias, size)) if alias else None
+        if key is None:
+            key = self.key_for(image_data, size)
+            if alias:
+                with self._lock:
+                    self._aliases[(alias, size)] = key
+
+        thumbnail = self.get_by_key(key)
+        if thumbnail is None:
+            thumbnail = ImageProcessor.make_thumbnail(image_data, size)
+            if thumbnail is None:
+                return key, None
+            self._remember(key, thumbnail)
+            self._write_disk(key, thumbnail)
+        return key, thumbnail
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.webp")
+
+    def _remember(self, key: str, thumbnail: bytes):
+        with self._lock:
+            self._memory[key] = thumbnail
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+            if len(self._aliases) > self.max_items * 4:
+                self._aliases.clear()
+
+    def _write_disk(self, key: str, thumbnail: bytes):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Lỗi ghi thumbnail: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.PRUNE_EVERY == 1  # lần ghi đầu tiên + mỗi PRUNE_EVERY lần
+        if due:
+            threading.Thread(target=self._prune_background, name="thumbnail-prune", daemon=True).start()
+
+    def _prune_background(self):
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            removed = self.prune_disk()
+            if removed:
+                print(f"🧹 Đã xóa {removed} thumbnail cũ")
+        except Exception as e:
+            print(f"❌ Lỗi dọn thumbnail: {e}")
+        finally:
+            self._prune_lock.release()
+
+    @staticmethod
+    def _touch(path: str):
+        """Cập nhật mtime khi đọc từ đĩa -> thumbnail còn dùng không bị dọn"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """ThumbnailCache dùng chung trong process"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
@@ -0,0 +1,29 @@
+from firebase.stream_mirror import apply_event
+
+
+def test_patch_applies_nested_paths():
+    root = {
+        "songs": [{"name": "a", "artist": "x"}, {"name": "b"}],
+        "last_updated": "2026-10-01",
+        "config": {"limit": 10},
+    }
+
+    new_root = apply_event(
+        root, "/", {"songs/0/name": "z", "songs/1": None, "last_updated": "2026-10-19"}, merge=True
+    )
+
+    assert new_root["songs"][0] == {"name": "z", "artist": "x"}
+    assert new_root["songs"][1] is None
+    assert new_root["last_updated"] == "2026-10-19"
+    assert "songs/0/name" not in new_root
+    # Nhánh không đổi dùng chung, cây cũ không bị sửa
+    assert new_root["config"] is root["config"]
+    assert root["songs"][0]["name"] == "a"
+
+
+def test_patch_relative_to_event_path():
+    root = {"templates": {"ring": {"hook": "old", "tone": "luxury"}}}
+
+    new_root = apply_event(root, "/templates", {"ring/hook": "new", "necklace/hook": "h"}, merge=True)
+
+    assert new_root == {"templates": {"ring": {"hook": "new", "tone": "luxury"}, "necklace": {"hook": "h"}}}
@@ -0,0 +1,85 @@
+"""
+Clipboard
+Nút copy chạy hoàn toàn trên trình duyệt: bấm không gửi gì về server, không rerun script
+
+- navigator.clipboard.writeText, fallback execCommand("copy") khi iframe không có quyền clipboard-write
+- Text nhúng sẵn vào HTML của nút (JSON-encoded)
+"""
+import html
+import json
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from .styles import get_copy_button_css
+
+BUTTON_HEIGHT = 48
+
+
+def _js_string(text: str) -> str:
+    """String literal JS an toàn khi đặt trong <script> (text là output AI - escape mọi "<")"""
+    return json.dumps(text, ensure_ascii=False).replace("<", "\\u003c")
+
+
+def _render_html(content: str, height: int):
+    # Streamlit mới: components.v1.html bị deprecate, thay bằng st.iframe (nhận HTML string)
+    if hasattr(st, "iframe"):
+        st.iframe(content, height=height)
+    else:
+        components.html(content, height=height)
+
+
+def copy_button(
+    text: str,
+    label: str = "📋 Copy",
+    done_label: str = "✅ Đã copy!",
+    primary: bool = False,
+    full_width: bool = False
+):
+    """
+    Render nút copy text vào clipboard phía client
+
+    Args:
+        text: Nội dung được copy
+        label: Nhãn nút
+        done_label: Nhãn hiện 1.5s sau khi copy thành công
+        primary: Kiểu nút chính (gradient)
+        full_width: Nút rộng hết cột
+    """
+    classes = " ".join(["copy-btn"] + (["primary"] if primary else []) + (["full"] if full_width else []))
+    _render_html(
+        f"""{get_copy_button_css()}
+<button id="copy" class="{classes}">{html.escape(label)}</button>
+<script>
+    const text = {_js_string(text)};
+    const label = {_js_string(label)};
+    const button = document.getElementById("copy");
+
+    function fallbackCopy() {{
+        const area = document.createElement("textarea");
+        area.value = text;
+        area.style.position = "fixed";
+        area.style.opacity = "0";
+        document.body.appendChild(area);
+        area.select();
+        let ok = false;
+        try {{ ok = document.execCommand("copy"); }} catch (e) {{}}
+        area.remove();
+        return ok;
+    }}
+
+    button.addEventListener("click", async () => {{
+        let ok = false;
+        try {{
+            await navigator.clipboard.writeText(text);
+            ok = true;
+        }} catch (e) {{
+            ok = fallbackCopy();
+        }}
+        button.textContent = ok ? {_js_string(done_label)} : "❌ Không copy được";
+        setTimeout(() => {{ button.textContent = label; }}, 1500);
+    }});
+</script>
+""",
+        BUTTON_HEIGHT,
+    )
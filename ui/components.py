@@ -5,14 +5,21 @@ UI Components cho Streamlit - Version 2.0
 - Thêm custom prompt
 - Output tiếng Việt cho thị trường VN
 """
+import os
 import streamlit as st
 from typing import Dict, Optional
+from services.taxonomy import get_taxonomy
+from services.thumbnail_cache import get_thumbnail_cache
+from .clipboard import copy_button
 
 
-def render_upload_section():
+def render_upload_section(uploader_key: str = "uploader"):
     """
     Render phần upload ảnh và nhập thông tin sản phẩm
     
+    Args:
+        uploader_key: Key của file_uploader (đổi key = xóa file đã upload khỏi session)
+    
     Returns:
         Tuple (uploaded_files, product_type, style, notes, custom_prompt)
     """
@@ -24,6 +31,7 @@ def render_upload_section():
         "Chọn ảnh sản phẩm (nhiều góc = 1 sản phẩm)",
         type=["jpg", "jpeg", "png", "webp", "gif", "bmp", "tiff"],
         accept_multiple_files=True,
+        key=uploader_key,
         help="Upload nhiều ảnh từ nhiều góc khác nhau của CÙNG 1 sản phẩm. AI sẽ phân tích tất cả."
     )
     
@@ -33,7 +41,8 @@ def render_upload_section():
         cols = st.columns(num_cols)
         for idx, file in enumerate(uploaded_files[:4]):
             with cols[idx % num_cols]:
-                st.image(file, caption=f"Ảnh {idx+1}", use_container_width=True)
+                thumbnail = get_thumbnail_cache().get(file.getvalue(), alias=file.file_id)
+                st.image(thumbnail or file, caption=f"Ảnh {idx+1}", use_container_width=True)
         if len(uploaded_files) > 4:
             st.caption(f"... và {len(uploaded_files) - 4} ảnh khác")
     
@@ -44,18 +53,7 @@ def render_upload_section():
     with col1:
         product_type = st.selectbox(
             "Loại sản phẩm",
-            options=[
-                "Nhẫn",
-                "Nhẫn kim cương",
-                "Dây chuyền",
-                "Vòng tay",
-                "Bông tai",
-                "Đồng hồ",
-                "Lắc chân",
-                "Charm / Mặt dây",
-                "Set trang sức",
-                "Phụ kiện khác"
-            ],
+            options=get_taxonomy().product_options(),
             index=0
         )
     
@@ -104,12 +102,21 @@ def render_upload_section():
 
 def render_result_display(result: Optional[Dict], image_index: int = 0):
     """
-    Render phần hiển thị kết quả với nút copy
+    Render phần hiển thị kết quả với nút copy (copy phía trình duyệt, không rerun)
     """
     if not result:
         st.info("👆 Upload ảnh và nhấn Generate để bắt đầu")
         return
     
+    # Ảnh bị bỏ vì vượt ngân sách token -> kết quả chỉ dựa trên phần ảnh còn lại
+    over_budget = (result.get("_metadata") or {}).get("over_budget_images")
+    if over_budget:
+        dropped = ", ".join(f"#{i + 1}" for i in over_budget)
+        st.warning(
+            f"⚠️ Đã bỏ {len(over_budget)} ảnh vượt ngân sách token ảnh ({dropped}) - "
+            "nội dung chỉ được tạo từ các ảnh còn lại"
+        )
+    
     # ===== VEO3 PROMPT =====
     st.subheader("🎬 Visual Prompt cho Veo3")
     visual_prompt = result.get("visual_prompt", "")
@@ -121,9 +128,7 @@ def render_result_display(result: Optional[Dict], image_index: int = 0):
         key=f"vp_{image_index}"
     )
     
-    if st.button("📋 Copy Visual Prompt", key=f"copy_visual_{image_index}", use_container_width=True):
-        st.session_state["clipboard"] = visual_prompt
-        st.toast("✅ Đã copy Visual Prompt!")
+    copy_button(visual_prompt, "📋 Copy Visual Prompt", "✅ Đã copy Visual Prompt!", full_width=True)
     
     st.divider()
     
@@ -139,9 +144,7 @@ def render_result_display(result: Optional[Dict], image_index: int = 0):
     with col2:
         st.text_input("Hook", value=hook, key=f"hook_{image_index}", disabled=True)
     
-    if st.button("📋 Copy Title + Hook", key=f"copy_title_{image_index}"):
-        st.session_state["clipboard"] = f"{title}\n\n{hook}"
-        st.toast("✅ Đã copy!")
+    copy_button(f"{title}\n\n{hook}", "📋 Copy Title + Hook")
     
     st.divider()
     
@@ -151,15 +154,13 @@ def render_result_display(result: Optional[Dict], image_index: int = 0):
     hashtags_text = " ".join(hashtags)
     st.code(hashtags_text, language=None)
     
-    if st.button("📋 Copy Hashtags", key=f"copy_hashtags_{image_index}"):
-        st.session_state["clipboard"] = hashtags_text
-        st.toast("✅ Đã copy Hashtags!")
+    copy_button(hashtags_text, "📋 Copy Hashtags", "✅ Đã copy Hashtags!")
     
     st.divider()
     
     # ===== MUSIC =====
     st.subheader("🎵 Nhạc Đề Xuất")
-    music = result.get("music", {})
+    music = result.get("music") or {}
     
     st.success(f"🎵 **{music.get('name', 'N/A')}**")
     st.caption(f"💡 {music.get('reason', 'Phù hợp với phong cách sản phẩm')}")
@@ -171,15 +172,12 @@ def render_result_display(result: Optional[Dict], image_index: int = 0):
     caption = result.get("caption", "")
     st.text_area("Caption", value=caption, height=100, disabled=True, label_visibility="collapsed", key=f"cap_{image_index}")
     
-    if st.button("📋 Copy Caption", key=f"copy_caption_{image_index}"):
-        st.session_state["clipboard"] = caption
-        st.toast("✅ Đã copy Caption!")
+    copy_button(caption, "📋 Copy Caption", "✅ Đã copy Caption!")
     
     st.divider()
     
     # ===== COPY ALL =====
-    if st.button("📦 COPY TẤT CẢ", type="primary", use_container_width=True, key=f"copy_all_{image_index}"):
-        full_content = f"""🎬 VEO3 PROMPT:
+    full_content = f"""🎬 VEO3 PROMPT:
 {visual_prompt}
 
 📝 TITLE: {title}
@@ -193,30 +191,42 @@ def render_result_display(result: Optional[Dict], image_index: int = 0):
 📋 CAPTION:
 {caption}
 """
-        st.session_state["clipboard"] = full_content
-        st.toast("✅ Đã copy tất cả nội dung!")
-        
-        with st.expander("📄 Xem nội dung đã copy"):
-            st.code(full_content, language=None)
+    copy_button(full_content, "📦 COPY TẤT CẢ", "✅ Đã copy tất cả nội dung!", primary=True, full_width=True)
+    
+    with st.expander("📄 Xem nội dung sẽ copy"):
+        st.code(full_content, language=None)
 
 
-def render_history_sidebar(history: list):
+def render_history_sidebar(history: list, load_output=None):
     """
     Render sidebar với lịch sử generate
+    
+    Args:
+        history: List lịch sử (cũ -> mới); item có thể chỉ là bản tóm tắt (không có output)
+        load_output: Hàm (item) -> output, dùng để tải output đầy đủ khi bấm Load
+    
+    Gọi bên trong `with st.sidebar` (dùng được trong st.fragment - fragment không ghi thẳng vào st.sidebar)
     """
-    st.sidebar.subheader("📜 Lịch Sử Gần Đây")
+    st.subheader("📜 Lịch Sử Gần Đây")
     
     if not history:
-        st.sidebar.info("Chưa có lịch sử")
+        st.info("Chưa có lịch sử")
         return
     
-    for i, item in enumerate(reversed(history[:5])):
-        with st.sidebar.expander(f"#{i+1}: {item.get('product_type', 'Unknown')[:20]}"):
+    for i, item in enumerate(reversed(history[-5:])):
+        with st.expander(f"#{i+1}: {item.get('product_type', 'Unknown')[:20]}"):
+            thumbnail = get_thumbnail_cache().get_by_key(item["thumbnail"]) if item.get("thumbnail") else None
+            if thumbnail:
+                st.image(thumbnail, width=96)
             st.write(f"⏰ {item.get('timestamp', 'Vừa xong')[:10] if item.get('timestamp') else 'Vừa xong'}")
-            output = item.get('output', {})
-            st.write(f"🎵 {output.get('music', {}).get('name', 'N/A')}")
+            output = item.get('output') or {}
+            music_name = item.get('music') or (output.get('music') or {}).get('name', 'N/A')
+            st.write(f"🎵 {music_name}")
             if st.button(f"Load #{i+1}", key=f"load_{i}"):
+                if not output and load_output:
+                    output = load_output(item)
                 st.session_state["result"] = output
+                st.rerun()  # kết quả nằm ngoài fragment -> rerun cả app
 
 
 def render_music_status(music_data: dict):
@@ -232,3 +242,113 @@ def render_music_status(music_data: dict):
     
     st.sidebar.success(f"🎵 {songs_count} bài hát trending")
     st.sidebar.caption(f"Cập nhật: {last_updated[:10] if len(last_updated) > 10 else last_updated}")
+
+
+def render_stats_panel():
+    """Panel thống kê latency theo stage + token Gemini (số liệu của process hiện tại)"""
+    from services import telemetry
+    
+    stats = telemetry.stage_stats()
+    if not stats:
+        st.caption("Chưa có số liệu - generate 1 sản phẩm để xem")
+        return
+    
+    st.dataframe(
+        [
+            {
+                "Stage": s["stage"],
+                "Lần": s["count"],
+                "Lỗi": s["errors"],
+                "p50 (s)": round(s["p50"], 2),
+                "p95 (s)": round(s["p95"], 2),
+            }
+            for s in stats
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    for model, totals in telemetry.token_totals().items():
+        st.caption(f"🧮 {model}: {totals['calls']} lần gọi | {totals['input']:,} token vào | {totals['output']:,} token ra")
+    
+    routes = telemetry.route_totals()
+    if routes:
+        st.dataframe(
+            [
+                {
+                    "Field": r["field"],
+                    "Route": r["route"],
+                    "Lần": r["calls"],
+                    "Lỗi": r["errors"],
+                    "TB (s)": round(r["avg_latency"], 2),
+                    "Chi phí ($)": round(r["cost"], 4),
+                }
+                for r in routes
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Prometheus", telemetry.prometheus_text(), file_name="metrics.txt", use_container_width=True)
+    with col2:
+        import json
+        st.download_button(
+            "OTLP JSON",
+            json.dumps(telemetry.otlp_json(), ensure_ascii=False),
+            file_name="traces.json",
+            use_container_width=True
+        )
+
+
+def render_profile_panel(last_report: Optional[Dict] = None):
+    """
+    Checkbox bật profiling cho lần generate tiếp theo + tóm tắt hotspot của profile đã lưu
+    
+    Args:
+        last_report: Profile của lần generate gần nhất trong session (None = chọn từ outputs/profiles/)
+    """
+    from services import profiler
+    
+    # Cờ profile_next bị lấy ra (pop) khi submit -> bỏ tick checkbox trước khi render lại
+    if not st.session_state.get("profile_next"):
+        st.session_state["profile_generation"] = False
+    st.checkbox(
+        "Profile lần generate tiếp theo",
+        key="profile_generation",
+        on_change=lambda: st.session_state.update(profile_next=st.session_state["profile_generation"]),
+        help="cProfile + tracemalloc cho cả job (chậm hơn bình thường); PROFILE_GENERATION=1 để bật luôn"
+    )
+    
+    files = profiler.recent_profiles()
+    if last_report and last_report.get("file") in files:
+        files.remove(last_report["file"])
+    options = ([last_report["file"]] if last_report and last_report.get("file") else []) + files
+    if not options:
+        st.caption("Chưa có profile nào")
+        return
+    
+    path = st.selectbox("Profile", options, format_func=lambda p: os.path.basename(p)[:-len(".prof")])
+    report = last_report if last_report and path == last_report.get("file") else profiler.load_report(path)
+    if not report:
+        st.caption("Không đọc được tóm tắt của profile này")
+        return
+    
+    st.caption(f"⏱️ {report['duration']}s | 🧠 peak {report['peak_memory_mb']} MB (cả process)")
+    if report.get("concurrent_tasks"):
+        st.warning(
+            f"⚠️ {report['concurrent_tasks']} job khác chạy cùng lúc - peak / cấp phát bộ nhớ "
+            "gồm cả bộ nhớ của các job đó"
+        )
+    tab_self, tab_cum, tab_mem = st.tabs(["Tự thân", "Tích lũy", "Bộ nhớ"])
+    with tab_self:
+        st.dataframe(report.get("hotspots", []), hide_index=True, use_container_width=True)
+    with tab_cum:
+        st.dataframe(report.get("cumulative", []), hide_index=True, use_container_width=True)
+    with tab_mem:
+        st.dataframe(report.get("allocations", []), hide_index=True, use_container_width=True)
+    
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            st.download_button("📥 File .prof", f.read(), file_name=os.path.basename(path), use_container_width=True)
@@ -174,3 +174,41 @@ def get_loading_animation() -> str:
     }
 </style>
 """
+
+
+def get_copy_button_css() -> str:
+    """CSS cho nút copy client-side (chạy trong iframe riêng, không nhận CSS của app)"""
+    return """
+<style>
+    body {
+        margin: 0;
+        padding: 2px 0;
+        font-family: "Source Sans Pro", sans-serif;
+    }
+    
+    .copy-btn {
+        background-color: #4ECDC4;
+        color: white;
+        border: none;
+        padding: 0.5rem 1rem;
+        border-radius: 20px;
+        font-size: 0.95rem;
+        font-weight: 600;
+        cursor: pointer;
+        transition: all 0.3s ease;
+    }
+    
+    .copy-btn:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+    }
+    
+    .copy-btn.primary {
+        background: linear-gradient(135deg, #FF6B6B 0%, #FF8E53 100%);
+    }
+    
+    .copy-btn.full {
+        width: 100%;
+    }
+</style>
+"""